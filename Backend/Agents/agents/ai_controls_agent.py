@@ -2,8 +2,8 @@
 from __future__ import annotations
 from fastapi import APIRouter, HTTPException
 from typing import List
-from agents.shared.excel_io import read_ai_controls
-from agents.shared.types import ControlsIn, ControlOutItem, ControlsResponse
+from agents.excel_io import read_ai_controls, ai_risk_control_links
+from agents.types import ControlsIn, ControlOutItem, ControlsResponse
 
 router = APIRouter(prefix="/agent/ai", tags=["AI Agents"])
 
@@ -20,10 +20,10 @@ def ai_controls(payload: ControlsIn):
             raise HTTPException(500, f"AI controls sheet is missing '{c}' column")
 
     rids = [r for r in (payload.risk_ids or []) if r]
-    idx  = 0
+    related_by_row = ai_risk_control_links().related_risks(rids) if rids else {}
 
     out: List[ControlOutItem] = []
-    for j, r in df.iterrows():
+    for pos, (j, r) in enumerate(df.iterrows()):
         code = (r.get("code") or "").strip()
         if not code:
             continue
@@ -31,11 +31,7 @@ def ai_controls(payload: ControlsIn):
         control = (r.get("control") or "").strip()
         reqs    = (r.get("requirements") or "").strip()
 
-        if rids:
-            related = [rids[idx % len(rids)]]
-            idx += 1
-        else:
-            related = [payload.risk_assessment_id]
+        related = related_by_row.get(pos) or [payload.risk_assessment_id]  # no linked risk id
 
         out.append(ControlOutItem(
             control_id=f"CTRL-{payload.risk_assessment_id}-{j+1:03d}",
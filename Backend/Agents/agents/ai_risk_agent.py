@@ -2,8 +2,8 @@
 from __future__ import annotations
 from fastapi import APIRouter, HTTPException
 from typing import List
-from agents.shared.excel_io import read_ai_risks
-from agents.shared.types import RiskIn, RiskOutItem, RiskResponse
+from agents.excel_io import read_ai_risks
+from agents.types import RiskIn, RiskOutItem, RiskResponse
 
 router = APIRouter(prefix="/agent/ai", tags=["AI Agents"])
 
@@ -223,12 +223,12 @@ async def query(request: QueryRequest):
     
     docs = []
     if use_rag:
-        docs = retriever.invoke(request.question)
+        docs = await retriever.ainvoke(request.question)
 
     if not docs and use_rag:
         if use_general:
             msgs = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": request.question}]
-            res = llm.invoke(msgs)
+            res = await llm.ainvoke(msgs)
             # CORRECTED: Added contexts=[]
             return QueryResponse(answer=res.content, sources=[], contexts=[]) 
         else:
@@ -240,17 +240,17 @@ async def query(request: QueryRequest):
     
     if request.mode == "general":
         msgs = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": request.question}]
-        res = llm.invoke(msgs)
+        res = await llm.ainvoke(msgs)
         # CORRECTED: Added contexts=[]
         return QueryResponse(answer=res.content, sources=[], contexts=[])
 
     msgs = RAG_PROMPT.format_messages(history="", context=context, question=request.question)
-    res = llm.invoke(msgs)
+    res = await llm.ainvoke(msgs)
     answer = res.content
     
     if _looks_unhelpful(answer) and use_general:
         msgs = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": request.question}]
-        res = llm.invoke(msgs)
+        res = await llm.ainvoke(msgs)
         # CORRECTED: Added contexts=[]
         return QueryResponse(answer=res.content, sources=[], contexts=[])
     
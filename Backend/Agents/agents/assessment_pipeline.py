@@ -0,0 +1,256 @@
+# agents/assessment_pipeline.py
+"""
+The LLM risk/control assessment shared by risk_matrix_agent and risk_control_agent.
+
+Both routers run the same pipeline: prefiltered risk prompt, parse, control
+mapping (one prompt or the per-risk fan-out), parse, with the LLM answers
+cached in ``llm_cache`` and an NDJSON streaming variant. They differ only in
+their "table" mode prompts, how a request's ``controls_path`` is resolved and
+loaded, and whether the "Related Risk" column of a "table" mode control answer
+holds risk names that have to be mapped to risk IDs; an ``AssessmentPipeline``
+holds those. ``payload`` is the router's ``RiskControlIn``.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+from .assessment_stream import NDJSON_MEDIA_TYPE, AssessmentStream, ndjson_events, replay
+from .catalog import CatalogEntry, load_catalog
+from .control_fanout import CONTROL_MAPPING_GROUP_SIZE, GenerateControls, map_controls_per_risk, merge_tables
+from .excel_io import PREDEFINED_CONTROLS_XLSX, PREDEFINED_RISKS_XLSX
+from .id_output import (control_columns, generate_control_ids, generate_risk_ids, hydrate_controls, hydrate_risk_rows,
+                        render_control_matrix, render_risk_matrix)
+from .llm import OPENAI_MODEL
+from .llm_cache import file_version, llm_cache, make_key, normalize_text, template_hash
+from .markdown_table import Cells, parse_control_table, risk_rows, table_rows
+from .prefilter import (PROMPT_CONTROL_TOP_K, PROMPT_RISK_TOP_K, Prefiltered, audit_recall, prefilter_controls,
+                        prefilter_risks)
+from .prompt_cache import frame_markdown, prompt_fingerprint, track_prompts
+from .structured_output import (generate_control_json, generate_risk_json, merge_control_json, parse_control_json,
+                                parse_risk_json)
+
+logger = logging.getLogger("uvicorn")
+
+Row = Dict[str, Any]
+GenerateRisks = Callable[..., Awaitable[str]]
+
+# Markdown answers of the per-risk fan-out are merged as tables, JSON ones as JSON
+CONTROL_MERGERS = {"table": merge_tables, "ids": merge_tables, "json": merge_control_json}
+
+
+@dataclass
+class Assessment:
+    risk_assessment_id: str
+    risks: List[Row]
+    controls: List[Row]
+    risk_matrix: str
+    control_matrix: str
+    prompt_fingerprint: Optional[str]
+
+
+@dataclass(frozen=True)
+class AssessmentPipeline:
+    cache_namespace: str
+    generate_risk_matrix: GenerateRisks         # "table" mode prompts
+    generate_control_matrix: GenerateControls
+    load_controls: Callable[[str], Optional[pd.DataFrame]]
+    controls_file: Callable[[str], Path]        # the file a controls_path refers to
+    related_risk_names: bool = False
+
+    @property
+    def risk_generators(self) -> Dict[str, GenerateRisks]:
+        return {"table": self.generate_risk_matrix, "ids": generate_risk_ids, "json": generate_risk_json}
+
+    @property
+    def control_generators(self) -> Dict[str, GenerateControls]:
+        return {"table": self.generate_control_matrix, "ids": generate_control_ids, "json": generate_control_json}
+
+    # ---------- LLM output cache ----------
+    def cache_key(self, summary: str, output_mode: str, control_mapping: str, controls_path: str) -> str:
+        """Everything that decides the two LLM answers, minus the session."""
+        return make_key(
+            normalize_text(summary), output_mode, OPENAI_MODEL,
+            template_hash(*self.risk_generators.values(), *self.control_generators.values()),
+            file_version(PREDEFINED_RISKS_XLSX), file_version(PREDEFINED_CONTROLS_XLSX),
+            file_version(self.controls_file(controls_path)),
+            PROMPT_RISK_TOP_K, PROMPT_CONTROL_TOP_K,
+            control_mapping, CONTROL_MAPPING_GROUP_SIZE if control_mapping == "per_risk" else None,
+        )
+
+    # ---------- Parsing ----------
+    @staticmethod
+    def risks_from_rows(rows: List[Cells], risk_assessment_id: str, output_mode: str) -> List[Row]:
+        """Risks for the markdown table rows of a "table" or "ids" mode risk completion."""
+        return hydrate_risk_rows(rows, risk_assessment_id) if output_mode == "ids" else risk_rows(rows, risk_assessment_id)
+
+    @staticmethod
+    def risk_matrix(risk_raw: str, risks: List[Row], output_mode: str) -> str:
+        return risk_raw if output_mode == "table" else render_risk_matrix(risks)
+
+    def parse_risks(self, risk_raw: str, risk_assessment_id: str, output_mode: str) -> Tuple[List[Row], str]:
+        """Parsed risks and the risk matrix for a risk completion of any output mode."""
+        if output_mode == "json":
+            risks = parse_risk_json(risk_raw, risk_assessment_id)
+        else:
+            risks = self.risks_from_rows(table_rows(risk_raw), risk_assessment_id, output_mode)
+        return risks, self.risk_matrix(risk_raw, risks, output_mode)
+
+    def parse_controls(self, control_raw: str, controls_df: pd.DataFrame, risks: List[Row],
+                       risk_assessment_id: str, output_mode: str) -> Tuple[List[Row], str]:
+        """Parsed controls and the control matrix for a control completion of any output mode."""
+        # "ids" / "json": related_risk already comes back as a risk ID
+        if output_mode == "ids":
+            return hydrate_controls(control_raw, controls_df, [r['risk_id'] for r in risks], risk_assessment_id)
+        if output_mode == "json":
+            controls = parse_control_json(control_raw, [r['risk_id'] for r in risks], risk_assessment_id)
+            return controls, render_control_matrix(controls)
+        controls = parse_control_table(control_raw, risk_assessment_id)
+        if self.related_risk_names:
+            # Replace the 'related_risk' name from the LLM with the corresponding risk_id.
+            risk_name_to_id_map = {risk['risk_name']: risk['risk_id'] for risk in risks}
+            for control in controls:
+                risk_name = control.get('related_risk', '')
+                control['related_risk'] = risk_name_to_id_map.get(risk_name, f"UNMAPPED: {risk_name}")
+        return controls, control_raw
+
+    @staticmethod
+    def control_mode(output_mode: str, controls_df: pd.DataFrame) -> str:
+        """Output mode of the control prompt: "ids" needs a controls sheet of a known layout to hydrate from."""
+        if output_mode == "ids" and control_columns(controls_df) is None:
+            logger.warning("Controls sheet has no known code/section/control/requirements columns; "
+                           "mapping controls in table mode.")
+            return "table"
+        return output_mode
+
+    def _controls(self, controls_path: str) -> Tuple[pd.DataFrame, Optional[CatalogEntry]]:
+        """The controls sheet, and its normalized catalog entry (None for the built-in defaults)."""
+        controls_df = self.load_controls(controls_path)
+        if controls_df is None:
+            raise HTTPException(500, "Failed to load controls")
+        path = self.controls_file(controls_path)
+        try:
+            return controls_df, load_catalog(path, 0) if os.path.exists(path) else None
+        except Exception:
+            return controls_df, None  # unreadable: load_controls already fell back to the defaults
+
+    # ---------- Prefilter coverage (every call) and recall (sampled, opt-in) ----------
+    def _audit_risks(self, candidates: Prefiltered, risks: List[Row], summary: str, risk_assessment_id: str,
+                     output_mode: str) -> None:
+        candidates.log_coverage(r['risk_id'] for r in risks)
+
+        async def reference() -> List[str]:
+            raw = await self.risk_generators[output_mode](summary, prefilter_risks(summary, 0).markdown)
+            return [r['risk_id'] for r in self.parse_risks(raw, risk_assessment_id, output_mode)[0]]
+        audit_recall(candidates, reference)
+
+    def _audit_controls(self, candidates: Prefiltered, controls: List[Row], controls_df: pd.DataFrame,
+                        risks: List[Row], risk_assessment_id: str, output_mode: str) -> None:
+        candidates.log_coverage(c['code'] for c in controls)
+
+        async def reference() -> List[str]:
+            risk_matrix = render_risk_matrix(risks)
+            library = frame_markdown(controls_df, candidates.catalog)
+            raw = await self.control_generators[output_mode](risk_matrix, library)
+            picked, _ = self.parse_controls(raw, controls_df, risks, risk_assessment_id, output_mode)
+            return [c['code'] for c in picked]
+        audit_recall(candidates, reference)
+
+    # ---------- Assessment ----------
+    async def assess(self, payload: Any) -> Assessment:
+        """Risks and controls for ``payload``, reusing the LLM output of an identical earlier assessment."""
+        summary = payload.summary.strip()
+        risk_assessment_id = f"RC-{payload.session_id[:8].upper()}"
+        output_mode = payload.output_mode
+        cache_key = self.cache_key(summary, output_mode, payload.control_mapping, payload.controls_path)
+        cached = llm_cache.get(self.cache_namespace, cache_key)
+        fingerprints = track_prompts()
+        if cached:
+            logger.info("Reusing cached LLM output for this assessment.")
+            risk_raw = cached["risk"]
+        else:
+            logger.info("Generating risk matrix...")
+            risk_candidates = prefilter_risks(summary)
+            risk_raw = await self.risk_generators[output_mode](summary, risk_candidates.markdown)
+        risks, risk_matrix = self.parse_risks(risk_raw, risk_assessment_id, output_mode)
+        logger.info(f"Identified {len(risks)} risks from summary.")
+        if not cached:
+            self._audit_risks(risk_candidates, risks, summary, risk_assessment_id, output_mode)
+
+        controls_df, controls_catalog = self._controls(payload.controls_path)
+        control_mode = self.control_mode(output_mode, controls_df)
+        if cached:
+            control_raw = cached["control"]
+        else:
+            logger.info("Generating control matrix...")
+            generate = self.control_generators[control_mode]
+            if payload.control_mapping == "per_risk" and risks:
+                control_raw, control_candidates = await map_controls_per_risk(
+                    risks, controls_df, generate, merge=CONTROL_MERGERS[control_mode], catalog=controls_catalog)
+            else:
+                control_candidates = prefilter_controls(controls_df, risk_matrix, [r['risk_id'] for r in risks],
+                                                        catalog=controls_catalog)
+                control_raw = await generate(risk_matrix, control_candidates.markdown)
+        controls, control_matrix = self.parse_controls(control_raw, controls_df, risks, risk_assessment_id, control_mode)
+        fingerprint = cached.get("prompt_fingerprint") if cached else prompt_fingerprint(fingerprints)
+        if not cached:
+            if risks:
+                self._audit_controls(control_candidates, controls, controls_df, risks, risk_assessment_id,
+                                     control_mode)
+                llm_cache.put(self.cache_namespace, cache_key,
+                              {"risk": risk_raw, "control": control_raw, "prompt_fingerprint": fingerprint})
+        return Assessment(risk_assessment_id, risks, controls, risk_matrix, control_matrix, fingerprint)
+
+    def stream(self, payload: Any) -> StreamingResponse:
+        """
+        The assessment of ``assess`` as NDJSON events: control mapping for each risk starts as soon as
+        its row of the risk matrix is complete (see agents/assessment_stream.py).
+        """
+        summary = payload.summary.strip()
+        risk_assessment_id = f"RC-{payload.session_id[:8].upper()}"
+        output_mode = payload.output_mode
+        controls_df, controls_catalog = self._controls(payload.controls_path)
+        control_mode = self.control_mode(output_mode, controls_df)
+        parse_controls = lambda raw, risks: self.parse_controls(raw, controls_df, risks, risk_assessment_id, control_mode)
+
+        cache_key = self.cache_key(summary, output_mode, "stream", payload.controls_path)
+        cached = llm_cache.get(self.cache_namespace, cache_key)
+        if cached:
+            logger.info("Reusing cached LLM output for this assessment.")
+            risks, risk_matrix = self.parse_risks(cached["risk"], risk_assessment_id, output_mode)
+            controls, control_matrix = parse_controls(cached["control"], risks)
+            events = replay(risk_assessment_id, risks, controls, risk_matrix, control_matrix,
+                            cached.get("prompt_fingerprint"))
+            return StreamingResponse(ndjson_events(events), media_type=NDJSON_MEDIA_TYPE)
+
+        risk_candidates = prefilter_risks(summary)
+        generate = self.risk_generators[output_mode]
+        stream = AssessmentStream(
+            risk_assessment_id, controls_df,
+            lambda on_delta: generate(summary, risk_candidates.markdown, on_delta=on_delta),
+            lambda rows: self.risks_from_rows(rows, risk_assessment_id, output_mode),
+            lambda raw, risks: self.risk_matrix(raw, risks, output_mode),
+            # JSON completions are parsed once complete instead of row by row
+            (lambda raw: parse_risk_json(raw, risk_assessment_id)) if output_mode == "json" else None,
+            self.control_generators[control_mode], CONTROL_MERGERS[control_mode], parse_controls,
+            controls_catalog=controls_catalog,
+        )
+
+        def on_complete() -> None:
+            self._audit_risks(risk_candidates, stream.risks, summary, risk_assessment_id, output_mode)
+            if stream.control_candidates is not None:
+                self._audit_controls(stream.control_candidates, stream.controls, controls_df, stream.risks,
+                                     risk_assessment_id, control_mode)
+            if stream.risks:
+                llm_cache.put(self.cache_namespace, cache_key, {"risk": stream.risk_raw, "control": stream.control_raw,
+                                                                "prompt_fingerprint": stream.prompt_fingerprint})
+            logger.info(f"Streamed assessment complete: {len(stream.risks)} risks and {len(stream.controls)} controls.")
+
+        return StreamingResponse(ndjson_events(stream.events(), on_complete), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,199 @@
+# agents/assessment_stream.py
+"""
+Streaming risk/control assessment.
+
+The risk matrix completion is streamed through ``MarkdownTableParser``; every
+table row becomes a risk as soon as its line is complete, and the control
+mapping for that risk is dispatched right away (one prompt per risk, at most
+CONTROL_MAPPING_CONCURRENCY at a time) while the model is still writing the
+next risks.
+
+Results are sent to the caller as NDJSON events:
+
+    {"event": "risk", "data": {...RiskOut}}
+    {"event": "control", "data": {...ControlOut}}
+    {"event": "done", "data": {"risk_assessment_id", "risk_matrix", "control_matrix", "prompt_fingerprint", ...}}
+    {"event": "error", "data": {"detail": "..."}}
+
+With ``risks_from_text`` (JSON output) the risks are parsed once the
+completion is done instead of row by row. Risks are emitted in the order the
+model writes them and controls in risk order, numbered as in the merged control table, so the events always add up
+to the same result as the ``done`` summary.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import orjson
+import pandas as pd
+from fastapi import HTTPException
+
+from .catalog import CatalogEntry
+from .control_fanout import CONTROL_MAPPING_CONCURRENCY, GenerateControls, MergeControls, map_risk_group
+from .markdown_table import Cells, MarkdownTableParser
+from .prefilter import Prefiltered, merge_prefiltered
+from .prompt_cache import prompt_fingerprint, track_prompts
+
+logger = logging.getLogger("uvicorn")
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+Row = Dict[str, Any]
+GenerateRisks = Callable[[Optional[Callable[[str], None]]], Awaitable[str]]
+RisksFromRows = Callable[[List[Cells]], List[Row]]
+RenderRisks = Callable[[str, List[Row]], str]
+RisksFromText = Callable[[str], List[Row]]
+ParseControls = Callable[[str, List[Row]], Tuple[List[Row], str]]
+
+
+def ndjson(event: str, data: Any) -> bytes:
+    return orjson.dumps({"event": event, "data": data}) + b"\n"
+
+
+class AssessmentStream:
+    """
+    One streamed assessment. ``events()`` yields the event dicts; afterwards ``risk_raw`` /
+    ``control_raw`` hold the LLM output in the same form as the non-streaming endpoint caches it.
+    """
+
+    def __init__(self, risk_assessment_id: str, controls_df: pd.DataFrame,
+                 generate_risks: GenerateRisks, risks_from_rows: RisksFromRows, render_risks: RenderRisks,
+                 risks_from_text: Optional[RisksFromText],
+                 generate_controls: GenerateControls, merge_controls: MergeControls, parse_controls: ParseControls,
+                 concurrency: int = CONTROL_MAPPING_CONCURRENCY, controls_catalog: Optional[CatalogEntry] = None) -> None:
+        self.risk_assessment_id = risk_assessment_id
+        self.controls_df = controls_df
+        self.generate_risks = generate_risks
+        self.risks_from_rows = risks_from_rows
+        self.render_risks = render_risks
+        self.risks_from_text = risks_from_text
+        self.generate_controls = generate_controls
+        self.merge_controls = merge_controls
+        self.parse_controls = parse_controls
+        self.concurrency = concurrency
+        self.controls_catalog = controls_catalog
+        self.risks: List[Row] = []
+        self.controls: List[Row] = []
+        self.risk_raw = ""
+        self.control_raw = ""
+        self.control_candidates: Optional[Prefiltered] = None
+        self.prompt_fingerprint: Optional[str] = None
+
+    async def events(self) -> AsyncIterator[Dict[str, Any]]:
+        fingerprints = track_prompts()
+        queue: asyncio.Queue = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks: List[asyncio.Task] = []
+        table = MarkdownTableParser()
+
+        async def map_one(index: int, risk: Row) -> None:
+            try:
+                queue.put_nowait(("mapped", (index, await map_risk_group(
+                    [risk], self.controls_df, self.generate_controls, semaphore, self.controls_catalog))))
+            except Exception as e:
+                queue.put_nowait(("error", e))
+
+        def on_risks(risks: List[Row]) -> None:
+            for risk in risks:
+                queue.put_nowait(("risk", risk))
+                tasks.append(asyncio.ensure_future(map_one(len(tasks), risk)))
+
+        async def produce() -> None:
+            try:
+                if self.risks_from_text is not None:
+                    self.risk_raw = await self.generate_risks(None)
+                    on_risks(self.risks_from_text(self.risk_raw))
+                else:
+                    on_delta = lambda chunk: on_risks(self.risks_from_rows(table.feed(chunk)))
+                    self.risk_raw = await self.generate_risks(on_delta)
+                    on_risks(self.risks_from_rows(table.close()))
+                queue.put_nowait(("risks_done", None))
+            except Exception as e:
+                queue.put_nowait(("error", e))
+
+        producer = asyncio.ensure_future(produce())
+        mapped: Dict[int, Tuple[str, Prefiltered]] = {}
+        seen: Set[Tuple[Any, ...]] = set()
+        risks_done = False
+        mapped_upto = 0
+        try:
+            while not (risks_done and len(mapped) == len(tasks)):
+                kind, value = await queue.get()
+                if kind == "error":
+                    raise value
+                if kind == "risks_done":
+                    risks_done = True
+                elif kind == "risk":
+                    self.risks.append(value)
+                    yield {"event": "risk", "data": value}
+                elif kind == "mapped":
+                    mapped[value[0]] = value[1]
+                # each risk's answer is parsed once; controls go out in risk order, numbered as in the merged table
+                while mapped_upto in mapped:
+                    mapped_upto += 1
+                    text = mapped[mapped_upto - 1][0]
+                    controls, _ = self.parse_controls(self.merge_controls([text]), self.risks[:mapped_upto])
+                    for control in self._append_controls(controls, seen):
+                        yield {"event": "control", "data": control}
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+
+        risk_matrix = self.render_risks(self.risk_raw, self.risks)
+        self.control_raw = self.merge_controls([mapped[i][0] for i in range(len(tasks))])
+        _, control_matrix = self.parse_controls(self.control_raw, self.risks)
+        if tasks:
+            self.control_candidates = merge_prefiltered([mapped[i][1] for i in range(len(tasks))])
+        self.prompt_fingerprint = prompt_fingerprint(fingerprints)
+        yield {"event": "done", "data": {
+            "risk_assessment_id": self.risk_assessment_id, "risk_matrix": risk_matrix,
+            "control_matrix": control_matrix, "risks": len(self.risks), "controls": len(self.controls),
+            "prompt_fingerprint": self.prompt_fingerprint}}
+
+    def _append_controls(self, controls: List[Row], seen: Set[Tuple[Any, ...]]) -> List[Row]:
+        """
+        ``controls`` of one more risk, minus those already sent (the merge drops duplicate rows too),
+        renumbered to follow ``self.controls``.
+        """
+        added = []
+        for control in controls:
+            key = tuple(value for name, value in control.items() if name != "control_id")
+            if key in seen:
+                continue
+            seen.add(key)
+            added.append(dict(control, control_id=f"CTRL-{self.risk_assessment_id}-{len(self.controls) + 1:03d}"))
+            self.controls.append(added[-1])
+        return added
+
+
+async def replay(risk_assessment_id: str, risks: List[Row], controls: List[Row], risk_matrix: str,
+                 control_matrix: str, fingerprint: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+    """The events of an already finished (e.g. cached) assessment."""
+    for risk in risks:
+        yield {"event": "risk", "data": risk}
+    for control in controls:
+        yield {"event": "control", "data": control}
+    yield {"event": "done", "data": {
+        "risk_assessment_id": risk_assessment_id, "risk_matrix": risk_matrix,
+        "control_matrix": control_matrix, "risks": len(risks), "controls": len(controls),
+        "prompt_fingerprint": fingerprint}}
+
+
+async def ndjson_events(events: AsyncIterator[Dict[str, Any]],
+                        on_complete: Optional[Callable[[], None]] = None) -> AsyncIterator[bytes]:
+    """Serialize events as NDJSON; a failure mid-stream becomes a final "error" event."""
+    try:
+        async for event in events:
+            yield ndjson(event["event"], event["data"])
+    except HTTPException as e:
+        yield ndjson("error", {"detail": e.detail})
+        return
+    except Exception as e:
+        logger.error(f"Error in streamed assessment: {e}", exc_info=True)
+        yield ndjson("error", {"detail": f"Internal server error: {str(e)}"})
+        return
+    if on_complete is not None:
+        on_complete()
@@ -0,0 +1,166 @@
+# agents/batch_scoring.py
+"""
+Batched maturity scoring for the governance assessors.
+
+With SCORING_MODE=batch, several questions are scored in one Gemini request:
+the policy documents are sent once per batch instead of once per question,
+and the model returns a JSON array keyed by question id. Batches are packed
+greedily in question order up to SCORING_BATCH_TOKENS. Every batch carries
+the instructions and the policy documents, which are subtracted from the
+budget first. Each question then costs its estimated input tokens (question
+text and answers) plus the output allowance of its rating. If the policy alone
+fills the budget, every question gets its own batch. A batch that fails
+(request error, unparsable JSON) is scored again question by question;
+questions missing from an otherwise valid answer are scored one by one as
+well.
+
+With SCORING_MODE=single, ``score_each`` sends one request per question, at
+most SCORING_CONCURRENCY at a time, and returns the ratings in question order
+whatever order they complete in.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from .vertex_client import generative_model
+
+logger = logging.getLogger("uvicorn")
+
+SCORING_MODE = os.getenv("SCORING_MODE") or "single"
+SCORING_BATCH_TOKENS = int(os.getenv("SCORING_BATCH_TOKENS") or "4000")
+OUTPUT_TOKENS_PER_QUESTION = 160
+
+# One question per request (SCORING_MODE=single); shared by both governance assessors
+SYSTEM_SCORING_INSTRUCTIONS = """
+You are an AI governance auditor. Your task is to assess an organization's AI governance maturity based ONLY on the provided policy documents.
+Rate the answer on a scale of 0-4: 0=No evidence, 1=Emerging, 2=Defined, 3=Measured, 4=Optimized.
+Strictly return a JSON list of objects: [{"maturity": int, "rationale": str}]
+The rationale must be concise (<= 60 words) and reference the policy document.
+""".strip()
+
+BATCH_SCORING_INSTRUCTIONS = """
+You are an AI governance auditor. Your task is to assess an organization's AI governance maturity based ONLY on the provided policy documents.
+You receive several questions, each with an id and the organization's answers.
+Rate each question on a scale of 0-4 by its strongest answer: 0=No evidence, 1=Emerging, 2=Defined, 3=Measured, 4=Optimized.
+Strictly return a JSON list with exactly one object per question: [{"question_id": str, "maturity": int, "rationale": str}]
+The rationale must be concise (<= 60 words) and reference the policy document.
+""".strip()
+
+Rating = Tuple[int, str]
+
+
+@dataclass
+class ScoringItem:
+    question_id: str
+    question: str
+    answers: List[str]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting."""
+    return len(text) // 4 + 1
+
+
+def item_cost(item: ScoringItem) -> int:
+    return estimate_tokens(item.question) + sum(estimate_tokens(a) for a in item.answers) + OUTPUT_TOKENS_PER_QUESTION
+
+
+def batch_overhead(policy_documents: str) -> int:
+    """Tokens every batch spends regardless of its questions: the instructions and the policy documents."""
+    return estimate_tokens(BATCH_SCORING_INSTRUCTIONS) + estimate_tokens(policy_documents)
+
+
+def plan_batches(items: Sequence[ScoringItem], budget: int = SCORING_BATCH_TOKENS,
+                 overhead: int = 0) -> List[List[ScoringItem]]:
+    """
+    Consecutive batches of at most ``budget`` tokens, each including ``overhead`` (a single oversized
+    question gets its own batch).
+    """
+    capacity = budget - overhead
+    batches: List[List[ScoringItem]] = []
+    batch: List[ScoringItem] = []
+    used = 0
+    for item in items:
+        cost = item_cost(item)
+        if batch and used + cost > capacity:
+            batches.append(batch)
+            batch, used = [], 0
+        batch.append(item)
+        used += cost
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def rate_batch(model_name: str, project: str, location: str,
+               batch: Sequence[ScoringItem], policy_documents: str) -> Dict[str, Rating]:
+    """Ratings of one batch by question id; raises if the response can't be used."""
+    from vertexai.generative_models import GenerationConfig
+
+    model = generative_model(model_name, BATCH_SCORING_INSTRUCTIONS, project, location)
+    user_prompt = {
+        "policy_documents": policy_documents,
+        "questions": [{"question_id": i.question_id, "question": i.question, "answers": i.answers} for i in batch],
+    }
+    resp = model.generate_content(
+        [json.dumps(user_prompt)],
+        generation_config=GenerationConfig(temperature=0, max_output_tokens=OUTPUT_TOKENS_PER_QUESTION * len(batch),
+                                           response_mime_type="application/json"),
+    )
+    text = resp.candidates[0].content.parts[0].text
+    data = json.loads(text.strip().replace("```json", "").replace("```", "").strip())
+    if not isinstance(data, list):
+        raise ValueError(f"expected a JSON list, got {type(data).__name__}")
+    wanted = {i.question_id for i in batch}
+    ratings: Dict[str, Rating] = {}
+    for item in data:
+        if isinstance(item, dict) and str(item.get("question_id")) in wanted:
+            maturity = max(0, min(4, int(item.get("maturity", 0))))
+            ratings[str(item["question_id"])] = (maturity, str(item.get("rationale", "No rationale provided.")))
+    return ratings
+
+
+def score_in_batches(items: Sequence[ScoringItem], policy_documents: str, model_name: str, project: str,
+                     location: str, score_one: Callable[[ScoringItem], Rating], concurrency: int,
+                     on_error: Callable[[Sequence[ScoringItem], Exception], None] = lambda batch, e: None,
+                     budget: int = SCORING_BATCH_TOKENS) -> Dict[str, Rating]:
+    """
+    Ratings of all ``items`` by question id. Batches run concurrently (at most ``concurrency``);
+    ``score_one`` scores the questions of a failed batch and the ones a batch response left out.
+    """
+    def run(batch: List[ScoringItem]) -> Dict[str, Rating]:
+        try:
+            ratings = rate_batch(model_name, project, location, batch, policy_documents)
+        except Exception as e:
+            on_error(batch, e)
+            ratings = {}
+        for item in batch:
+            if item.question_id not in ratings:
+                ratings[item.question_id] = score_one(item)
+        return ratings
+
+    overhead = batch_overhead(policy_documents)
+    if overhead >= budget:
+        logger.warning(f"Policy documents (~{overhead} tokens) fill the scoring batch budget of {budget}; "
+                       f"scoring one question per batch.")
+    batches = plan_batches(items, budget, overhead)
+    ratings: Dict[str, Rating] = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches) or 1))) as pool:
+        for batch_ratings in pool.map(run, batches):
+            ratings.update(batch_ratings)
+    return ratings
+
+
+def score_each(items: Sequence[ScoringItem], score_one: Callable[[ScoringItem], Rating], concurrency: int,
+               progress: Callable[[Iterable[Rating]], Iterable[Rating]] = lambda results: results) -> Dict[str, Rating]:
+    """
+    Ratings of all ``items`` by question id, in item order: one ``score_one`` call per item, at most
+    ``concurrency`` at a time. ``progress`` wraps the ordered results (e.g. a progress bar).
+    """
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items) or 1))) as pool:
+        return {item.question_id: rating for item, rating in zip(items, progress(pool.map(score_one, items)))}
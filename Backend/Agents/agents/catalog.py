@@ -0,0 +1,240 @@
+# agents/catalog.py
+"""
+Process-wide cache for the Excel risk/control catalogs.
+
+Every workbook sheet is parsed once and kept in memory. Each lookup does a
+cheap ``os.stat``; the sheet is only re-parsed when the file's mtime/size
+changed *and* its content hash differs from the cached copy.
+
+Derived artifacts (indexes, rankers, prompt fragments, ...) can be memoized
+on a ``CatalogEntry`` with ``entry.memo(key, build)``. A reload produces a new
+entry, so anything derived from the old version is dropped with it.
+
+Parsed sheets are also written to a columnar Feather sidecar keyed by the
+workbook's content hash, so cold starts skip openpyxl entirely. Precompile
+the sidecars for the bundled catalogs with:
+
+    python -m agents.catalog
+"""
+from __future__ import annotations
+
+import dataclasses
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+logger = logging.getLogger("uvicorn")
+
+SheetRef = Union[str, int]
+CacheKey = Tuple[str, SheetRef, bool]
+
+# Catalog workbooks live next to main.py; sidecars go to CATALOG_SIDECAR_DIR (default: <root>/.catalog).
+ROOT = Path(__file__).resolve().parents[1]
+SIDECAR_DIR = Path(os.getenv("CATALOG_SIDECAR_DIR") or ROOT / ".catalog")
+
+# (workbook, named sheet) pairs read by the agents; compiled by `python -m agents.catalog`.
+BUNDLED_CATALOGS: List[Tuple[str, str]] = [
+    ("predefined_risks.xlsx", "Sheet"),
+    ("predefined_controls.xlsx", "Sheet1"),
+    ("stride_risks.xlsx", "Sheet"),
+    ("nist_controls.xlsx", "Sheet"),
+]
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    """One parsed workbook sheet. ``frame`` is shared: treat it as read-only."""
+    path: Path
+    sheet: SheetRef
+    normalized: bool
+    mtime_ns: int
+    size: int
+    digest: str
+    frame: pd.DataFrame = field(repr=False)
+    derived: Dict[Any, Any] = field(default_factory=dict, repr=False, compare=False)
+    _lock: threading.RLock = field(default_factory=threading.RLock, repr=False, compare=False)
+
+    @property
+    def version(self) -> str:
+        """Short content hash identifying this catalog version."""
+        return self.digest[:16]
+
+    def memo(self, key: Any, build: Callable[[], Any]) -> Any:
+        """Return ``build()`` computed at most once for this catalog version."""
+        try:
+            return self.derived[key]
+        except KeyError:
+            pass
+        with self._lock:
+            if key not in self.derived:
+                self.derived[key] = build()
+            return self.derived[key]
+
+    def forget(self, key: Any) -> None:
+        """Drop a memoized artifact so the next ``memo`` call rebuilds it."""
+        with self._lock:
+            self.derived.pop(key, None)
+
+
+def _file_digest(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _parse(path: Path, sheet: SheetRef, normalized: bool) -> pd.DataFrame:
+    if not normalized:
+        return pd.read_excel(path, sheet_name=sheet)
+    df = pd.read_excel(path, sheet_name=sheet, dtype=str).fillna("")
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+# ---------- Feather sidecars ----------
+def _sidecar_prefix(path: Path, sheet: SheetRef, normalized: bool) -> str:
+    # The resolved-path hash keeps same-named workbooks in different directories apart.
+    where = hashlib.sha256(str(Path(path).resolve()).encode()).hexdigest()[:8]
+    return f"{path.stem}.{where}.{sheet}.{'n' if normalized else 'r'}."
+
+def sidecar_path(path: Path, sheet: SheetRef, normalized: bool, digest: str) -> Path:
+    return SIDECAR_DIR / f"{_sidecar_prefix(path, sheet, normalized)}{digest[:16]}.feather"
+
+def _read_sidecar(path: Path, sheet: SheetRef, normalized: bool, digest: str) -> Optional[pd.DataFrame]:
+    sc = sidecar_path(path, sheet, normalized, digest)
+    if not sc.exists():
+        return None
+    try:
+        return pd.read_feather(sc)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable catalog sidecar {sc.name}: {e}")
+        return None
+
+def _write_sidecar(df: pd.DataFrame, path: Path, sheet: SheetRef, normalized: bool, digest: str) -> Optional[Path]:
+    """Best-effort: a sheet Arrow can't represent (mixed-type columns, ...) just keeps using the xlsx."""
+    sc = sidecar_path(path, sheet, normalized, digest)
+    tmp = sc.with_name(f"{sc.name}.{os.getpid()}.tmp")
+    try:
+        SIDECAR_DIR.mkdir(parents=True, exist_ok=True)
+        df.reset_index(drop=True).to_feather(tmp)
+        os.replace(tmp, sc)
+    except Exception as e:
+        logger.warning(f"Catalog sidecar not written for {path.name}[{sheet}]: {e}")
+        tmp.unlink(missing_ok=True)
+        return None
+    # Drop sidecars compiled from older versions of the same sheet.
+    for stale in SIDECAR_DIR.glob(f"{_sidecar_prefix(path, sheet, normalized)}*.feather"):
+        if stale != sc:
+            stale.unlink(missing_ok=True)
+    return sc
+
+def _load_frame(path: Path, sheet: SheetRef, normalized: bool, digest: str) -> pd.DataFrame:
+    df = _read_sidecar(path, sheet, normalized, digest)
+    if df is None:
+        df = _parse(path, sheet, normalized)
+        _write_sidecar(df, path, sheet, normalized, digest)
+    return df
+
+
+class CatalogCache:
+    """Thread-safe ``(path, sheet, normalized) -> CatalogEntry`` cache."""
+
+    def __init__(self) -> None:
+        self._entries: Dict[CacheKey, CatalogEntry] = {}
+        self._locks: Dict[CacheKey, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _key_lock(self, key: CacheKey) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def load(self, path: Union[str, os.PathLike], sheet: SheetRef = 0, normalized: bool = True) -> CatalogEntry:
+        p = Path(path).resolve()
+        key: CacheKey = (str(p), sheet, normalized)
+        try:
+            st = p.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Excel not found: {p}") from None
+
+        entry = self._entries.get(key)
+        if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+            return entry
+
+        with self._key_lock(key):
+            entry = self._entries.get(key)
+            if entry is not None and entry.mtime_ns == st.st_mtime_ns and entry.size == st.st_size:
+                return entry
+            digest = _file_digest(p)
+            if entry is not None and entry.digest == digest:
+                # Touched but unchanged: keep the parsed frame and its derived artifacts.
+                entry = dataclasses.replace(entry, mtime_ns=st.st_mtime_ns, size=st.st_size,
+                                            derived=entry.derived)
+            else:
+                entry = CatalogEntry(p, sheet, normalized, st.st_mtime_ns, st.st_size, digest,
+                                     _load_frame(p, sheet, normalized, digest))
+            self._entries[key] = entry
+            return entry
+
+    def clear(self) -> None:
+        with self._guard:
+            self._entries.clear()
+
+
+_CACHE = CatalogCache()
+
+
+def load_catalog(path: Union[str, os.PathLike], sheet: SheetRef = 0, normalized: bool = True) -> CatalogEntry:
+    """
+    Return the cached entry for a workbook sheet, re-parsing only if the file changed.
+    normalized=True reads every cell as text ("" for blanks) with stripped, lowercased headers;
+    normalized=False returns the sheet exactly as ``pd.read_excel`` parses it.
+    """
+    return _CACHE.load(path, sheet, normalized)
+
+
+def read_catalog(path: Union[str, os.PathLike], sheet: SheetRef = 0, normalized: bool = True) -> pd.DataFrame:
+    """Shallow copy of the cached frame: callers may add/rename columns without touching the cache."""
+    return load_catalog(path, sheet, normalized).frame.copy(deep=False)
+
+
+def clear_catalog_cache() -> None:
+    _CACHE.clear()
+
+
+def compile_catalogs(catalogs: Iterable[Tuple[str, str]] = BUNDLED_CATALOGS) -> List[Path]:
+    """
+    Parse each workbook with openpyxl and write its sidecars: the named sheet in normalized
+    form (main.py / excel_io / risk_control_agent) and the first sheet raw (utils / excel_mapping).
+    """
+    written: List[Path] = []
+    for name, sheet in catalogs:
+        p = (ROOT / name).resolve()
+        if not p.exists():
+            logger.warning(f"Skipping missing catalog {p}")
+            continue
+        digest = _file_digest(p)
+        for sheet_ref, normalized in ((sheet, True), (0, False)):
+            sc = _write_sidecar(_parse(p, sheet_ref, normalized), p, sheet_ref, normalized, digest)
+            if sc is not None:
+                written.append(sc)
+    return written
+
+
+def warm_catalogs(catalogs: Iterable[Tuple[str, str]] = BUNDLED_CATALOGS) -> None:
+    """Load the bundled catalogs into the cache (from sidecars when fresh)."""
+    for name, sheet in catalogs:
+        p = ROOT / name
+        if p.exists():
+            load_catalog(p, sheet)
+
+
+if __name__ == "__main__":
+    for sc in compile_catalogs():
+        print(f"[OK] {sc}")
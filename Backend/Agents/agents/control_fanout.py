@@ -0,0 +1,90 @@
+# agents/control_fanout.py
+"""
+Per-risk fan-out of the control mapping prompt.
+
+In "single" mode the whole risk matrix and control list go into one request,
+so latency grows with the total output and long matrices get truncated at
+``max_tokens``. In "per_risk" mode the parsed risks are split into groups of
+CONTROL_MAPPING_GROUP_SIZE; each group gets its own prompt (its own
+prefiltered candidate controls) and the requests run concurrently, at most
+CONTROL_MAPPING_CONCURRENCY at a time.
+
+The answers are merged in risk order into one markdown table (first header,
+then every group's data rows, exact duplicate rows dropped; JSON answers are
+merged by the caller's ``merge``), so the usual parsers and the LLM cache see
+the same shape as a single-prompt answer.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .catalog import CatalogEntry
+from .id_output import render_risk_matrix
+from .prefilter import Prefiltered, merge_prefiltered, prefilter_controls
+
+logger = logging.getLogger("uvicorn")
+
+# Default control mapping mode of the LLM agents: "single" (one prompt) or "per_risk"
+CONTROL_MAPPING_MODE = os.getenv("CONTROL_MAPPING_MODE") or "single"
+CONTROL_MAPPING_GROUP_SIZE = max(1, int(os.getenv("CONTROL_MAPPING_GROUP_SIZE") or "1"))
+CONTROL_MAPPING_CONCURRENCY = max(1, int(os.getenv("CONTROL_MAPPING_CONCURRENCY") or "8"))
+
+GenerateControls = Callable[[str, str], Awaitable[str]]  # (risk matrix, candidate controls markdown)
+MergeControls = Callable[[Sequence[str]], str]
+
+
+def _is_separator(line: str) -> bool:
+    return set(line) <= set("|-: ")
+
+
+def merge_tables(tables: Sequence[str]) -> str:
+    """One markdown table out of several answers with the same columns (in the given order)."""
+    header: List[str] = []
+    rows: List[str] = []
+    seen = set()
+    for text in tables:
+        lines = [l.strip() for l in (text or "").strip().splitlines() if "|" in l]
+        if not lines:
+            continue
+        if not header:
+            header = [lines[0]] + [l for l in lines[1:2] if _is_separator(l)]
+        for line in lines[1:]:
+            if _is_separator(line) or line in seen:
+                continue
+            seen.add(line)
+            rows.append(line)
+    return "\n".join(header + rows)
+
+
+async def map_risk_group(group: Sequence[Dict[str, Any]], controls_df: pd.DataFrame,
+                         generate: GenerateControls, semaphore: asyncio.Semaphore,
+                         catalog: Optional[CatalogEntry] = None) -> Tuple[str, Prefiltered]:
+    """Control mapping answer for one group of parsed risks, and the candidate controls it was given."""
+    matrix = render_risk_matrix(group)
+    candidates = prefilter_controls(controls_df, matrix, [r['risk_id'] for r in group], catalog=catalog)
+    async with semaphore:
+        return await generate(matrix, candidates.markdown), candidates
+
+
+async def map_controls_per_risk(risks: Sequence[Dict[str, Any]], controls_df: pd.DataFrame,
+                                generate: GenerateControls,
+                                group_size: int = CONTROL_MAPPING_GROUP_SIZE,
+                                concurrency: int = CONTROL_MAPPING_CONCURRENCY,
+                                merge: MergeControls = merge_tables,
+                                catalog: Optional[CatalogEntry] = None) -> Tuple[str, Prefiltered]:
+    """
+    Run ``generate(risk_matrix, candidate_controls)`` once per group of parsed risks, concurrently.
+    Returns the answers merged with ``merge`` (in risk order) and the union of the candidate controls sent.
+    ``catalog`` is the controls' catalog entry, passed on to ``prefilter_controls``.
+    """
+    groups = [list(risks[i:i + group_size]) for i in range(0, len(risks), group_size)]
+    semaphore = asyncio.Semaphore(concurrency)
+    logger.info(f"Mapping controls for {len(risks)} risks in {len(groups)} concurrent prompts "
+                f"(concurrency {concurrency}).")
+    results = await asyncio.gather(*(map_risk_group(g, controls_df, generate, semaphore, catalog) for g in groups))
+    return merge([text for text, _ in results]), merge_prefiltered([c for _, c in results])
@@ -2,8 +2,8 @@
 from __future__ import annotations
 from fastapi import APIRouter, HTTPException
 from typing import List
-from agents.shared.excel_io import read_nist_controls
-from agents.shared.types import ControlsIn, ControlOutItem, ControlsResponse
+from agents.excel_io import read_nist_controls, cyber_risk_control_links
+from agents.types import ControlsIn, ControlOutItem, ControlsResponse
 
 router = APIRouter(prefix="/agent/cyber", tags=["Cybersecurity Agents"])
 
@@ -11,7 +11,7 @@ router = APIRouter(prefix="/agent/cyber", tags=["Cybersecurity Agents"])
 def cyber_controls(payload: ControlsIn):
     """
     Generate cybersecurity (NIST) controls and link them to relevant risk IDs.
-    This version correctly rotates through the list of risk_ids passed from the backend.
+    Each control is linked to the most similar of the risk_ids passed from the backend.
     """
     if not payload.session_id:
         raise HTTPException(400, "session_id is required")
@@ -26,10 +26,11 @@ def cyber_controls(payload: ControlsIn):
 
     # List of risk IDs from the risk agent (e.g. ["STR-020", "STR-031", ...])
     rids = [r for r in (payload.risk_ids or []) if r]
-    idx = 0  # will be used to rotate risks through controls
+    # control row -> most similar of those risks (precomputed per catalog version)
+    related_by_row = cyber_risk_control_links().related_risks(rids) if rids else {}
 
     out: List[ControlOutItem] = []
-    for j, r in df.iterrows():
+    for pos, (j, r) in enumerate(df.iterrows()):
         cid = (r.get("control id") or "").strip()
         if not cid:
             continue
@@ -37,12 +38,8 @@ def cyber_controls(payload: ControlsIn):
         name = (r.get("control name") or "").strip()
         desc = (r.get("control description") or "").strip()
 
-        # Rotate risk linkage
-        if rids:
-            related = [rids[idx % len(rids)]]
-            idx += 1
-        else:
-            related = [payload.risk_assessment_id]
+        # Similarity-based risk linkage (the assessment id when no given risk links to this control)
+        related = related_by_row.get(pos) or [payload.risk_assessment_id]  # no linked risk id
 
         out.append(ControlOutItem(
             control_id=f"CTRL-{payload.risk_assessment_id}-{j+1:03d}",
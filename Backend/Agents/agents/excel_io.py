@@ -1,9 +1,12 @@
-# agents/shared/excel_io.py
+# agents/excel_io.py
 from __future__ import annotations
 from pathlib import Path
 from typing import Dict, List
 import pandas as pd
 
+from .catalog import load_catalog, read_catalog
+from .relevance import RiskControlLinks, risk_control_links
+
 # Excel files live at the repository root (same as before)
 ROOT = Path(__file__).resolve().parents[1]
 
@@ -18,11 +21,8 @@ SHEET_STRIDE_RISKS        = "Sheet"
 SHEET_NIST_CONTROLS       = "Sheet"
 
 def _read_xlsx(path: Path, sheet: str) -> pd.DataFrame:
-    if not path.exists():
-        raise FileNotFoundError(f"Excel not found: {path}")
-    df = pd.read_excel(path, sheet_name=sheet, dtype=str).fillna("")
-    df.columns = [c.strip().lower() for c in df.columns]
-    return df
+    # Served from the process-wide catalog cache; raises FileNotFoundError if missing.
+    return read_catalog(path, sheet)
 
 def read_ai_risks() -> pd.DataFrame:
     return _read_xlsx(PREDEFINED_RISKS_XLSX, SHEET_PREDEFINED_RISKS)
@@ -35,3 +35,25 @@ def read_cyber_risks() -> pd.DataFrame:
 
 def read_nist_controls() -> pd.DataFrame:
     return _read_xlsx(NIST_CONTROLS_XLSX, SHEET_NIST_CONTROLS)
+
+# Text columns compared when linking risks to controls
+AI_RISK_TEXT_FIELDS       = ("risk name", "risk", "mitigation")
+CYBER_RISK_TEXT_FIELDS    = ("risk description", "category", "mitigation")
+AI_CONTROL_TEXT_FIELDS    = ("section", "control", "requirements")
+NIST_CONTROL_TEXT_FIELDS  = ("family", "control name", "control description")
+
+# Column layout of each controls sheet: (code, section, control, requirements), as in main.py
+AI_CONTROL_COLS   = ("code", "section", "control", "requirements")
+NIST_CONTROL_COLS = ("control id", "family", "control name", "control description")
+
+def ai_risk_control_links() -> RiskControlLinks:
+    return risk_control_links(
+        load_catalog(PREDEFINED_RISKS_XLSX, SHEET_PREDEFINED_RISKS), AI_RISK_TEXT_FIELDS, "risk id",
+        load_catalog(PREDEFINED_CONTROLS_XLSX, SHEET_PREDEFINED_CONTROLS), AI_CONTROL_TEXT_FIELDS, "code",
+    )
+
+def cyber_risk_control_links() -> RiskControlLinks:
+    return risk_control_links(
+        load_catalog(STRIDE_RISKS_XLSX, SHEET_STRIDE_RISKS), CYBER_RISK_TEXT_FIELDS, "risk id",
+        load_catalog(NIST_CONTROLS_XLSX, SHEET_NIST_CONTROLS), NIST_CONTROL_TEXT_FIELDS, "control id",
+    )
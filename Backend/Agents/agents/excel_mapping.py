@@ -7,6 +7,8 @@ from typing import Any, Dict, Optional, Tuple, Union
 
 import pandas as pd
 
+from .catalog import read_catalog
+
 # ---------- Exceptions ----------
 class BadMapping(Exception):
     pass
@@ -42,7 +44,11 @@ def _read_excel_any(
 ) -> pd.DataFrame:
     path_or_buf, display = _as_path_or_buffer(src)
     sheet_name = 0 if sheet in (None, "first", "0") else sheet
-    df = pd.read_excel(path_or_buf, sheet_name=sheet_name)
+    if isinstance(path_or_buf, str):
+        # Paths go through the shared catalog cache (shallow copy, so the aliases below stay local).
+        df = read_catalog(path_or_buf, sheet_name, normalized=False)
+    else:
+        df = pd.read_excel(path_or_buf, sheet_name=sheet_name)
     # Normalize duplicate-friendly aliases WITHOUT destroying the original headers:
     # We keep original columns, but add lowercase / spaced / underscored aliases
     # so downstream code can access with r["risk id"] OR r["risk_id"] OR r["Risk ID"].
@@ -0,0 +1,178 @@
+# agents/governance_delta.py
+"""
+Incremental (delta) governance assessments.
+
+Framework scores are sums of per-item contributions: every question adds
+``maturity/4 * weight`` out of ``weight`` and every evidenced control adds
+``0.2 * weight`` out of ``0.2 * weight``, per framework. A finished
+assessment is stored with those contributions and the running totals, so a
+follow-up that changes a few answers or control ``evidence`` flags rescores
+only the changed questions, swaps the stored contributions of the changed
+items for their new ones and re-sums the totals from the contributions.
+
+Records keep a hash of the policy documents, not their text; a delta is
+scored against the assessor's current policy and is a 409 when that is not
+the policy the assessment was scored against. Records live in their own
+SQLite store (``ASSESSMENT_STORE_*``, ``llm_cache`` TTL) so they neither
+evict nor are evicted by cached LLM output and scores. A delta against an
+unknown or expired ID is a 404; the caller then runs a full assessment. Each
+delta is stored as a new assessment, so deltas chain.
+"""
+from __future__ import annotations
+
+import copy
+import os
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Mapping, Sequence, Type, TypeVar
+
+from fastapi import HTTPException
+from pydantic import BaseModel, Field
+
+from .batch_scoring import Rating
+from .llm_cache import LLM_CACHE_TTL, ROOT, LLMCache
+from .score_cache import policy_hash
+
+ASSESSMENT_NAMESPACE = "governance_assessments"
+
+R = TypeVar("R", bound=BaseModel)
+ASSESSMENT_STORE_PATH = Path(os.getenv("ASSESSMENT_STORE_PATH") or ROOT / ".cache" / "governance_assessments.sqlite3")
+ASSESSMENT_STORE_MAX_ENTRIES = int(os.getenv("ASSESSMENT_STORE_MAX_ENTRIES") or "1000")
+
+assessment_store = LLMCache(ASSESSMENT_STORE_PATH, LLM_CACHE_TTL, ASSESSMENT_STORE_MAX_ENTRIES)
+
+# {framework: [earned, max]}
+Contribution = Dict[str, List[float]]
+
+
+class AssessmentDeltaRequest(BaseModel):
+    assessment_id: str
+    answers: Dict[str, str] = Field(default_factory=dict)   # changed answers, by question id
+    evidence: Dict[str, bool] = Field(default_factory=dict)  # changed control evidence flags, by control key
+
+
+def question_contribution(question: Mapping[str, Any], maturity: int, frameworks: Sequence[str]) -> Contribution:
+    return {fw: [maturity / 4.0 * question["weights"].get(fw, 0.0), 1.0 * question["weights"].get(fw, 0.0)]
+            for fw in frameworks}
+
+
+def control_contribution(control: Mapping[str, Any], frameworks: Sequence[str]) -> Contribution:
+    if not bool(control.get("evidence")):
+        return {fw: [0.0, 0.0] for fw in frameworks}
+    weights = {fw: float(control.get("weights", {}).get(fw, 0.0)) for fw in frameworks}
+    return {fw: [0.2 * weights[fw], 0.2 * weights[fw]] for fw in frameworks}
+
+
+def sum_contributions(parts: Sequence[Contribution], frameworks: Sequence[str]) -> Contribution:
+    totals = {fw: [0.0, 0.0] for fw in frameworks}
+    for part in parts:
+        _add(totals, part)
+    return totals
+
+
+def framework_scores(totals: Contribution) -> Dict[str, float]:
+    return {fw: (100.0 * (earned / most)) if most > 1e-9 else 0.0 for fw, (earned, most) in totals.items()}
+
+
+def _add(totals: Contribution, part: Contribution) -> None:
+    for fw, (earned, most) in part.items():
+        totals[fw][0] += earned
+        totals[fw][1] += most
+
+
+def new_assessment_id() -> str:
+    return f"GA-{os.urandom(8).hex()}"
+
+
+def build_record(questions: List[Dict[str, Any]], answers_map: Dict[str, str], controls: Dict[str, Any],
+                 policy_documents: str, per_question_scores: Dict[str, int],
+                 per_question_rationales: Dict[str, str], frameworks: Sequence[str]) -> Dict[str, Any]:
+    """What a later delta needs of a finished assessment."""
+    question_parts = {q["id"]: question_contribution(q, per_question_scores.get(q["id"], 0), frameworks)
+                      for q in questions}
+    control_parts = {key: control_contribution(ctl, frameworks) for key, ctl in controls.items()}
+    return {
+        "questions": questions, "answers_map": answers_map, "controls": controls,
+        "policy_hash": policy_hash(policy_documents),
+        "per_question_scores": per_question_scores, "per_question_rationales": per_question_rationales,
+        "question_contributions": question_parts, "control_contributions": control_parts,
+        "totals": sum_contributions(list(question_parts.values()) + list(control_parts.values()), frameworks),
+    }
+
+
+def save_assessment(record: Dict[str, Any]) -> str:
+    assessment_id = new_assessment_id()
+    assessment_store.put(ASSESSMENT_NAMESPACE, assessment_id, record)
+    return assessment_id
+
+
+def load_assessment(assessment_id: str) -> Dict[str, Any]:
+    record = assessment_store.get(ASSESSMENT_NAMESPACE, assessment_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail=f"Unknown or expired assessment '{assessment_id}'")
+    return record
+
+
+def apply_delta(record: Dict[str, Any], delta: AssessmentDeltaRequest, frameworks: Sequence[str],
+                rescore: Callable[[List[Dict[str, Any]], Dict[str, str], str], Dict[str, Rating]],
+                policy_documents: str) -> Dict[str, Any]:
+    """
+    The record after ``delta``. ``rescore(questions, answers_map, policy_documents)`` scores the
+    questions whose answer changed; unchanged answers and flags are no-ops.
+    """
+    if policy_hash(policy_documents) != record["policy_hash"]:
+        raise HTTPException(status_code=409, detail="The policy documents changed since this assessment; "
+                                                    "run a full assessment")
+    questions = {q["id"]: q for q in record["questions"]}
+    unknown = sorted(set(delta.answers) - set(questions)) + sorted(set(delta.evidence) - set(record["controls"]))
+    if unknown:
+        raise HTTPException(status_code=422, detail=f"Unknown question or control ids: {', '.join(unknown)}")
+
+    record = copy.deepcopy(record)
+    changed_questions = [questions[qid] for qid, answer in delta.answers.items()
+                         if answer != record["answers_map"].get(qid)]
+    record["answers_map"].update(delta.answers)
+    ratings = rescore(changed_questions, record["answers_map"], policy_documents) if changed_questions else {}
+    for q in changed_questions:
+        maturity, rationale = ratings[q["id"]]
+        record["per_question_scores"][q["id"]] = maturity
+        record["per_question_rationales"][q["id"]] = rationale
+        record["question_contributions"][q["id"]] = question_contribution(q, maturity, frameworks)
+
+    for key, evidence in delta.evidence.items():
+        control = record["controls"][key]
+        if bool(control.get("evidence")) == evidence:
+            continue
+        control["evidence"] = evidence
+        record["control_contributions"][key] = control_contribution(control, frameworks)
+
+    # Re-summed rather than adjusted by differences, so chained deltas don't accumulate rounding drift.
+    record["totals"] = sum_contributions(
+        list(record["question_contributions"].values()) + list(record["control_contributions"].values()), frameworks)
+    return record
+
+
+def delta_state(record: Dict[str, Any], frameworks: Sequence[str],
+                finish: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Workflow state of an updated record: scores from the stored totals, then ``finish`` (the
+    assessor's analysis and report nodes) fills in the recommendations, analysis and report.
+    """
+    state = {k: record[k] for k in (
+        "questions", "answers_map", "controls", "per_question_scores", "per_question_rationales")}
+    state['framework_scores'] = framework_scores(record['totals'])
+    state['overall_score'] = sum(state['framework_scores'].values()) / len(frameworks) if frameworks else 0.0
+    return finish(state)
+
+
+def delta_response(record: Dict[str, Any], frameworks: Sequence[str], response_model: Type[R],
+                   finish: Callable[[Dict[str, Any]], Dict[str, Any]]) -> R:
+    """``response_model`` of an updated record, which is saved under a new assessment ID."""
+    state = delta_state(record, frameworks, finish)
+    return response_model(
+        scores=state['report']['scores'],
+        overall=state['report']['overall'],
+        recommendations=state['recommendations'],
+        detailed_analysis=state['detailed_analysis'],
+        full_report=state['report'],
+        assessment_id=save_assessment(record),
+    )
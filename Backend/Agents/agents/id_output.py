@@ -0,0 +1,188 @@
+# agents/id_output.py
+"""
+ID-only LLM output for the risk/control agents.
+
+In "ids" mode the model returns catalog IDs plus the fields it actually
+generates (owner, severity, justification / status, tickets, related risk
+ID). Names, mitigations, target dates, sections and requirement text are
+filled in from the cached catalogs instead of being re-emitted token by token.
+The hydrated rows are rendered back into the usual markdown matrices so the
+response shape is the same as in "table" mode.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from .catalog import load_catalog
+from .excel_io import AI_CONTROL_COLS, NIST_CONTROL_COLS, PREDEFINED_RISKS_XLSX
+from .llm import chat_completion
+from .markdown_table import Cells, table_rows
+from .prompt_cache import system_messages
+
+logger = logging.getLogger("uvicorn")
+
+# Default output mode of the LLM agents: "table" (full markdown) or "ids"
+LLM_OUTPUT_MODE = os.getenv("LLM_OUTPUT_MODE") or "table"
+
+RISK_MATRIX_COLUMNS = ["Risk ID", "Risk", "Owner", "Severity", "Justification", "Mitigation", "Target Date"]
+CONTROL_MATRIX_COLUMNS = ["CODE", "SECTION", "CONTROL", "REQUIREMENTS", "STATUS", "TICKETS", "Related Risk"]
+
+
+def _cell(v: Any) -> str:
+    return "" if v is None or (isinstance(v, float) and pd.isna(v)) else str(v).strip()
+
+
+def _render(columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> str:
+    esc = lambda v: _cell(v).replace("|", "\\|").replace("\n", " ")
+    lines = ["| " + " | ".join(columns) + " |", "|" + "|".join("---" for _ in columns) + "|"]
+    lines += ["| " + " | ".join(esc(v) for v in row) + " |" for row in rows]
+    return "\n".join(lines)
+
+
+# ---------- Risks ----------
+def _risk_library() -> Dict[str, Dict[str, str]]:
+    """RISK ID -> catalog columns, built once per catalog version."""
+    entry = load_catalog(PREDEFINED_RISKS_XLSX, 0, normalized=False)
+
+    def build() -> Dict[str, Dict[str, str]]:
+        out: Dict[str, Dict[str, str]] = {}
+        for rid, name, mit, date in zip(entry.frame["RISK ID"], entry.frame["RISK NAME"],
+                                        entry.frame["MITIGATION"], entry.frame["TARGET_DATE"]):
+            if _cell(rid):
+                out.setdefault(_cell(rid), {"risk_name": _cell(name), "mitigation": _cell(mit),
+                                            "target_date": _cell(date)})
+        return out
+    return entry.memo("risk_hydration", build)
+
+
+async def generate_risk_ids(summary: str, risk_library: str,
+                            on_delta: Optional[Callable[[str], None]] = None) -> str:
+    messages = system_messages("""
+You are a risk analysis expert. Select the risks from the library in the next message that apply to the user's project summary.
+
+For each applicable risk output one row of a Markdown table with ONLY these columns:
+| Risk ID | Owner | Severity | Justification |
+- Risk ID: the exact RISK ID from the library (do not repeat the name or mitigation).
+- Severity: an integer 1-5.
+- Justification: one short sentence.
+Do not add any introductory text.
+""", f"**Official Risk Library:**\n{risk_library}")
+    return await chat_completion(
+        messages + [{"role": "user", "content": summary}],
+        temperature=0.5, max_tokens=400, on_delta=on_delta,
+    )
+
+
+def hydrate_risks(text: str, risk_assessment_id: str) -> Tuple[List[Dict[str, Any]], str]:
+    """Parsed risks with catalog columns filled in, and the equivalent full risk matrix."""
+    risks = hydrate_risk_rows(table_rows(text), risk_assessment_id)
+    return risks, render_risk_matrix(risks)
+
+
+def hydrate_risk_rows(rows: Sequence[Cells], risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Risks for `| Risk ID | Owner | Severity | Justification |` rows, catalog columns filled in."""
+    library = _risk_library()
+    risks: List[Dict[str, Any]] = []
+    for cells in rows:
+        if len(cells) < 4:
+            continue
+        rid = cells[0]
+        row = library.get(rid)
+        if row is None:
+            logger.warning(f"Dropping unknown risk id from LLM output: {rid!r}")
+            continue
+        risks.append({
+            'risk_id': rid,
+            'risk_assessment_id': risk_assessment_id,
+            'risk_name': row['risk_name'],
+            'risk_owner': cells[1],
+            'severity': int(cells[2]) if cells[2].isdigit() else 3,
+            'justification': cells[3],
+            'mitigation': row['mitigation'],
+            'target_date': row['target_date'],
+        })
+    return risks
+
+
+def render_risk_matrix(risks: Sequence[Dict[str, Any]]) -> str:
+    """Markdown risk matrix (the "table" mode layout) for parsed risk rows."""
+    return _render(RISK_MATRIX_COLUMNS, [
+        (r['risk_id'], r['risk_name'], r['risk_owner'], r['severity'], r['justification'],
+         r['mitigation'], r['target_date']) for r in risks])
+
+
+# ---------- Controls ----------
+def control_columns(controls_df: pd.DataFrame) -> Optional[Tuple[Any, ...]]:
+    """The sheet's (code, section, control, requirements) headers, if it has one of the known layouts (AI / NIST)."""
+    cols = {str(c).strip().lower(): c for c in controls_df.columns}
+    for layout in (AI_CONTROL_COLS, NIST_CONTROL_COLS):
+        if all(c in cols for c in layout):
+            return tuple(cols[c] for c in layout)
+    return None
+
+
+def _control_library(controls_df: pd.DataFrame) -> Dict[str, Tuple[str, str, str]]:
+    """CODE -> (section, control, requirements) for a controls sheet of a known layout."""
+    cols = control_columns(controls_df)
+    if cols is None:
+        return {}
+    out: Dict[str, Tuple[str, str, str]] = {}
+    for code, section, control, reqs in zip(*(controls_df[c] for c in cols)):
+        if _cell(code):
+            out.setdefault(_cell(code), (_cell(section), _cell(control), _cell(reqs)))
+    return out
+
+
+async def generate_control_ids(risk_matrix: str, controls_markdown: str) -> str:
+    messages = system_messages("""
+You are an expert Control Assessment Agent for AI systems.
+Map controls from the official list in the next message to each risk in the user's risk matrix. Do not invent controls.
+
+Output ONLY a Markdown table with these columns, one row per (control, risk) pair:
+| CODE | STATUS | TICKETS | Related Risk ID |
+- CODE: the exact code (CODE / Control ID) from the list (do not repeat the other columns).
+- STATUS: "Compliant", "In Progress", or "Not Implemented".
+- TICKETS: a placeholder like TICK-123 if not Compliant, else "None".
+- Related Risk ID: the Risk ID from the input matrix that this control mitigates.
+Do not add any prefix text.
+""", f"**Official Control List:**\n{controls_markdown}")
+    return await chat_completion(
+        messages + [{"role": "user", "content": f"Please perform a control assessment based on the following risk matrix:\n\n{risk_matrix}"}],
+        temperature=0.3, max_tokens=500,
+    )
+
+
+def hydrate_controls(text: str, controls_df: pd.DataFrame, risk_ids: Sequence[str],
+                     risk_assessment_id: str) -> Tuple[List[Dict[str, Any]], str]:
+    """Parsed controls with catalog columns filled in, and the equivalent full control matrix."""
+    library = _control_library(controls_df)
+    known_risks = set(risk_ids)
+    controls: List[Dict[str, Any]] = []
+    for cells in table_rows(text):
+        if len(cells) < 4:
+            continue
+        code = cells[0]
+        row = library.get(code)
+        if row is None:
+            logger.warning(f"Dropping unknown control code from LLM output: {code!r}")
+            continue
+        related = cells[3] if cells[3] in known_risks else f"UNMAPPED: {cells[3]}"
+        controls.append({
+            'control_id': f"CTRL-{risk_assessment_id}-{len(controls)+1:03d}",
+            'risk_assessment_id': risk_assessment_id,
+            'code': code, 'section': row[0], 'control': row[1], 'requirements': row[2],
+            'status': cells[1], 'tickets': cells[2] or "None",
+            'related_risk': related,
+        })
+    return controls, render_control_matrix(controls)
+
+
+def render_control_matrix(controls: Sequence[Dict[str, Any]]) -> str:
+    """Markdown control matrix (the "table" mode layout) for parsed control rows."""
+    return _render(CONTROL_MATRIX_COLUMNS, [
+        (c['code'], c['section'], c['control'], c['requirements'], c['status'], c['tickets'], c['related_risk'])
+        for c in controls])
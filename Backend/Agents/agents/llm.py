@@ -0,0 +1,116 @@
+# agents/llm.py
+"""
+Shared async OpenAI client.
+
+One ``AsyncOpenAI`` per worker process, backed by a pooled keep-alive HTTP
+transport, so concurrent assessments reuse connections instead of blocking
+the event loop on the synchronous client. ``main.py`` opens it on startup
+and closes it on shutdown; agents call ``chat_completion`` (with ``on_delta``
+to receive the text while it is being generated, and ``strict`` to get a
+truncated or refused completion as an exception instead of its partial text).
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+logger = logging.getLogger("uvicorn")
+
+OPENAI_MODEL = os.getenv("OPENAI_MODEL") or "gpt-4o-mini"
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS") or "100")
+LLM_MAX_KEEPALIVE = int(os.getenv("LLM_MAX_KEEPALIVE") or "20")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT") or "120")
+
+_client: Optional[AsyncOpenAI] = None
+
+
+class CompletionTruncated(Exception):
+    """The completion stopped at ``max_tokens`` (finish_reason "length")."""
+
+    def __init__(self, max_tokens: int, text: str):
+        super().__init__(f"completion truncated at max_tokens={max_tokens}")
+        self.max_tokens = max_tokens
+        self.text = text
+
+
+class CompletionRefused(Exception):
+    """The model refused to answer (the message carries a ``refusal`` instead of content)."""
+
+    def __init__(self, refusal: str):
+        super().__init__(f"model refused: {refusal}")
+        self.refusal = refusal
+
+
+def open_llm_client() -> AsyncOpenAI:
+    """Create the process-wide client (idempotent). Raises if OPENAI_API_KEY is not configured."""
+    global _client
+    if _client is None:
+        _client = AsyncOpenAI(
+            api_key=os.getenv("OPENAI_API_KEY"),
+            timeout=LLM_TIMEOUT,
+            http_client=DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                    max_keepalive_connections=LLM_MAX_KEEPALIVE),
+            ),
+        )
+    return _client
+
+
+async def close_llm_client() -> None:
+    global _client
+    if _client is not None:
+        client, _client = _client, None
+        await client.close()
+
+
+def get_llm_client() -> AsyncOpenAI:
+    """The shared client; created on first use if startup didn't open it."""
+    return _client or open_llm_client()
+
+
+async def chat_completion(messages: List[Dict[str, Any]], *, temperature: float, max_tokens: int,
+                          model: Optional[str] = None, on_delta: Optional[Callable[[str], None]] = None,
+                          strict: bool = False, **kwargs: Any) -> str:
+    """
+    Run one chat completion on the shared client and return the stripped message text.
+    With ``on_delta`` the completion is streamed and every text chunk is passed to it as it arrives.
+    With ``strict`` a completion cut off at ``max_tokens`` raises ``CompletionTruncated`` and a
+    refusal raises ``CompletionRefused``.
+    """
+    request = dict(model=model or OPENAI_MODEL, messages=messages, temperature=temperature,
+                   max_tokens=max_tokens, **kwargs)
+    if on_delta is None:
+        resp = await get_llm_client().chat.completions.create(**request)
+        choice = resp.choices[0]
+        text = (choice.message.content or "").strip()
+        refusal = getattr(choice.message, "refusal", None)
+        finish_reason = choice.finish_reason
+    else:
+        parts: List[str] = []
+        refusals: List[str] = []
+        finish_reason = None
+        stream = await get_llm_client().chat.completions.create(stream=True, **request)
+        async for chunk in stream:
+            if not chunk.choices:
+                continue
+            choice = chunk.choices[0]
+            finish_reason = choice.finish_reason or finish_reason
+            if getattr(choice.delta, "refusal", None):
+                refusals.append(choice.delta.refusal)
+            delta = choice.delta.content
+            if delta:
+                parts.append(delta)
+                on_delta(delta)
+        text = "".join(parts).strip()
+        refusal = "".join(refusals) or None
+
+    if strict:
+        if refusal:
+            raise CompletionRefused(refusal)
+        if finish_reason == "length":
+            raise CompletionTruncated(max_tokens, text)
+    return text
@@ -0,0 +1,163 @@
+# agents/llm_cache.py
+"""
+Persistent cache for LLM responses.
+
+A local SQLite file (no external service) holding JSON values under
+``(namespace, key)``. Entries expire after ``LLM_CACHE_TTL`` seconds and the
+least recently used ones are evicted beyond ``LLM_CACHE_MAX_ENTRIES``
+(0 disables the cache). Hit/miss/eviction counters are kept per namespace for
+this process and exposed through ``stats()``.
+
+Keys are built with ``make_key`` from everything that decides the model's
+answer: normalized input text, catalog versions, model name and a hash of the
+prompt templates (``template_hash``).
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import types
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+import orjson
+
+from .catalog import load_catalog
+
+logger = logging.getLogger("uvicorn")
+
+ROOT = Path(__file__).resolve().parents[1]
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH") or ROOT / ".cache" / "llm_cache.sqlite3")
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL") or 7 * 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES") or "5000")
+
+
+def normalize_text(text: str) -> str:
+    """Case- and whitespace-insensitive form of an input text."""
+    return " ".join(str(text or "").casefold().split())
+
+
+def _literals(code: types.CodeType) -> tuple:
+    """Constants of a code object, nested functions/lambdas included (their reprs carry addresses)."""
+    return tuple(_literals(c) if isinstance(c, types.CodeType) else c for c in code.co_consts)
+
+
+def template_hash(*fns: Callable) -> str:
+    """Hash of the literal text (prompt templates, constants) of the given functions."""
+    h = hashlib.sha256()
+    for fn in fns:
+        h.update(fn.__qualname__.encode())
+        h.update(repr(_literals(fn.__code__)).encode())
+    return h.hexdigest()[:16]
+
+
+def file_version(path: os.PathLike | str) -> str:
+    """Catalog version of a workbook (first sheet), or "missing" when it can't be read."""
+    try:
+        return load_catalog(path, 0, normalized=False).version
+    except Exception:
+        return "missing"
+
+
+def make_key(*parts: Any) -> str:
+    return hashlib.sha256(orjson.dumps(parts, default=str)).hexdigest()
+
+
+class LLMCache:
+    """TTL + size-bounded LRU cache of JSON values in one SQLite file (thread-safe)."""
+
+    def __init__(self, path: Path, ttl: float, max_entries: int) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.counters: Dict[str, Counter] = {}
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("""CREATE TABLE IF NOT EXISTS llm_cache (
+                                namespace TEXT NOT NULL,
+                                key       TEXT NOT NULL,
+                                value     BLOB NOT NULL,
+                                created   REAL NOT NULL,
+                                accessed  REAL NOT NULL,
+                                PRIMARY KEY (namespace, key))""")
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+            self._conn = conn
+        return self._conn
+
+    def _count(self, namespace: str, what: str, n: int = 1) -> None:
+        self.counters.setdefault(namespace, Counter())[what] += n
+
+    def get(self, namespace: str, key: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        now = time.time()
+        try:
+            with self._lock:
+                db = self._db()
+                row = db.execute("SELECT value, created FROM llm_cache WHERE namespace = ? AND key = ?",
+                                 (namespace, key)).fetchone()
+                if row is not None and now - row[1] > self.ttl:
+                    db.execute("DELETE FROM llm_cache WHERE namespace = ? AND key = ?", (namespace, key))
+                    self._count(namespace, "expired")
+                    row = None
+                if row is None:
+                    self._count(namespace, "misses")
+                    return None
+                db.execute("UPDATE llm_cache SET accessed = ? WHERE namespace = ? AND key = ?", (now, namespace, key))
+                self._count(namespace, "hits")
+            return orjson.loads(row[0])
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            return None
+
+    def put(self, namespace: str, key: str, value: Any) -> None:
+        if not self.enabled:
+            return
+        now = time.time()
+        try:
+            blob = orjson.dumps(value)
+            with self._lock:
+                db = self._db()
+                db.execute("INSERT OR REPLACE INTO llm_cache (namespace, key, value, created, accessed) "
+                           "VALUES (?, ?, ?, ?, ?)", (namespace, key, blob, now, now))
+                evicted = db.execute("DELETE FROM llm_cache WHERE rowid IN (SELECT rowid FROM llm_cache "
+                                     "ORDER BY accessed DESC LIMIT -1 OFFSET ?)", (self.max_entries,)).rowcount
+                if evicted > 0:
+                    self._count(namespace, "evictions", evicted)
+                self._count(namespace, "writes")
+        except (sqlite3.Error, TypeError) as e:
+            logger.warning(f"LLM cache write failed: {e}")
+
+    def clear(self, namespace: Optional[str] = None) -> None:
+        with self._lock:
+            if namespace is None:
+                self._db().execute("DELETE FROM llm_cache")
+            else:
+                self._db().execute("DELETE FROM llm_cache WHERE namespace = ?", (namespace,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = dict(self._db().execute(
+                "SELECT namespace, COUNT(*) FROM llm_cache GROUP BY namespace").fetchall()) if self.enabled else {}
+            counters = {ns: dict(c) for ns, c in self.counters.items()}
+        return {"enabled": self.enabled, "path": str(self.path), "ttl": self.ttl,
+                "max_entries": self.max_entries, "entries": entries, "counters": counters}
+
+
+llm_cache = LLMCache(LLM_CACHE_PATH, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES)
@@ -0,0 +1,123 @@
+# agents/markdown_table.py
+"""
+Markdown table parsing for the LLM agents.
+
+``MarkdownTableParser`` consumes a completion chunk by chunk (or all at once)
+and returns every data row as soon as its line is complete; each chunk is
+scanned once, the text already consumed is never looked at again.
+
+Cells are split on unescaped pipes (``\\|`` is a literal ``|`` inside a cell),
+empty cells keep their position and the outer border pipes are optional.
+Lines without a pipe (introductory text), the header row and the separator
+row are not returned as data.
+"""
+from __future__ import annotations
+
+import re
+from typing import Any, Dict, List, Optional, Sequence
+
+_CELL_SPLIT = re.compile(r"(?<!\\)\|")
+_SEPARATOR = re.compile(r"^\|?\s*:?-+:?\s*(\|\s*:?-+:?\s*)*\|?$")
+
+Cells = List[str]
+
+
+def split_cells(line: str) -> Cells:
+    """Cells of one table line, in column order."""
+    line = line.strip()
+    cells = _CELL_SPLIT.split(line)
+    if line.startswith("|"):
+        cells = cells[1:]
+    if len(line) > 1 and line.endswith("|") and not line.endswith("\\|"):
+        cells = cells[:-1]
+    return [c.replace("\\|", "|").strip() for c in cells]
+
+
+class MarkdownTableParser:
+    """Incremental parser: ``feed`` chunks, then ``close`` for the last unterminated line."""
+
+    def __init__(self) -> None:
+        self.header: Optional[Cells] = None
+        self._pending: List[str] = []
+
+    def feed(self, chunk: str) -> List[Cells]:
+        """Data rows completed by this chunk."""
+        if "\n" not in chunk:
+            if chunk:
+                self._pending.append(chunk)
+            return []
+        first, *lines, tail = chunk.split("\n")
+        self._pending.append(first)
+        lines.insert(0, "".join(self._pending))
+        self._pending = [tail] if tail else []
+        return [row for row in map(self._row, lines) if row is not None]
+
+    def close(self) -> List[Cells]:
+        line, self._pending = "".join(self._pending), []
+        row = self._row(line)
+        return [row] if row is not None else []
+
+    def _row(self, line: str) -> Optional[Cells]:
+        if "|" not in line:
+            return None
+        line = line.strip()
+        if _SEPARATOR.match(line):
+            return None
+        cells = split_cells(line)
+        if self.header is None:
+            self.header = cells
+            return None
+        return cells
+
+
+def table_rows(text: str) -> List[Cells]:
+    """Data rows of a complete markdown table."""
+    parser = MarkdownTableParser()
+    return parser.feed(text or "") + parser.close()
+
+
+# ---------- Risk / control matrices ("table" output mode) ----------
+def risk_rows(rows: Sequence[Cells], risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Risks from `| Risk ID | Risk | Owner | Severity | Justification | Mitigation | Target Date |` rows."""
+    risks = []
+    for cells in rows:
+        if len(cells) < 7:
+            continue
+        # The first column is the predefined Risk ID, which links back to the risk library.
+        risks.append({
+            'risk_id': cells[0],
+            'risk_assessment_id': risk_assessment_id,
+            'risk_name': cells[1],
+            'risk_owner': cells[2],
+            'severity': int(cells[3]) if cells[3].isdigit() else 3,
+            'justification': cells[4],
+            'mitigation': cells[5],
+            'target_date': cells[6],
+        })
+    return risks
+
+
+def control_rows(rows: Sequence[Cells], risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Controls from `| CODE | SECTION | CONTROL | REQUIREMENTS | STATUS | TICKETS | Related Risk |` rows."""
+    controls = []
+    for cells in rows:
+        if len(cells) < 7:
+            continue
+        controls.append({
+            'control_id': f"CTRL-{risk_assessment_id}-{len(controls) + 1:03d}",
+            'risk_assessment_id': risk_assessment_id,
+            'code': cells[0], 'section': cells[1], 'control': cells[2],
+            'requirements': cells[3], 'status': cells[4], 'tickets': cells[5],
+            'related_risk': cells[6],
+        })
+    return controls
+
+
+def parse_markdown_table(table_content: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Parse a risk matrix completion, keeping the predefined Risk IDs."""
+    return risk_rows(table_rows(table_content), risk_assessment_id)
+
+
+def parse_control_table(table_content: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Parse a control matrix completion, including the 'Related Risk' column."""
+    return control_rows(table_rows(table_content), risk_assessment_id)
@@ -0,0 +1,207 @@
+# agents/prefilter.py
+"""
+Relevance prefilter for the LLM prompts.
+
+Instead of pasting the whole risk library / control sheet into every system
+prompt, only the top-K candidates for the request are sent:
+
+- risks: BM25 over the predefined risk catalog, queried with the summary;
+- controls: controls linked to the identified risks in the risk/control
+  similarity index, topped up with BM25 over the control sheet, queried with
+  the generated risk matrix.
+
+Candidates keep sheet order, so the same selection always renders the same
+prompt text. PROMPT_RISK_TOP_K / PROMPT_CONTROL_TOP_K <= 0 sends everything.
+
+Every prefiltered call logs, at no extra cost, ``log_coverage``: the IDs the
+model returned that were not among its candidates, and (for controls) the
+controls linked to the identified risks that the top-K cut left out. A
+measured recall is opt-in: for PREFILTER_RECALL_SAMPLE of the requests
+(default 0) the same prompt is sent again in the background with the whole
+catalog, a second paid call of the full prompt size, and ``log_recall``
+reports how many of the IDs the model picks from the whole catalog were among
+the candidates it was actually given.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import random
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Awaitable, Callable, Iterable, List, Optional, Sequence, Set
+
+import pandas as pd
+
+from .catalog import CatalogEntry, load_catalog
+from .excel_io import (AI_CONTROL_TEXT_FIELDS, AI_RISK_TEXT_FIELDS, NIST_CONTROL_TEXT_FIELDS, PREDEFINED_RISKS_XLSX,
+                       SHEET_PREDEFINED_RISKS)
+from .prompt_cache import frame_markdown
+from .relevance import Bm25Ranker, RiskControlLinks, bm25_ranker, risk_control_links, row_texts
+
+logger = logging.getLogger("uvicorn")
+
+PROMPT_RISK_TOP_K = int(os.getenv("PROMPT_RISK_TOP_K") or "20")
+PROMPT_CONTROL_TOP_K = int(os.getenv("PROMPT_CONTROL_TOP_K") or "25")
+# Share of requests whose prompts are re-sent with the whole catalog to measure the prefilter's recall
+# (an extra full-size LLM call each, so off unless set)
+PREFILTER_RECALL_SAMPLE = float(os.getenv("PREFILTER_RECALL_SAMPLE") or "0")
+
+# Columns of the risk library shown to the model
+RISK_PROMPT_COLUMNS = ["RISK ID", "RISK NAME", "MITIGATION", "TARGET_DATE"]
+
+# Header names (lowercased) that hold a control's catalog code, and the text the links match for each
+CONTROL_CODE_COLUMNS = ("code", "control id")
+CONTROL_LINK_FIELDS = {"code": AI_CONTROL_TEXT_FIELDS, "control id": NIST_CONTROL_TEXT_FIELDS}
+
+_audits: Set[asyncio.Future] = set()
+
+
+@dataclass
+class Prefiltered:
+    """
+    Catalog rows sent to the model, in sheet order (``catalog``: the entry they were taken from, if any;
+    ``linked``: IDs the risk/control links pointed at, sent or not).
+    """
+    label: str
+    frame: pd.DataFrame
+    ids: List[str]
+    total: int
+    catalog: Optional[CatalogEntry] = None
+    linked: List[str] = field(default_factory=list)
+
+    @property
+    def markdown(self) -> str:
+        return frame_markdown(self.frame, self.catalog)
+
+    def log_coverage(self, picked_ids: Iterable[str]) -> List[str]:
+        """Log the picked IDs that were not candidates and the linked IDs left out; returns the former."""
+        if len(self.ids) >= self.total:
+            return []
+        sent = set(self.ids)
+        picked = list(dict.fromkeys(str(p).strip() for p in picked_ids if str(p or "").strip()))
+        outside = [p for p in picked if p not in sent]
+        cut = [c for c in self.linked if c not in sent]
+        logger.info(f"{self.label} prefilter: sent {len(self.ids)}/{self.total}; "
+                    f"{len(outside)}/{len(picked)} picked IDs were not candidates{_listed(outside)}"
+                    + (f"; {len(cut)}/{len(self.linked)} linked IDs cut at top-k{_listed(cut)}" if self.linked else ""))
+        return outside
+
+    def log_recall(self, reference_ids: Iterable[str]) -> Optional[float]:
+        """Log the share of ``reference_ids`` (picked from the whole catalog) that were among the candidates."""
+        picked = list(dict.fromkeys(str(p).strip() for p in reference_ids if str(p or "").strip()))
+        if not picked:
+            logger.info(f"{self.label} prefilter: sent {len(self.ids)}/{self.total}; "
+                        f"model picked none from the whole catalog")
+            return None
+        sent = set(self.ids)
+        hits = sum(1 for p in picked if p in sent)
+        recall = hits / len(picked)
+        logger.info(f"{self.label} prefilter: sent {len(self.ids)}/{self.total}; {hits}/{len(picked)} IDs "
+                    f"picked from the whole catalog were candidates (recall {recall:.2f})")
+        return recall
+
+
+def _listed(ids: Sequence[str], limit: int = 10) -> str:
+    return f" ({', '.join(ids[:limit])}{', ...' if len(ids) > limit else ''})" if ids else ""
+
+
+def audit_recall(candidates: Prefiltered, reference: Callable[[], Awaitable[Iterable[str]]],
+                 sample: float = PREFILTER_RECALL_SAMPLE) -> Optional[asyncio.Future]:
+    """
+    For a ``sample`` share of the calls, run ``reference()`` (the same prompt with the whole catalog,
+    returning the IDs the model picked) in the background and log the recall of ``candidates``.
+    """
+    if len(candidates.ids) >= candidates.total or random.random() >= sample:
+        return None
+
+    async def run() -> None:
+        try:
+            candidates.log_recall(await reference())
+        except Exception as e:
+            logger.warning(f"{candidates.label} prefilter recall check failed: {e}")
+
+    task = asyncio.ensure_future(run())
+    _audits.add(task)
+    task.add_done_callback(_audits.discard)
+    return task
+
+
+def _keep(label: str, frame: pd.DataFrame, positions: Sequence[int], id_col: Optional[str],
+          catalog: Optional[CatalogEntry], linked: Sequence[str] = ()) -> Prefiltered:
+    sub = frame.iloc[sorted(set(positions))]
+    ids = [str(v).strip() for v in sub[id_col].tolist()] if id_col else []
+    return Prefiltered(label, sub, ids, len(frame), catalog, list(linked))
+
+
+def prefilter_risks(summary: str, k: int = PROMPT_RISK_TOP_K) -> Prefiltered:
+    """Top-k predefined risks for the summary (the whole library if k <= 0 or nothing matches)."""
+    entry = load_catalog(PREDEFINED_RISKS_XLSX, 0, normalized=False)
+    library = entry.frame[RISK_PROMPT_COLUMNS]
+    positions: List[int] = list(range(len(library)))
+    if k > 0 and summary:
+        ranked = bm25_ranker(load_catalog(PREDEFINED_RISKS_XLSX, SHEET_PREDEFINED_RISKS),
+                             AI_RISK_TEXT_FIELDS).top_k(summary, k)
+        if ranked:
+            positions = [row for row, _ in ranked]
+    return _keep("Risk", library, positions, "RISK ID", entry)
+
+
+def _control_links(catalog: CatalogEntry, code_col: str) -> RiskControlLinks:
+    """Links from the predefined risk library to the controls of ``catalog`` (any control sheet)."""
+    fields = CONTROL_LINK_FIELDS.get(code_col) or [c for c in catalog.frame.columns if c != code_col]
+    return risk_control_links(load_catalog(PREDEFINED_RISKS_XLSX, SHEET_PREDEFINED_RISKS), AI_RISK_TEXT_FIELDS,
+                              "risk id", catalog, fields, code_col)
+
+
+def prefilter_controls(controls_df: pd.DataFrame, risk_matrix: str, risk_ids: Sequence[str],
+                       k: int = PROMPT_CONTROL_TOP_K, catalog: Optional[CatalogEntry] = None) -> Prefiltered:
+    """
+    Top-k controls for the identified risks: their linked controls first (best link of every
+    risk, then second best, ...), then the best BM25 matches for the risk matrix text.
+    ``catalog`` is the normalized catalog entry of the sheet ``controls_df`` was read from; the
+    links and the BM25 index are built once per version of it (without one, e.g. for the built-in
+    default controls, there are no links and the index is built for the call).
+    """
+    lower = {str(c).strip().lower(): c for c in controls_df.columns}
+    code_col = next((lower[c] for c in CONTROL_CODE_COLUMNS if c in lower), None)
+    if k <= 0 or len(controls_df) <= k:
+        return _keep("Control", controls_df, range(len(controls_df)), code_col, catalog)
+
+    chosen: List[int] = []
+    linked_codes: List[str] = []
+    if catalog is not None and code_col is not None and risk_ids:
+        code_pos = {}
+        for pos, code in enumerate(controls_df[code_col].astype(str).str.strip()):
+            code_pos.setdefault(code, pos)
+        links = _control_links(catalog, str(code_col).strip().lower())
+        linked = [[links.control_ids[j] for j, _ in (links.controls_for_risk(rid) or [])] for rid in risk_ids]
+        for rank in range(max((len(codes) for codes in linked), default=0)):
+            for codes in linked:
+                pos = code_pos.get(codes[rank]) if rank < len(codes) else None
+                if pos is not None and pos not in chosen:
+                    chosen.append(pos)
+                    linked_codes.append(codes[rank])
+
+    if len(chosen) < k:
+        if catalog is not None:
+            ranker = bm25_ranker(catalog, list(catalog.frame.columns))
+        else:
+            ranker = Bm25Ranker(row_texts(controls_df, list(controls_df.columns)))
+        for pos, _ in ranker.top_k(risk_matrix or "", None):
+            if pos not in chosen:
+                chosen.append(pos)
+            if len(chosen) >= k:
+                break
+
+    return _keep("Control", controls_df, chosen[:k] or range(len(controls_df)), code_col, catalog, linked_codes)
+
+
+def merge_prefiltered(parts: Sequence[Prefiltered]) -> Prefiltered:
+    """Union of several candidate sets drawn from the same sheet (sheet order kept)."""
+    frame = pd.concat([p.frame for p in parts])
+    frame = frame[~frame.index.duplicated()].sort_index()
+    return Prefiltered(parts[0].label, frame, list(dict.fromkeys(chain.from_iterable(p.ids for p in parts))),
+                       parts[0].total, parts[0].catalog,
+                       list(dict.fromkeys(chain.from_iterable(p.linked for p in parts))))
@@ -0,0 +1,112 @@
+# agents/prompt_cache.py
+"""
+LLM system prompts with a fixed prefix, and cached catalog markdown.
+
+The provider's automatic prompt caching only reuses an identical prefix of
+at least 1024 tokens. ``system_messages`` sends a template's fixed
+instructions first and the catalog rows of the request after them, so which
+mode gets cache hits depends on the catalog message:
+
+- default (PROMPT_RISK_TOP_K / PROMPT_CONTROL_TOP_K > 0): the prefiltered rows
+  differ per request and the instructions alone (~250 tokens) are below the
+  minimum, so nothing is served from the provider cache; the prompts are
+  smaller instead.
+- PROMPT_*_TOP_K <= 0: the catalog message is the whole catalog, identical
+  for every request per catalog version, and the system prefix is cacheable.
+
+Rendering catalog rows with ``DataFrame.to_markdown`` is the expensive part of
+building a prompt. ``frame_markdown`` memoizes it by the catalog path and
+version the rows were taken from plus which rows and columns they are, so
+nothing is hashed per request.
+
+Every system prefix sent (instructions plus catalog message) has a short
+fingerprint. Those sent inside a ``track_prompts()`` scope are recorded, and
+``prompt_fingerprint`` combines them into the value returned with the
+response: two responses with the same fingerprint sent the same prefixes,
+so provider cache hits and misses can be lined up with them.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Callable, Dict, Generic, Iterable, List, Optional, TypeVar
+
+import pandas as pd
+
+from .catalog import CatalogEntry
+
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE") or "512")
+
+V = TypeVar("V")
+
+_tracked: ContextVar[Optional[List[str]]] = ContextVar("prompt_fingerprints", default=None)
+
+
+class _Lru(Generic[V]):
+    def __init__(self, size: int) -> None:
+        self.size = size
+        self._items: "OrderedDict[str, V]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: str, build: Callable[[], V]) -> V:
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        value = build()
+        with self._lock:
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+        return value
+
+
+_markdown: _Lru[str] = _Lru(PROMPT_CACHE_SIZE)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def frame_key(entry: CatalogEntry, frame: pd.DataFrame) -> str:
+    """The catalog ``frame`` was taken from (path and version) and which of its rows and columns it holds."""
+    return f"{entry.path}@{entry.version}:{list(frame.columns)!r}:{frame.index.tolist()!r}"
+
+
+def frame_markdown(frame: pd.DataFrame, entry: Optional[CatalogEntry] = None) -> str:
+    """
+    ``frame.to_markdown(index=False)`` for rows of the catalog ``entry`` (index = sheet row positions),
+    rendered once per catalog version and selection. Frames of no catalog are rendered per call.
+    """
+    if entry is None:
+        return frame.to_markdown(index=False)
+    return _markdown.get_or_build(frame_key(entry, frame), lambda: frame.to_markdown(index=False))
+
+
+def system_messages(instructions: str, catalog: str) -> List[Dict[str, str]]:
+    """
+    The system messages of a prompt: its fixed ``instructions``, then ``catalog``, the catalog rows
+    of this request. The fingerprint of the pair is recorded for ``prompt_fingerprint``.
+    """
+    tracked = _tracked.get()
+    if tracked is not None:
+        tracked.append(_digest(f"{instructions}\0{catalog}")[:16])
+    return [{"role": "system", "content": instructions}, {"role": "system", "content": catalog}]
+
+
+def track_prompts() -> List[str]:
+    """Start recording the fingerprints of the prompts used by the current request."""
+    tracked: List[str] = []
+    _tracked.set(tracked)
+    return tracked
+
+
+def prompt_fingerprint(fingerprints: Iterable[str]) -> Optional[str]:
+    """One fingerprint for the set of prompts a response was built from (None if there were none)."""
+    unique = sorted(set(fingerprints))
+    if not unique:
+        return None
+    return unique[0] if len(unique) == 1 else _digest("\n".join(unique))[:16]
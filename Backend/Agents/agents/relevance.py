@@ -0,0 +1,310 @@
+# agents/relevance.py
+"""
+Summary-to-catalog relevance.
+
+Indexes are built once per catalog version (memoized on the ``CatalogEntry``),
+so a request only touches the postings of the tokens in its summary instead of
+scanning every row. Rows are ranked with BM25 and the best ``k`` are picked
+with a bounded heap. Batches of summaries are scored in one sparse
+matrix product (``Bm25Matrix.score_many``) with the same weights.
+``RiskControlLinks`` precomputes which controls are most similar to each risk.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import re
+from collections import Counter
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from .catalog import CatalogEntry
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+MIN_TOKEN_LEN = 4  # same cut-off as the old `len(w) > 3` keyword filter
+
+# Standard Okapi BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Controls kept per risk (and risks per control) in the risk/control similarity index
+LINK_TOP_K = int(os.getenv("RISK_CONTROL_LINK_TOP_K") or "10")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased alphanumeric tokens of at least MIN_TOKEN_LEN characters."""
+    return [t for t in _TOKEN_RE.findall(str(text or "").lower()) if len(t) >= MIN_TOKEN_LEN]
+
+
+def row_texts(df: pd.DataFrame, fields: Sequence[str]) -> List[str]:
+    """Concatenate the given columns (those present in ``df``) into one text per row."""
+    cols = [df[c].astype(str).tolist() for c in fields if c in df.columns]
+    if not cols:
+        return [""] * len(df)
+    return [" ".join(parts) for parts in zip(*cols)]
+
+
+class Bm25Ranker:
+    """
+    Okapi BM25 over catalog rows. Each posting stores its precomputed per-row weight
+    idf(t) * tf*(k1+1) / (tf + k1*(1-b+b*dl/avgdl)), so scoring a summary is a sum over
+    the postings of its distinct tokens.
+    """
+
+    def __init__(self, docs: Sequence[str], k1: float = BM25_K1, b: float = BM25_B):
+        term_freqs: List[Counter] = [Counter(tokenize(text)) for text in docs]
+        lengths = [sum(tf.values()) for tf in term_freqs]
+        n_docs = len(docs)
+        avgdl = (sum(lengths) / n_docs) if n_docs else 0.0
+
+        df_counts: Counter = Counter()
+        for tf in term_freqs:
+            df_counts.update(tf.keys())
+        self.idf: Dict[str, float] = {
+            t: math.log(1.0 + (n_docs - n + 0.5) / (n + 0.5)) for t, n in df_counts.items()
+        }
+
+        postings: Dict[str, List[Tuple[int, float]]] = {}
+        for row, tf in enumerate(term_freqs):
+            norm = k1 * (1.0 - b + b * (lengths[row] / avgdl)) if avgdl else k1
+            for t, f in tf.items():
+                postings.setdefault(t, []).append((row, self.idf[t] * f * (k1 + 1.0) / (f + norm)))
+        self.postings: Dict[str, Tuple[Tuple[int, float], ...]] = {t: tuple(p) for t, p in postings.items()}
+        self.n_docs = n_docs
+        self.avgdl = avgdl
+
+    def score(self, query: str) -> Dict[int, float]:
+        """row -> BM25 score (rows without any query token are omitted)."""
+        scores: Dict[int, float] = {}
+        for tok in sorted(set(tokenize(query))):  # fixed order keeps float sums reproducible
+            for row, w in self.postings.get(tok, ()):
+                scores[row] = scores.get(row, 0.0) + w
+        return scores
+
+    def top_k(self, query: str, k: Optional[int] = None, min_score: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Best ``k`` (row, score) pairs, highest first; ties keep sheet order. k=None ranks every match."""
+        items = self.score(query).items()
+        if min_score is not None:
+            items = [(row, s) for row, s in items if s >= min_score]
+        key = lambda it: (it[1], -it[0])
+        if k is None:
+            return sorted(items, key=key, reverse=True)
+        return heapq.nlargest(k, items, key=key)
+
+
+def bm25_ranker(entry: CatalogEntry, fields: Sequence[str]) -> Bm25Ranker:
+    fields = tuple(fields)
+    return entry.memo(("bm25", fields), lambda: Bm25Ranker(row_texts(entry.frame, fields)))
+
+
+class Bm25Matrix:
+    """
+    The ranker's precomputed BM25 weights as a sparse (rows x terms) CSR matrix.
+    ``score_many`` scores N summaries with a single product Q(N x terms) @ D.T,
+    giving exactly the scores ``Bm25Ranker.score`` would for each summary.
+    """
+
+    def __init__(self, ranker: Bm25Ranker):
+        self.vocab: Dict[str, int] = {t: j for j, t in enumerate(sorted(ranker.postings))}
+        rows: List[int] = []
+        cols: List[int] = []
+        vals: List[float] = []
+        for t, plist in ranker.postings.items():
+            j = self.vocab[t]
+            for row, w in plist:
+                rows.append(row)
+                cols.append(j)
+                vals.append(w)
+        self.n_docs = ranker.n_docs
+        self.matrix = sparse.csr_matrix(
+            (np.asarray(vals, dtype=np.float64), (rows, cols)),
+            shape=(self.n_docs, len(self.vocab)),
+        )
+
+    def query_matrix(self, summaries: Sequence[str]) -> sparse.csr_matrix:
+        """Binary (summaries x terms) indicator matrix of each summary's distinct known tokens."""
+        indptr = [0]
+        indices: List[int] = []
+        for text in summaries:
+            cols = sorted({self.vocab[t] for t in tokenize(text) if t in self.vocab})
+            indices.extend(cols)
+            indptr.append(len(indices))
+        data = np.ones(len(indices), dtype=np.float64)
+        return sparse.csr_matrix((data, indices, indptr), shape=(len(summaries), len(self.vocab)))
+
+    def score_many(self, summaries: Sequence[str]) -> sparse.csr_matrix:
+        """Sparse (summaries x rows) BM25 score matrix; a missing entry means no shared token."""
+        return (self.query_matrix(summaries) @ self.matrix.T).tocsr()
+
+    @staticmethod
+    def top_k_row(scores: sparse.csr_matrix, i: int, k: Optional[int] = None,
+                  min_score: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Best ``k`` (row, score) pairs of row ``i`` of a ``score_many`` result, highest first."""
+        lo, hi = scores.indptr[i], scores.indptr[i + 1]
+        rows, vals = scores.indices[lo:hi], scores.data[lo:hi]
+        if min_score is not None:
+            mask = vals >= min_score
+            rows, vals = rows[mask], vals[mask]
+        order = np.lexsort((rows, -vals))  # score desc, then sheet order
+        if k is not None:
+            order = order[:k]
+        return [(int(rows[j]), float(vals[j])) for j in order]
+
+    def top_k_many(self, summaries: Sequence[str], k: Optional[int] = None,
+                   min_score: Optional[float] = None) -> List[List[Tuple[int, float]]]:
+        """``Bm25Ranker.top_k`` for every summary, computed from one ``score_many`` product."""
+        scores = self.score_many(summaries)
+        return [self.top_k_row(scores, i, k, min_score) for i in range(scores.shape[0])]
+
+
+def bm25_matrix(entry: CatalogEntry, fields: Sequence[str]) -> Bm25Matrix:
+    fields = tuple(fields)
+    return entry.memo(("bm25_matrix", fields), lambda: Bm25Matrix(bm25_ranker(entry, fields)))
+
+
+def score_many(entry: CatalogEntry, fields: Sequence[str], summaries: Sequence[str]) -> sparse.csr_matrix:
+    """Score a batch of summaries against one catalog in a single sparse product."""
+    return bm25_matrix(entry, fields).score_many(summaries)
+
+
+# ---------- Risk <-> control similarity ----------
+def _tfidf_rows(docs: Sequence[str], vocab: Dict[str, int], idf: np.ndarray) -> sparse.csr_matrix:
+    """L2-normalized TF-IDF rows over a fixed vocabulary."""
+    indptr = [0]
+    indices: List[int] = []
+    data: List[float] = []
+    for text in docs:
+        tf = sorted(Counter(vocab[t] for t in tokenize(text) if t in vocab).items())
+        cols = [j for j, _ in tf]
+        vals = [n * idf[j] for j, n in tf]
+        norm = math.sqrt(sum(v * v for v in vals)) or 1.0
+        indices.extend(cols)
+        data.extend(v / norm for v in vals)
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.asarray(data, dtype=np.float64), indices, indptr), shape=(len(docs), len(vocab)))
+
+
+def _top_k_per_row(sim: sparse.csr_matrix, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(n_rows x k) int32 column indices (-1 padded) and float32 scores of each row's best columns."""
+    idx = np.full((sim.shape[0], k), -1, dtype=np.int32)
+    val = np.zeros((sim.shape[0], k), dtype=np.float32)
+    for i in range(sim.shape[0]):
+        lo, hi = sim.indptr[i], sim.indptr[i + 1]
+        cols, vals = sim.indices[lo:hi], sim.data[lo:hi]
+        order = np.lexsort((cols, -vals))[:k]
+        idx[i, :len(order)] = cols[order]
+        val[i, :len(order)] = vals[order]
+    return idx, val
+
+
+def _first_rows(ids: Sequence[str]) -> Dict[str, int]:
+    """id -> first row carrying it (blank ids skipped)."""
+    rows: Dict[str, int] = {}
+    for i, v in enumerate(ids):
+        if v:
+            rows.setdefault(v, i)
+    return rows
+
+
+def _ranked(edges: Dict[int, float]) -> List[Tuple[int, float]]:
+    return sorted(edges.items(), key=lambda e: (-e[1], e[0]))
+
+
+class RiskControlLinks:
+    """
+    Cosine similarity (TF-IDF over the catalog text columns) between every risk and every
+    control, kept compactly as each risk's top-k controls and each control's top-k risks.
+    Linking a request's risks to controls reads only the top-k rows of those risks.
+
+    The same top-k lists also form a bipartite coverage index: a (risk, control) pair is an
+    edge when either side ranks the other in its top-k, and ``controls_for_risk`` /
+    ``risks_for_control`` answer from precomputed adjacency lists with a dict lookup.
+    """
+
+    def __init__(self, risk_ids: Sequence[str], risk_docs: Sequence[str],
+                 control_ids: Sequence[str], control_docs: Sequence[str], k: int):
+        n_docs = len(risk_docs) + len(control_docs)
+        doc_freq: Counter = Counter()
+        for text in list(risk_docs) + list(control_docs):
+            doc_freq.update(set(tokenize(text)))
+        vocab = {t: j for j, t in enumerate(sorted(doc_freq))}
+        idf = np.array([math.log((1.0 + n_docs) / (1.0 + doc_freq[t])) + 1.0 for t in sorted(doc_freq)])
+
+        sim = (_tfidf_rows(risk_docs, vocab, idf) @ _tfidf_rows(control_docs, vocab, idf).T).tocsr()
+        sim.eliminate_zeros()
+        self.risk_top, self.risk_top_scores = _top_k_per_row(sim, k)
+        self.control_top, self.control_top_scores = _top_k_per_row(sim.T.tocsr(), k)
+
+        self.risk_ids = [str(r).strip() for r in risk_ids]
+        self.control_ids = [str(c).strip() for c in control_ids]
+        self.risk_row = _first_rows(self.risk_ids)
+        self.control_row = _first_rows(self.control_ids)
+        self.k = k
+
+        # Coverage adjacency: risk row -> [(control row, score)] and back, best first.
+        risk_edges: Dict[int, Dict[int, float]] = {}
+        control_edges: Dict[int, Dict[int, float]] = {}
+        for (tops, scores, fwd, rev) in ((self.risk_top, self.risk_top_scores, risk_edges, control_edges),
+                                         (self.control_top, self.control_top_scores, control_edges, risk_edges)):
+            for i in range(tops.shape[0]):
+                for j, sc in zip(tops[i], scores[i]):
+                    if j >= 0:
+                        fwd.setdefault(i, {})[int(j)] = float(sc)
+                        rev.setdefault(int(j), {})[i] = float(sc)
+        self._risk_edges = {i: _ranked(e) for i, e in risk_edges.items()}
+        self._control_edges = {j: _ranked(e) for j, e in control_edges.items()}
+
+    def controls_for_risk(self, risk_id: str) -> Optional[List[Tuple[int, float]]]:
+        """(control row, similarity) of the controls covering a risk, best first; None if the id is unknown."""
+        row = self.risk_row.get(str(risk_id).strip())
+        return None if row is None else self._risk_edges.get(row, [])
+
+    def risks_for_control(self, control_id: str) -> Optional[List[Tuple[int, float]]]:
+        """(risk row, similarity) of the risks a control covers, best first; None if the id is unknown."""
+        row = self.control_row.get(str(control_id).strip())
+        return None if row is None else self._control_edges.get(row, [])
+
+    def related_risks(self, risk_ids: Sequence[str], per_control: int = 1) -> Dict[int, List[str]]:
+        """
+        control row -> up to ``per_control`` of the given risk ids, most similar first. Only the
+        top-k controls of each given risk are considered, so the cost is O(len(risk_ids) * k);
+        controls outside all of those lists (and ids not in the catalog) are left out.
+        """
+        buckets: Dict[int, List[Tuple[float, int, str]]] = {}
+        for order, rid in enumerate(dict.fromkeys(r for r in risk_ids if r)):
+            row = self.risk_row.get(rid)
+            if row is None:
+                continue
+            for c, sc in zip(self.risk_top[row], self.risk_top_scores[row]):
+                if c >= 0:
+                    buckets.setdefault(int(c), []).append((-float(sc), order, rid))
+        return {c: [rid for _, _, rid in sorted(cands)[:per_control]] for c, cands in buckets.items()}
+
+
+def risk_control_links(risk_entry: CatalogEntry, risk_fields: Sequence[str], risk_id_col: str,
+                       control_entry: CatalogEntry, control_fields: Sequence[str], control_id_col: str,
+                       k: int = LINK_TOP_K) -> RiskControlLinks:
+    """Links for the current versions of a risk catalog and a control catalog (rebuilt when either changes)."""
+    key = ("risk_control_links", tuple(risk_fields), risk_id_col, str(control_entry.path),
+           control_entry.sheet, tuple(control_fields), control_id_col, k)
+
+    def build() -> Tuple[str, RiskControlLinks]:
+        rdf, cdf = risk_entry.frame, control_entry.frame
+        return control_entry.digest, RiskControlLinks(
+            rdf[risk_id_col].tolist() if risk_id_col in rdf.columns else [""] * len(rdf),
+            row_texts(rdf, risk_fields),
+            cdf[control_id_col].tolist() if control_id_col in cdf.columns else [""] * len(cdf),
+            row_texts(cdf, control_fields),
+            k,
+        )
+
+    digest, links = risk_entry.memo(key, build)
+    if digest != control_entry.digest:
+        # Control catalog changed since these links were built: replace them.
+        risk_entry.forget(key)
+        digest, links = risk_entry.memo(key, build)
+    return links
@@ -3,18 +3,24 @@ from __future__ import annotations
 # ----------------- STD / 3rd-party imports -----------------
 import os
 import json
-import asyncio
 import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict, Any, Optional, Literal
+from typing import Callable, List, Dict, Any, Optional, Literal
 
-import openai
 import pandas as pd
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 
 # ----------------- Local imports -----------------
+from .catalog import load_catalog, read_catalog
+from .llm import chat_completion
+from .prompt_cache import system_messages
+from .singleflight import single_flight
+from .llm_cache import llm_cache
+from .id_output import LLM_OUTPUT_MODE
+from .control_fanout import CONTROL_MAPPING_MODE
+from .assessment_pipeline import AssessmentPipeline
 # For Section A (Deterministic)
 # Note: These constants are used by the deterministic path only.
 from .utils import RISK_LIST, BASE_SEVERITY, MITIGATION, TARGET_DATE
@@ -89,9 +95,7 @@ COLS_AI_CONTROLS = {"control_id": "code", "section": "section", "title": "contro
 COLS_NIST_CONTROLS = {"control_id": "control id", "family": "family", "title": "control name", "description": "control description"}
 
 def _read(path: Path, sheet: str) -> pd.DataFrame:
-    df = pd.read_excel(path, sheet_name=sheet, dtype=str).fillna("")
-    df.columns = [c.strip().lower() for c in df.columns]
-    return df
+    return read_catalog(path, sheet)
 
 def _records(df: pd.DataFrame) -> List[dict]:
     return df.to_dict(orient="records")
@@ -145,7 +149,6 @@ def process_questionnaire_api(payload: QuestionnaireIn):
 #   - Uses standard logging.
 # =============================================================================
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
 logger = logging.getLogger("uvicorn")
 
 class RiskControlIn(BaseModel):
@@ -153,6 +156,11 @@ class RiskControlIn(BaseModel):
     session_id: str
     project_id: str | None = None
     controls_path: str = "predefined_controls.xlsx"
+    # "ids": the LLM returns only catalog IDs + generated fields; the rest is filled from the catalogs
+    # "json": schema-constrained JSON rows instead of markdown tables
+    output_mode: Literal["table", "ids", "json"] = LLM_OUTPUT_MODE
+    # "per_risk": one concurrent control-mapping prompt per risk group instead of a single prompt
+    control_mapping: Literal["single", "per_risk"] = CONTROL_MAPPING_MODE
 
 class RiskOut(BaseModel):
     risk_id: str
@@ -184,14 +192,20 @@ class RiskControlOut(BaseModel):
     parsed_risks: List[RiskOut]
     parsed_controls: List[ControlOut]
     stored_in_db: bool = False
+    # Fingerprint of the system prompts used (for provider prompt-cache diagnostics)
+    prompt_fingerprint: str | None = None
+
+def _controls_file(path: str) -> Path:
+    return (BASE / path).resolve() if not os.path.isabs(path) else Path(path)
 
 def load_predefined_controls(path: str) -> Optional[pd.DataFrame]:
     try:
-        controls_path = (BASE / path).resolve() if not os.path.isabs(path) else Path(path)
+        controls_path = _controls_file(path)
         if not controls_path.exists():
             logger.warning(f"Controls file not found: {controls_path}. Using default controls.")
             return create_default_controls()
-        controls_df = pd.read_excel(controls_path)
+        # Parsed once per file version by the catalog cache (not re-read per request)
+        controls_df = load_catalog(controls_path, 0, normalized=False).frame
         logger.info("✅ Successfully loaded predefined controls from Excel.")
         return controls_df
     except Exception as e:
@@ -206,99 +220,40 @@ def create_default_controls() -> pd.DataFrame:
     ]
     return pd.DataFrame(default_controls)
 
-# --- MODIFIED: Risk Parsing Function (Preserves Predefined IDs) ---
-def parse_markdown_table(table_content: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
-    """Parse markdown table and extract individual risks using predefined IDs from the LLM response."""
-    risks = []
-    lines = table_content.strip().split('\n')
-    data_lines = [line for line in lines if line.strip() and '|' in line and not line.startswith('|--')]
-    if len(data_lines) > 1: data_lines = data_lines[1:]
-
-    for line in data_lines:
-        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-        if len(cells) >= 7:
-            # KEY CHANGE: The first column is the predefined Risk ID, provided by the LLM.
-            # This preserves the link to the canonical risk library.
-            risk_id = cells[0]
-            risk = {
-                'risk_id': risk_id,
-                'risk_assessment_id': risk_assessment_id,
-                'risk_name': cells[1],
-                'risk_owner': cells[2],
-                'severity': int(cells[3]) if cells[3].isdigit() else 3,
-                'justification': cells[4],
-                'mitigation': cells[5],
-                'target_date': cells[6]
-            }
-            risks.append(risk)
-    return risks
-
-# --- MODIFIED: Control Parsing Function (Simplified & More Robust) ---
-def parse_control_table(table_content: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
-    """Parse control matrix markdown table, including the 'Related Risk' column."""
-    controls = []
-    lines = table_content.strip().split('\n')
-    data_lines = [line for line in lines if line.strip() and '|' in line and '---' not in line]
-    if len(data_lines) > 1: data_lines = data_lines[1:]
-
-    for idx, line in enumerate(data_lines):
-        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-        if len(cells) >= 7:
-            # KEY CHANGE: The 7th column is the 'Related Risk', provided by the LLM.
-            # This is more reliable than keyword matching.
-            control_id = f"CTRL-{risk_assessment_id}-{idx+1:03d}"
-            control = {
-                'control_id': control_id,
-                'risk_assessment_id': risk_assessment_id,
-                'code': cells[0], 'section': cells[1], 'control': cells[2],
-                'requirements': cells[3], 'status': cells[4], 'tickets': cells[5],
-                'related_risk': cells[6]
-            }
-            controls.append(control)
-    return controls
-
 # --- MODIFIED: Risk Generation Prompt (Instructs LLM to provide the ID) ---
-async def generate_risk_matrix(summary: str) -> str:
+async def generate_risk_matrix(summary: str, risk_library: str = PREDEFINED_RISKS_MARKDOWN,
+                               on_delta: Optional[Callable[[str], None]] = None) -> str:
     """Generate risk matrix using OpenAI, ensuring the predefined Risk ID is returned."""
-    system_prompt = f"""
+    # Fixed instructions first, then this request's library rows (see agents/prompt_cache.py)
+    messages = system_messages("""
 You are a risk analysis expert. Your task is to identify applicable risks from a predefined library based on a user's summary.
 
 1.  **Analyze the summary** to understand the project context.
-2.  **Refer to the official risk library below** to select relevant risks. You MUST use the exact `RISK ID` and `RISK NAME` from this library.
+2.  **Refer to the official risk library in the next message** to select relevant risks. You MUST use the exact `RISK ID` and `RISK NAME` from this library.
 3.  For each applicable risk, assign an OWNER, a SEVERITY (1-5), and a brief justification.
 
-**Official Risk Library:**
-{PREDEFINED_RISKS_MARKDOWN}
-
 Output ONLY a Markdown table with the following columns. The `Risk ID` column is MANDATORY.
 | Risk ID | Risk | Owner | Severity | Justification | Mitigation | Target Date |
 Do not add any introductory text.
-"""
+""", f"**Official Risk Library:**\n{risk_library}")
     try:
-        resp = await asyncio.to_thread(
-            openai.chat.completions.create,
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": summary}],
-            temperature=0.5, max_tokens=1000,
+        return await chat_completion(
+            messages + [{"role": "user", "content": summary}],
+            temperature=0.5, max_tokens=1000, on_delta=on_delta,
         )
-        return resp.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"Error generating risk matrix: {e}", exc_info=True)
         raise HTTPException(500, f"Error generating risk matrix: {str(e)}")
 
 # --- MODIFIED: Control Generation Prompt (Instructs LLM to map risks) ---
-async def generate_control_matrix(risk_matrix: str, controls_df: pd.DataFrame) -> str:
+async def generate_control_matrix(risk_matrix: str, controls_markdown: str) -> str:
     """Generate control matrix using OpenAI, instructing it to link controls to risks."""
-    controls_markdown = controls_df.to_markdown(index=False)
-    system_prompt = f"""
+    messages = system_messages("""
 You are an expert Control Assessment Agent for AI systems.
 Your task is to analyze an incoming risk matrix and map appropriate controls to each identified risk.
 
 1.  **Analyze the Input**: The user will provide a risk matrix in markdown format.
-2.  **Use Predefined Controls**: You MUST select relevant controls from the official list provided below. Do not invent new controls.
-
-**Official Control List:**
-{controls_markdown}
+2.  **Use Predefined Controls**: You MUST select relevant controls from the official list provided in the next message. Do not invent new controls.
 
 3.  **Generate Control Matrix**: For each risk in the input matrix, create a corresponding entry in a new control matrix.
    - Select the most appropriate control(s) from the Official Control List.
@@ -309,21 +264,33 @@ Your task is to analyze an incoming risk matrix and map appropriate controls to
 4.  **Format**: Return a single markdown table with these exact columns:
    `CODE | SECTION | CONTROL | REQUIREMENTS | STATUS | TICKETS | Related Risk`
 Do not add any prefix text.
-"""
+""", f"**Official Control List:**\n{controls_markdown}")
     try:
-        resp = await asyncio.to_thread(
-            openai.chat.completions.create,
-            model="gpt-4o-mini",
-            messages=[{"role": "system", "content": system_prompt}, {"role": "user", "content": f"Please perform a control assessment based on the following risk matrix:\n\n{risk_matrix}"}],
+        return await chat_completion(
+            messages + [{"role": "user", "content": f"Please perform a control assessment based on the following risk matrix:\n\n{risk_matrix}"}],
             temperature=0.3, max_tokens=1000,
         )
-        return resp.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"Error generating control matrix: {e}", exc_info=True)
         raise HTTPException(500, f"Error generating control matrix: {str(e)}")
 
+# Modes, parsing, LLM output cache and streaming are shared with risk_matrix_agent
+PIPELINE = AssessmentPipeline(
+    cache_namespace="risk_control_agent",
+    generate_risk_matrix=generate_risk_matrix,
+    generate_control_matrix=generate_control_matrix,
+    load_controls=load_predefined_controls,
+    controls_file=_controls_file,
+    related_risk_names=True,
+)
+
+@router.get("/cache/stats")
+def llm_cache_stats():
+    return llm_cache.stats()
+
 # --- MODIFIED: Main LLM Endpoint (Uses standard logging) ---
 @router.post("/", response_model=RiskControlOut)
+@single_flight()
 async def run_risk_control_assessment(payload: RiskControlIn):
     """
     LLM-driven endpoint that generates both risk and control assessments.
@@ -335,38 +302,33 @@ async def run_risk_control_assessment(payload: RiskControlIn):
 
     try:
         logger.info(f"control assessment for session: {session_id}")
-        risk_matrix = await generate_risk_matrix(summary)
-        risk_assessment_id = f"RC-{session_id[:8].upper()}"
-        parsed_risks_data = parse_markdown_table(risk_matrix, risk_assessment_id)
-        logger.info(f"Identified {len(parsed_risks_data)} risks from summary.")
-
-        controls_df = load_predefined_controls(payload.controls_path)
-        if controls_df is None: raise HTTPException(500, "Failed to load controls")
+        assessment = await PIPELINE.assess(payload)
+        logger.info(f"Mapped {len(assessment.controls)} controls to identified risks.")
 
-        control_matrix = await generate_control_matrix(risk_matrix, controls_df)
-        parsed_controls_data = parse_control_table(control_matrix, risk_assessment_id)
-        logger.info(f"Mapped {len(parsed_controls_data)} controls to identified risks.")
-
-        # Create a mapping from risk name to risk ID for efficient lookup.
-        risk_name_to_id_map = {risk['risk_name']: risk['risk_id'] for risk in parsed_risks_data}
-
-        # Replace the 'related_risk' name from the LLM with the corresponding risk_id.
-        for control in parsed_controls_data:
-            risk_name = control.get('related_risk', '')
-            # Use the map to find the ID. Fall back to a formatted string if not found.
-            control['related_risk'] = risk_name_to_id_map.get(risk_name, f"UNMAPPED: {risk_name}")
-
-        parsed_risks = [RiskOut(**risk) for risk in parsed_risks_data]
-        parsed_controls = [ControlOut(**control) for control in parsed_controls_data]
+        parsed_risks = [RiskOut(**risk) for risk in assessment.risks]
+        parsed_controls = [ControlOut(**control) for control in assessment.controls]
         
         logger.info("✅ Assessment complete.")
         return RiskControlOut(
-            session_id=session_id, project_id=payload.project_id, risk_assessment_id=risk_assessment_id,
-            risk_matrix=risk_matrix, control_matrix=control_matrix,
-            parsed_risks=parsed_risks, parsed_controls=parsed_controls, stored_in_db=False
+            session_id=session_id, project_id=payload.project_id, risk_assessment_id=assessment.risk_assessment_id,
+            risk_matrix=assessment.risk_matrix, control_matrix=assessment.control_matrix,
+            parsed_risks=parsed_risks, parsed_controls=parsed_controls, stored_in_db=False,
+            prompt_fingerprint=assessment.prompt_fingerprint
         )
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Critical error in risk-control assessment: {e}", exc_info=True)
-        raise HTTPException(500, f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(500, f"Internal server error: {str(e)}")
+
+# --- Streaming endpoint: control mapping starts while the risk matrix is still being generated ---
+@router.post("/stream")
+async def stream_risk_control_assessment(payload: RiskControlIn):
+    """
+    Same assessment as ``POST /``, streamed as NDJSON events (see agents/assessment_pipeline.py).
+    """
+    if not (payload.summary or "").strip(): raise HTTPException(400, "Summary is required")
+    if not payload.session_id: raise HTTPException(400, "Session ID is required")
+
+    logger.info(f"streamed control assessment for session: {payload.session_id}")
+    return PIPELINE.stream(payload)
@@ -1,20 +1,25 @@
 # agents/risk_control_agent.py
 
 import os
-import openai
+from pathlib import Path
 import pandas as pd
-import asyncio
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 import logging
-from typing import List, Dict, Any, Optional
+from typing import Callable, List, Optional, Literal
 
 # --- UPDATED IMPORT ---
 # Import the new markdown variable and remove unused ones
 from .utils import PREDEFINED_RISKS_MARKDOWN
+from .catalog import load_catalog
+from .llm import chat_completion
+from .prompt_cache import system_messages
+from .singleflight import single_flight
+from .llm_cache import llm_cache
+from .id_output import LLM_OUTPUT_MODE
+from .control_fanout import CONTROL_MAPPING_MODE
+from .assessment_pipeline import AssessmentPipeline
 
-# Load API key
-openai.api_key = os.getenv("OPENAI_API_KEY")
 logger = logging.getLogger("uvicorn")
 
 router = APIRouter()
@@ -25,6 +30,11 @@ class RiskControlIn(BaseModel):
     session_id: str
     project_id: str | None = None
     controls_path: str = "predefined_controls.xlsx"
+    # "ids": the LLM returns only catalog IDs + generated fields; the rest is filled from the catalogs
+    # "json": schema-constrained JSON rows instead of markdown tables
+    output_mode: Literal["table", "ids", "json"] = LLM_OUTPUT_MODE
+    # "per_risk": one concurrent control-mapping prompt per risk group instead of a single prompt
+    control_mapping: Literal["single", "per_risk"] = CONTROL_MAPPING_MODE
 
 class RiskOut(BaseModel):
     risk_id: str
@@ -56,6 +66,8 @@ class RiskControlOut(BaseModel):
     parsed_risks: List[RiskOut]
     parsed_controls: List[ControlOut]
     stored_in_db: bool = False
+    # Fingerprint of the system prompts used (for provider prompt-cache diagnostics)
+    prompt_fingerprint: str | None = None
 
 # --- Control Loading Functions (Unchanged) ---
 def load_predefined_controls(path: str) -> Optional[pd.DataFrame]:
@@ -64,7 +76,8 @@ def load_predefined_controls(path: str) -> Optional[pd.DataFrame]:
             logger.warning(f"Controls file not found: {path}. Using default controls.")
             return create_default_controls()
         
-        controls_df = pd.read_excel(path)
+        # Parsed once per file version by the catalog cache (not re-read per request)
+        controls_df = load_catalog(path, 0, normalized=False).frame
         logger.info("Successfully loaded predefined controls from Excel.")
         return controls_df
     except Exception as e:
@@ -81,119 +94,45 @@ def create_default_controls() -> pd.DataFrame:
     ]
     return pd.DataFrame(default_controls)
 
-# --- UPDATED: Risk Parsing Function ---
-def parse_markdown_table(table_content: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
-    """Parse markdown table and extract individual risks using predefined IDs."""
-    risks = []
-    lines = table_content.strip().split('\n')
-    
-    data_lines = [line for line in lines if line.strip() and '|' in line and not line.startswith('|--')]
-    
-    if len(data_lines) > 1:
-        data_lines = data_lines[1:]
-    
-    for line in data_lines:
-        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-        
-        # Expect 7 columns now, with Risk ID as the first
-        if len(cells) >= 7:
-            # KEY CHANGE: Use the predefined risk ID from the table
-            risk_id = cells[0]
-            
-            risk = {
-                'risk_id': risk_id,
-                'risk_assessment_id': risk_assessment_id,
-                'risk_name': cells[1],
-                'risk_owner': cells[2], 
-                'severity': int(cells[3]) if cells[3].isdigit() else 3,
-                'justification': cells[4],
-                'mitigation': cells[5],
-                'target_date': cells[6]
-            }
-            risks.append(risk)
-    
-    return risks
-
-# --- Control Parsing Function (Unchanged) ---
-def parse_control_table(table_content: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
-    """Parse control matrix markdown table and create individual control objects."""
-    controls = []
-    lines = table_content.strip().split('\n')
-    
-    data_lines = [line for line in lines if line.strip() and '|' in line and '---' not in line]
-
-    if len(data_lines) > 1:
-        data_lines = data_lines[1:]
-    
-    control_counter = 1
-    for line in data_lines:
-        cells = [cell.strip() for cell in line.split('|') if cell.strip()]
-        
-        if len(cells) >= 7:
-            control_id = f"CTRL-{risk_assessment_id}-{control_counter:03d}"
-            control = {
-                'control_id': control_id,
-                'risk_assessment_id': risk_assessment_id,
-                'code': cells[0],
-                'section': cells[1],
-                'control': cells[2], 
-                'requirements': cells[3],
-                'status': cells[4],
-                'tickets': cells[5],
-                'related_risk': cells[6]
-            }
-            controls.append(control)
-            control_counter += 1
-    
-    return controls
-
 # --- UPDATED: Risk Generation Function ---
-async def generate_risk_matrix(summary: str) -> str:
+async def generate_risk_matrix(summary: str, risk_library: str = PREDEFINED_RISKS_MARKDOWN,
+                               on_delta: Optional[Callable[[str], None]] = None) -> str:
     """Generate risk matrix using OpenAI."""
-    system_prompt = f"""
+    # Fixed instructions first, then this request's library rows (see agents/prompt_cache.py)
+    messages = system_messages("""
         You are a risk analysis expert. Your task is to identify applicable risks from a predefined library based on a user's summary.
 
         1.  **Analyze the summary** to understand the project context.
-        2.  **Refer to the official risk library below** to select relevant risks. You MUST use the exact `RISK ID` and `RISK NAME` from this library.
+        2.  **Refer to the official risk library in the next message** to select relevant risks. You MUST use the exact `RISK ID` and `RISK NAME` from this library.
         3.  For each applicable risk, assign an OWNER, a SEVERITY (1-5), and a brief justification.
 
-        **Official Risk Library:**
-        {PREDEFINED_RISKS_MARKDOWN}
-
         Output ONLY a Markdown table with the following columns:
         | Risk ID | Risk | Owner | Severity | Justification | Mitigation | Target Date |
         Do not add any introductory text.
-        """
+        """, f"**Official Risk Library:**\n{risk_library}")
 
     try:
-        resp = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
+        return await chat_completion(
+            messages + [
                 {"role": "user", "content": summary}
             ],
             temperature=0.5,
             max_tokens=800,
+            on_delta=on_delta,
         )
-        return resp.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"Error generating risk matrix: {str(e)}")
         raise HTTPException(500, f"Error generating risk matrix: {str(e)}")
 
 # --- Control Generation Function (Unchanged) ---
-async def generate_control_matrix(risk_matrix: str, controls_df: pd.DataFrame) -> str:
+async def generate_control_matrix(risk_matrix: str, controls_markdown: str) -> str:
     """Generate control matrix using OpenAI."""
-    controls_markdown = controls_df.to_markdown(index=False)
-    
-    system_prompt = f"""
+    messages = system_messages("""
 You are an expert Control Assessment Agent for AI systems.
 Your task is to analyze an incoming risk matrix and map appropriate controls to each identified risk.
 
 1.  **Analyze the Input**: The user will provide a risk matrix in markdown format.
-2.  **Use Predefined Controls**: You MUST select relevant controls from the official list provided below. Do not invent controls.
-
-**Official Control List:**
-{controls_markdown}
+2.  **Use Predefined Controls**: You MUST select relevant controls from the official list provided in the next message. Do not invent controls.
 
 3.  **Generate Control Matrix**: For each risk in the input matrix, create a corresponding entry in a new control matrix.
    - Select the most appropriate control(s) from the Official Control List.
@@ -206,25 +145,36 @@ Your task is to analyze an incoming risk matrix and map appropriate controls to
 
 If no risks are provided or no controls are applicable, respond with the table header and a single row stating "No applicable controls found."
 Do not include any prefix or explanation text, just the markdown table.
-"""
+""", f"**Official Control List:**\n{controls_markdown}")
 
     try:
-        resp = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
+        return await chat_completion(
+            messages + [
                 {"role": "user", "content": f"Please perform a control assessment based on the following risk matrix:\n\n{risk_matrix}"}
             ],
             temperature=0.3,
             max_tokens=1000,
         )
-        return resp.choices[0].message.content.strip()
     except Exception as e:
         logger.error(f"Error generating control matrix: {str(e)}")
         raise HTTPException(500, f"Error generating control matrix: {str(e)}")
 
+# Modes, parsing, LLM output cache and streaming are shared with risk_control_agent
+PIPELINE = AssessmentPipeline(
+    cache_namespace="risk_matrix_agent",
+    generate_risk_matrix=generate_risk_matrix,
+    generate_control_matrix=generate_control_matrix,
+    load_controls=load_predefined_controls,
+    controls_file=Path,
+)
+
+@router.get("/cache/stats")
+def llm_cache_stats():
+    return llm_cache.stats()
+
 # --- Main Endpoint (Logic Unchanged) ---
 @router.post("/", response_model=RiskControlOut)
+@single_flight()
 async def run_risk_control_assessment(payload: RiskControlIn):
     """
     Combined endpoint that generates both risk and control assessments.
@@ -232,7 +182,6 @@ async def run_risk_control_assessment(payload: RiskControlIn):
     summary = payload.summary.strip()
     session_id = payload.session_id
     project_id = payload.project_id
-    controls_path = payload.controls_path
     
     if not summary:
         raise HTTPException(400, "Summary is required")
@@ -242,46 +191,43 @@ async def run_risk_control_assessment(payload: RiskControlIn):
 
     try:
         logger.info(f"Starting risk/control assessment for session: {session_id}")
+        assessment = await PIPELINE.assess(payload)
         
-        # Step 1: Generate Risk Matrix
-        logger.info("Generating risk matrix...")
-        risk_matrix = await generate_risk_matrix(summary)
-        
-        risk_assessment_id = f"RC-{session_id[:8].upper()}"
-        
-        parsed_risks_data = parse_markdown_table(risk_matrix, risk_assessment_id)
-        
-        # Step 2: Load Controls
-        logger.info("Loading predefined controls...")
-        controls_df = load_predefined_controls(controls_path)
-        if controls_df is None:
-            raise HTTPException(500, "Failed to load controls")
-        
-        # Step 3: Generate Control Matrix
-        logger.info("Generating control matrix...")
-        control_matrix = await generate_control_matrix(risk_matrix, controls_df)
-        
-        parsed_controls_data = parse_control_table(control_matrix, risk_assessment_id)
-        
-        # Step 4: Format response
-        parsed_risks = [RiskOut(**risk) for risk in parsed_risks_data]
-        parsed_controls = [ControlOut(**control) for control in parsed_controls_data]
+        # Format response
+        parsed_risks = [RiskOut(**risk) for risk in assessment.risks]
+        parsed_controls = [ControlOut(**control) for control in assessment.controls]
         
         logger.info(f"Assessment complete: {len(parsed_risks)} risks and {len(parsed_controls)} controls generated.")
         
         return RiskControlOut(
             session_id=session_id,
             project_id=project_id,
-            risk_assessment_id=risk_assessment_id,
-            risk_matrix=risk_matrix,
-            control_matrix=control_matrix,
+            risk_assessment_id=assessment.risk_assessment_id,
+            risk_matrix=assessment.risk_matrix,
+            control_matrix=assessment.control_matrix,
             parsed_risks=parsed_risks,
             parsed_controls=parsed_controls,
-            stored_in_db=False
+            stored_in_db=False,
+            prompt_fingerprint=assessment.prompt_fingerprint
         )
         
     except HTTPException:
         raise
     except Exception as e:
         logger.error(f"Error in risk-control assessment: {str(e)}", exc_info=True)
-        raise HTTPException(500, f"Internal server error: {str(e)}")
\ No newline at end of file
+        raise HTTPException(500, f"Internal server error: {str(e)}")
+
+
+# --- Streaming Endpoint ---
+@router.post("/stream")
+async def stream_risk_control_assessment(payload: RiskControlIn):
+    """
+    Same assessment as ``POST /``, streamed as NDJSON events (see agents/assessment_pipeline.py).
+    """
+    if not payload.summary.strip():
+        raise HTTPException(400, "Summary is required")
+    if not payload.session_id:
+        raise HTTPException(400, "Session ID is required")
+
+    logger.info(f"Starting streamed risk/control assessment for session: {payload.session_id}")
+    return PIPELINE.stream(payload)
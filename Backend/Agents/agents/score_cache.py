@@ -0,0 +1,59 @@
+# agents/score_cache.py
+"""
+Content-addressed cache of governance maturity scores.
+
+Each question's (maturity, rationale) is stored under a key built from the
+question text, the answer text, a hash of the policy documents, the model,
+the scoring instructions and the assessor's answer mode ("whole" answer or
+"best_sentence" of it), so the two assessors never reuse each other's scores.
+Texts only have their whitespace collapsed: answers that differ in case
+("NOT", acronyms, product names) are scored separately. Re-running an
+assessment after editing a few answers then only sends the changed questions
+to Gemini.
+
+Scores live in their own SQLite store (``SCORE_CACHE_*``, ``llm_cache`` TTL),
+so they don't compete with cached LLM output for one LRU bound.
+"""
+from __future__ import annotations
+
+import os
+from pathlib import Path
+from typing import Dict, Mapping
+
+from .batch_scoring import Rating
+from .llm_cache import LLM_CACHE_TTL, ROOT, LLMCache, make_key
+
+SCORE_NAMESPACE = "governance_scores"
+SCORE_CACHE_PATH = Path(os.getenv("SCORE_CACHE_PATH") or ROOT / ".cache" / "governance_scores.sqlite3")
+SCORE_CACHE_MAX_ENTRIES = int(os.getenv("SCORE_CACHE_MAX_ENTRIES") or "5000")
+
+score_store = LLMCache(SCORE_CACHE_PATH, LLM_CACHE_TTL, SCORE_CACHE_MAX_ENTRIES)
+
+
+def collapse_whitespace(text: str) -> str:
+    return " ".join(str(text or "").split())
+
+
+def policy_hash(policy_documents: str) -> str:
+    return make_key(collapse_whitespace(policy_documents))
+
+
+def score_key(question: str, answer: str, policy_digest: str, model: str, instructions: str,
+              answer_mode: str) -> str:
+    return make_key(collapse_whitespace(question), collapse_whitespace(answer), policy_digest, model,
+                    make_key(instructions), answer_mode)
+
+
+def cached_scores(keys: Mapping[str, str]) -> Dict[str, Rating]:
+    """Cached ratings by question id, for the question ids in ``keys`` that have one."""
+    found: Dict[str, Rating] = {}
+    for qid, key in keys.items():
+        value = score_store.get(SCORE_NAMESPACE, key)
+        if value is not None:
+            found[qid] = (int(value["maturity"]), str(value["rationale"]))
+    return found
+
+
+def store_scores(ratings: Mapping[str, Rating], keys: Mapping[str, str]) -> None:
+    for qid, (maturity, rationale) in ratings.items():
+        score_store.put(SCORE_NAMESPACE, keys[qid], {"maturity": maturity, "rationale": rationale})
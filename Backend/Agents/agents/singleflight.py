@@ -0,0 +1,80 @@
+# agents/singleflight.py
+"""
+Single-flight coalescing for async endpoints.
+
+Concurrent calls with the same payload (double submits, client retries of a
+timed-out request) share one in-flight computation instead of each starting
+its own LLM pipeline:
+
+    @router.post("/")
+    @single_flight()
+    async def run(payload: SomeModel): ...
+
+The computation runs as its own task, so a caller that disconnects does not
+cancel it for the others. Only concurrent calls are coalesced; once the
+result is delivered the key is released.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+import hashlib
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+import orjson
+from pydantic import BaseModel
+
+logger = logging.getLogger("uvicorn")
+
+T = TypeVar("T")
+
+# Per-function counters: "leaders" ran the computation, "coalesced" waited on one.
+SINGLE_FLIGHT_STATS: Dict[str, Counter] = {}
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump(mode="json")
+    return str(obj)
+
+
+def payload_key(*args: Any, **kwargs: Any) -> str:
+    """Stable hash of the call arguments (pydantic models by value, dict keys sorted)."""
+    raw = orjson.dumps([args, kwargs], default=_default, option=orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS)
+    return hashlib.sha256(raw).hexdigest()
+
+
+def single_flight(key: Optional[Callable[..., str]] = None) -> Callable[[Callable[..., Awaitable[T]]], Callable[..., Awaitable[T]]]:
+    """Coalesce concurrent calls of the decorated coroutine that have the same ``key(*args, **kwargs)``."""
+    make_key = key or payload_key
+
+    def decorate(fn: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        name = f"{fn.__module__}.{fn.__qualname__}"
+        inflight: Dict[str, asyncio.Task] = {}
+        stats = SINGLE_FLIGHT_STATS.setdefault(name, Counter())
+
+        def _release(k: str, task: asyncio.Task) -> None:
+            if inflight.get(k) is task:
+                del inflight[k]
+            if not task.cancelled():
+                task.exception()  # mark retrieved even if every caller went away
+
+        @functools.wraps(fn)
+        async def wrapper(*args: Any, **kwargs: Any) -> T:
+            k = make_key(*args, **kwargs)
+            task = inflight.get(k)
+            if task is None:
+                stats["leaders"] += 1
+                task = asyncio.ensure_future(fn(*args, **kwargs))
+                inflight[k] = task
+                task.add_done_callback(functools.partial(_release, k))
+            else:
+                stats["coalesced"] += 1
+                logger.info(f"{name}: joining in-flight call {k[:12]}")
+            return await asyncio.shield(task)
+
+        return wrapper
+
+    return decorate
@@ -0,0 +1,169 @@
+# agents/structured_output.py
+"""
+Schema-constrained JSON output for the risk/control agents.
+
+In "json" mode the completions are requested with a strict JSON schema
+(``response_format``), so the model can only return ``{"risks": [...]}`` /
+``{"controls": [...]}`` objects with exactly the RiskOut / ControlOut fields it
+generates. The text is parsed and validated in one ``TypeAdapter.validate_json``
+pass; the markdown matrices of the response are rendered from the validated
+rows, so the response shape is the same as in the other modes.
+
+A truncated JSON document never validates, so a completion that stops at
+``max_tokens`` is retried once with JSON_RETRY_MAX_TOKENS (502 if that is cut
+off too). A refusal is a 422 carrying the model's refusal message, not a
+schema error.
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from fastapi import HTTPException
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
+
+from .llm import CompletionRefused, CompletionTruncated, chat_completion
+from .prompt_cache import system_messages
+
+logger = logging.getLogger("uvicorn")
+
+JSON_MAX_TOKENS = 1000
+# Budget of the one retry of a JSON completion that stopped at JSON_MAX_TOKENS
+JSON_RETRY_MAX_TOKENS = int(os.getenv("JSON_RETRY_MAX_TOKENS") or "4000")
+
+
+class RiskItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    risk_id: str
+    risk_name: str
+    risk_owner: str
+    severity: int
+    justification: str
+    mitigation: str
+    target_date: str
+
+
+class ControlItem(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    code: str
+    section: str
+    control: str
+    requirements: str
+    status: str
+    tickets: str
+    related_risk: str
+
+
+class RiskList(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    risks: List[RiskItem]
+
+
+class ControlList(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+    controls: List[ControlItem]
+
+
+RISK_LIST = TypeAdapter(RiskList)
+CONTROL_LIST = TypeAdapter(ControlList)
+
+
+def _response_format(name: str, adapter: TypeAdapter) -> Dict[str, Any]:
+    return {"type": "json_schema", "json_schema": {"name": name, "strict": True, "schema": adapter.json_schema()}}
+
+
+RISK_RESPONSE_FORMAT = _response_format("risk_matrix", RISK_LIST)
+CONTROL_RESPONSE_FORMAT = _response_format("control_matrix", CONTROL_LIST)
+
+
+def _validate(adapter: TypeAdapter, text: str, what: str) -> Any:
+    try:
+        return adapter.validate_json(text or "")
+    except ValidationError as e:
+        logger.error(f"LLM returned an invalid {what}: {e}")
+        raise HTTPException(502, f"LLM returned an invalid {what} ({e.error_count()} errors)")
+
+
+async def _json_completion(messages: List[Dict[str, Any]], what: str, **kwargs: Any) -> str:
+    """A strict JSON completion, retried once with a larger budget if it stops at max_tokens."""
+    try:
+        try:
+            return await chat_completion(messages, max_tokens=JSON_MAX_TOKENS, strict=True, **kwargs)
+        except CompletionTruncated as e:
+            logger.warning(f"LLM {what} was cut off at {e.max_tokens} tokens; retrying with {JSON_RETRY_MAX_TOKENS}")
+            return await chat_completion(messages, max_tokens=JSON_RETRY_MAX_TOKENS, strict=True, **kwargs)
+    except CompletionTruncated as e:
+        logger.error(f"LLM {what} was cut off at {e.max_tokens} tokens")
+        raise HTTPException(502, f"LLM {what} exceeded {e.max_tokens} tokens")
+    except CompletionRefused as e:
+        logger.warning(f"LLM refused to produce the {what}: {e.refusal}")
+        raise HTTPException(422, f"LLM refused to produce the {what}: {e.refusal}")
+
+
+# ---------- Risks ----------
+async def generate_risk_json(summary: str, risk_library: str,
+                             on_delta: Optional[Callable[[str], None]] = None) -> str:
+    messages = system_messages("""
+You are a risk analysis expert. Select the risks from the official library in the next message that apply to the user's project summary.
+
+For each applicable risk return one item in "risks":
+- risk_id, risk_name, mitigation, target_date: copied exactly from the library.
+- risk_owner: the role that should own the risk.
+- severity: an integer 1-5.
+- justification: one short sentence.
+""", f"**Official Risk Library:**\n{risk_library}")
+    return await _json_completion(
+        messages + [{"role": "user", "content": summary}], "risk matrix",
+        temperature=0.5, on_delta=on_delta, response_format=RISK_RESPONSE_FORMAT,
+    )
+
+
+def parse_risk_json(text: str, risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Validated risks of a "json" mode completion (502 if it does not match the schema)."""
+    return [dict(item.model_dump(), risk_assessment_id=risk_assessment_id)
+            for item in _validate(RISK_LIST, text, "risk matrix").risks]
+
+
+# ---------- Controls ----------
+async def generate_control_json(risk_matrix: str, controls_markdown: str) -> str:
+    messages = system_messages("""
+You are an expert Control Assessment Agent for AI systems.
+Map controls from the official list in the next message to each risk in the user's risk matrix. Do not invent controls.
+
+Return one item in "controls" per (control, risk) pair:
+- code, section, control, requirements: copied exactly from the list.
+- status: "Compliant", "In Progress", or "Not Implemented".
+- tickets: a placeholder like TICK-123 if not Compliant, else "None".
+- related_risk: the Risk ID from the input matrix that this control mitigates.
+""", f"**Official Control List:**\n{controls_markdown}")
+    return await _json_completion(
+        messages + [{"role": "user", "content": f"Please perform a control assessment based on the following risk matrix:\n\n{risk_matrix}"}],
+        "control matrix", temperature=0.3, response_format=CONTROL_RESPONSE_FORMAT,
+    )
+
+
+def parse_control_json(text: str, risk_ids: Sequence[str], risk_assessment_id: str) -> List[Dict[str, Any]]:
+    """Validated controls of a "json" mode completion, related_risk checked against the risk IDs."""
+    known_risks = set(risk_ids)
+    controls: List[Dict[str, Any]] = []
+    for item in _validate(CONTROL_LIST, text, "control matrix").controls:
+        control = item.model_dump()
+        if control['related_risk'] not in known_risks:
+            control['related_risk'] = f"UNMAPPED: {control['related_risk']}"
+        controls.append(dict(control, control_id=f"CTRL-{risk_assessment_id}-{len(controls)+1:03d}",
+                             risk_assessment_id=risk_assessment_id))
+    return controls
+
+
+def merge_control_json(texts: Sequence[str]) -> str:
+    """One "json" mode control completion out of several (in the given order, duplicate items dropped)."""
+    items: List[ControlItem] = []
+    seen = set()
+    for text in texts:
+        for item in _validate(CONTROL_LIST, text, "control matrix").controls:
+            key = tuple(item.model_dump().values())
+            if key not in seen:
+                seen.add(key)
+                items.append(item)
+    return CONTROL_LIST.dump_json(ControlList(controls=items)).decode()
@@ -0,0 +1,59 @@
+# agents/types.py
+"""Request/response models of the Excel risk and control endpoints."""
+from __future__ import annotations
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+class RiskIn(BaseModel):
+    session_id: str
+    project_id: Optional[str] = None
+    summary: Optional[str] = ""
+    limit: Optional[int] = None
+    min_score: Optional[float] = None  # drop risks whose BM25 relevance is below this
+    cursor: Optional[str] = None        # next_cursor of the previous page
+    page_size: Optional[int] = None     # items per page (everything left when unset)
+    fields: Optional[List[str]] = None  # RiskOutItem fields to return (risk_id always included)
+
+class ControlsIn(BaseModel):
+    session_id: str
+    project_id: Optional[str] = None
+    risk_assessment_id: str
+    risk_ids: Optional[List[str]] = None
+    cursor: Optional[str] = None
+    page_size: Optional[int] = None
+    fields: Optional[List[str]] = None  # ControlOutItem fields to return (control_id always included)
+
+class RiskOutItem(BaseModel):
+    risk_id: str
+    risk_assessment_id: str
+    risk_name: str
+    risk_owner: str
+    severity: int
+    justification: str
+    mitigation: str
+    target_date: str
+
+class ControlOutItem(BaseModel):
+    control_id: str
+    code: str
+    section: str
+    control: str
+    requirements: str
+    status: str
+    tickets: str
+    relatedRisks: List[str]
+
+class RiskResponse(BaseModel):
+    session_id: str
+    project_id: Optional[str] = None
+    risk_assessment_id: str
+    parsed_risks: List[RiskOutItem]
+    next_cursor: Optional[str] = None
+
+class ControlsResponse(BaseModel):
+    session_id: str
+    project_id: Optional[str] = None
+    risk_assessment_id: str
+    parsed_controls: List[ControlOutItem]
+    next_cursor: Optional[str] = None
@@ -2,9 +2,11 @@
 import pandas as pd
 from pathlib import Path
 
-# Load the Excel once
+from .catalog import read_catalog
+
+# Load the Excel once (from the compiled sidecar when it is fresh)
 RISK_FILE = Path(__file__).parent.parent / "predefined_risks.xlsx"
-df = pd.read_excel(RISK_FILE)
+df = read_catalog(RISK_FILE, 0, normalized=False)
 
 # Create a clean DataFrame with only the necessary columns for the prompt
 prompt_df = df[['RISK ID', 'RISK NAME', 'MITIGATION', 'TARGET_DATE']].copy()
@@ -0,0 +1,73 @@
+# agents/vertex_client.py
+"""
+Process-level Vertex AI (Gemini) client manager.
+
+The service account file is read once, ``vertexai.init`` runs once per
+project/location, and ``GenerativeModel`` instances are cached by model name
+and system instruction, so scoring a question only pays for the request
+itself. The governance assessors call ``warm_vertex`` on startup so the first
+assessment doesn't pay the init cost either.
+
+The Vertex SDK is imported on first use; this module can be imported without
+google-cloud-aiplatform installed.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+VERTEX_CREDENTIALS = os.getenv("GOOGLE_APPLICATION_CREDENTIALS") or "service.json"
+
+_lock = threading.RLock()
+_credentials: Any = None
+_initialized: Optional[Tuple[str, str]] = None
+_models: Dict[Tuple[str, str, str, str], Any] = {}
+
+
+def vertex_settings() -> Tuple[str, str, str]:
+    """(model, project, location) of the governance scoring calls, from the environment."""
+    return (
+        os.getenv("MODEL", "gemini-2.5-flash-lite"),
+        os.getenv("GOOGLE_CLOUD_PROJECT", "bionic-mercury-455722-g1"),
+        os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1"),
+    )
+
+
+def vertex_credentials() -> Any:
+    """The service account credentials, loaded from VERTEX_CREDENTIALS once per process."""
+    global _credentials
+    with _lock:
+        if _credentials is None:
+            from google.oauth2 import service_account
+            _credentials = service_account.Credentials.from_service_account_file(VERTEX_CREDENTIALS)
+        return _credentials
+
+
+def init_vertex(project: str, location: str) -> None:
+    """``vertexai.init`` for this project/location, unless it is already the active one."""
+    global _initialized
+    with _lock:
+        if _initialized != (project, location):
+            from vertexai import init as vertexai_init
+            vertexai_init(project=project, location=location, credentials=vertex_credentials())
+            _initialized = (project, location)
+
+
+def generative_model(model_name: str, system_instruction: str, project: str, location: str) -> Any:
+    """The cached ``GenerativeModel`` for this model and system instruction."""
+    key = (project, location, model_name, system_instruction)
+    with _lock:
+        model = _models.get(key)
+        if model is None:
+            from vertexai.generative_models import GenerativeModel, Part
+            init_vertex(project, location)
+            model = GenerativeModel(model_name, system_instruction=Part.from_text(system_instruction))
+            _models[key] = model
+        return model
+
+
+def warm_vertex(system_instruction: str) -> None:
+    """Load the credentials, init Vertex and build the scoring model for the configured settings."""
+    model_name, project, location = vertex_settings()
+    generative_model(model_name, system_instruction, project, location)
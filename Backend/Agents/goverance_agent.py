@@ -11,17 +11,27 @@ Run as a web server:
 """
 
 from __future__ import annotations
+import asyncio
 import json
 import os
 import sys
 import uvicorn
 from dataclasses import dataclass, field
-from typing import Dict, List, Any, TypedDict, Optional, TextIO
+from typing import Dict, List, Any, TypedDict, Optional, Sequence, Set, TextIO
 
 # --- FastAPI and Pydantic imports ---
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 
+from agents.batch_scoring import (BATCH_SCORING_INSTRUCTIONS, SCORING_MODE, SYSTEM_SCORING_INSTRUCTIONS, Rating,
+                                  ScoringItem, score_each, score_in_batches)
+from agents.governance_delta import (AssessmentDeltaRequest, apply_delta, build_record, control_contribution,
+                                     delta_response, framework_scores, load_assessment, question_contribution,
+                                     save_assessment, sum_contributions)
+from agents.score_cache import cached_scores, policy_hash, score_key, store_scores
+from agents.singleflight import single_flight
+from agents.vertex_client import generative_model, vertex_settings, warm_vertex
+
 # --- Rich imports for Progress Logging ---
 from rich.console import Console
 from rich.panel import Panel
@@ -58,16 +68,19 @@ except ImportError:
 USE_VERTEX = os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "True").lower() in ("1", "true", "yes")
 try:
     if USE_VERTEX:
-        from vertexai import init as vertexai_init
-        from vertexai.generative_models import GenerativeModel, GenerationConfig, Part
+        from vertexai.generative_models import GenerationConfig, Part
 except Exception as e:
     rprint_orig(f"[red]Vertex AI SDK not found or error during import: {e}. Please install google-cloud-aiplatform.[/red]", file=sys.stderr)
     sys.exit(1)
 
-from google.oauth2 import service_account
 
 FRAMEWORKS = ["EU", "NIST", "ISO"]
 
+# Max concurrent Gemini scoring calls per assessment
+SCORING_CONCURRENCY = int(os.getenv("SCORING_CONCURRENCY") or "8")
+# Answers are split into sentences and the best-rated one counts (see _answer_parts); part of the score cache key.
+ANSWER_MODE = "best_sentence"
+
 # --- Regulation Mapping (unchanged) ---
 REGULATION_MAPPING = {
     "controls": {
@@ -92,6 +105,7 @@ class AnswerRating:
     question_id: str
     maturity: int  # 0..4
     rationale: str
+    failed: bool = False  # fallback rating (model/parse error), never cached
 
 # --- Pydantic Models for API (unchanged) ---
 class QuestionModel(BaseModel):
@@ -116,6 +130,7 @@ class AssessmentResponse(BaseModel):
     recommendations: List[str]
     detailed_analysis: Dict[str, Dict[str, List[str]]]
     full_report: Dict[str, Any]
+    assessment_id: Optional[str] = None  # pass to /assess/delta to update this assessment
 
 # --- LangGraph State (unchanged) ---
 class AssessmentState(TypedDict):
@@ -133,9 +148,8 @@ class AssessmentState(TypedDict):
 
 # --- LangGraph Nodes ---
 
-def load_policy_documents_node(state: AssessmentState) -> AssessmentState:
-    """Loads policy documents."""
-    policy_docs = """
+# Delta assessments are rescored against this text and rejected once it changes.
+POLICY_DOCUMENTS = """
     **AI Governance Policy - Document #1**
     1.  **Scope and Purpose:** This policy applies to all AI systems developed and deployed by our organization.
     2.  **Accountability:** The AI Governance Officer (AIGO) is responsible for oversight.
@@ -143,44 +157,91 @@ def load_policy_documents_node(state: AssessmentState) -> AssessmentState:
     4.  **Human Oversight:** High-risk systems must include Human-in-the-Loop (HITL) mechanisms with clear escalation paths.
     5.  **Transparency:** Model cards and data sheets are mandatory for all production models.
     """
-    state['policy_documents'] = policy_docs
+
+def load_policy_documents_node(state: AssessmentState) -> AssessmentState:
+    """Loads policy documents."""
+    state['policy_documents'] = POLICY_DOCUMENTS
     state['per_question_scores'] = {}
     state['per_question_rationales'] = {}
     return state
 
+def _answer_parts(raw: str) -> List[str]:
+    """A free-text answer split into sentences (each is rated, the best one counts)."""
+    parts = [p.strip() for p in raw.strip().replace("\n", " ").split(".") if p.strip()]
+    return parts or [""]
+
+def _score_question(question: str, parts: List[str], policy_documents: str,
+                    model: str, project: str, location: str) -> AnswerRating:
+    """Best rating of one question's answer."""
+    ratings = vertex_rate_answers(model, project, location, question, parts, policy_documents)
+    return max(ratings, key=lambda x: x.maturity)
+
+def _rate_item(item: ScoringItem, policy_documents: str, failed: Set[str],
+               model: str, project: str, location: str) -> Rating:
+    best = _score_question(item.question, item.answers, policy_documents, model, project, location)
+    if best.failed:
+        failed.add(item.question_id)
+    return best.maturity, best.rationale
+
+def _score_batched(questions: List[Dict[str, Any]], answers_map: Dict[str, str], policy_documents: str,
+                   failed: Set[str], model: str, project: str, location: str) -> Dict[str, Rating]:
+    """SCORING_MODE=batch: several questions per Gemini request, per-question calls for failed batches."""
+    items = [ScoringItem(q["id"], q["text"], _answer_parts(answers_map.get(q["id"], "")))
+             for q in questions]
+
+    def on_error(batch: Sequence[ScoringItem], e: Exception) -> None:
+        file_log(f"[yellow]Batch of {len(batch)} questions failed ({type(e).__name__}), scoring them one by one[/yellow]")
+
+    file_log(f"Scoring {len(items)} answers in batches...")
+    return score_in_batches(items, policy_documents, model, project, location,
+                            lambda item: _rate_item(item, policy_documents, failed, model, project, location),
+                            SCORING_CONCURRENCY, on_error=on_error)
+
+def _score_each(questions: List[Dict[str, Any]], answers_map: Dict[str, str], policy_documents: str,
+                failed: Set[str], model: str, project: str, location: str) -> Dict[str, Rating]:
+    """One Gemini request per question, at most SCORING_CONCURRENCY in flight."""
+    items = [ScoringItem(q["id"], q["text"], _answer_parts(answers_map.get(q["id"], "")))
+             for q in questions]
+
+    def progress(results):
+        # --- Use track for progress logging to file ---
+        if FILE_CONSOLE.file: # Check if file is open before using track
+            return track(results, total=len(items), description=f"Scoring {len(items)} answers...", console=FILE_CONSOLE)
+        return results
+
+    return score_each(items, lambda item: _rate_item(item, policy_documents, failed, model, project, location),
+                      SCORING_CONCURRENCY, progress)
+
+def score_questions(questions: List[Dict[str, Any]], answers_map: Dict[str, str],
+                    policy_documents: str) -> Dict[str, Rating]:
+    """(maturity, rationale) per question id; cached scores are reused, the rest go to Vertex AI."""
+    model, project, location = vertex_settings()
+
+    # Only questions whose (question, answer, policy, model, instructions) changed go to the model.
+    instructions = BATCH_SCORING_INSTRUCTIONS if SCORING_MODE == "batch" else SYSTEM_SCORING_INSTRUCTIONS
+    policy_digest = policy_hash(policy_documents)
+    keys = {q["id"]: score_key(q["text"], answers_map.get(q["id"], ""), policy_digest, model, instructions,
+                               ANSWER_MODE)
+            for q in questions}
+    ratings = cached_scores(keys)
+    todo = [q for q in questions if q["id"] not in ratings]
+    if ratings:
+        file_log(f"Reusing {len(ratings)} cached scores, scoring {len(todo)} answers.")
+
+    failed: Set[str] = set()
+    score = _score_batched if SCORING_MODE == "batch" else _score_each
+    fresh = score(todo, answers_map, policy_documents, failed, model, project, location) if todo else {}
+    store_scores({qid: r for qid, r in fresh.items() if qid not in failed}, keys)
+    ratings.update(fresh)
+    return ratings
+
 def score_answers_node(state: AssessmentState) -> AssessmentState:
     """Scores answers for each question using Vertex AI, logging progress."""
-    project = os.getenv("GOOGLE_CLOUD_PROJECT", "bionic-mercury-455722-g1")
-    location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
-    model = os.getenv("MODEL", "gemini-2.5-flash-lite")
-
-    # --- Use track for progress logging to file ---
-    total_questions = len(state['questions'])
-    if FILE_CONSOLE.file: # Check if file is open before using track
-        # Wrap the loop with track, directing output to the file console
-        for q in track(state['questions'], description=f"Scoring {total_questions} answers...", console=FILE_CONSOLE):
-            qid = q["id"]
-            raw = state['answers_map'].get(qid, "").strip()
-            parts = [p.strip() for p in raw.replace("\n", " ").split(".") if p.strip()]
-            if not parts:
-                parts = [""]
-
-            ratings = vertex_rate_answers(model, project, location, q["text"], parts, state['policy_documents'])
-            best = max(ratings, key=lambda x: x.maturity)
-            state['per_question_scores'][qid] = best.maturity
-            state['per_question_rationales'][qid] = best.rationale
-    else: # Fallback if file isn't open (shouldn't happen with current setup)
-         for q in state['questions']:
-            qid = q["id"]
-            raw = state['answers_map'].get(qid, "").strip()
-            parts = [p.strip() for p in raw.replace("\n", " ").split(".") if p.strip()]
-            if not parts:
-                parts = [""]
-            ratings = vertex_rate_answers(model, project, location, q["text"], parts, state['policy_documents'])
-            best = max(ratings, key=lambda x: x.maturity)
-            state['per_question_scores'][qid] = best.maturity
-            state['per_question_rationales'][qid] = best.rationale
+    ratings = score_questions(state['questions'], state['answers_map'], state['policy_documents'])
 
+    # Filled in question order, whatever order the scores came back in.
+    for q in state['questions']:
+        state['per_question_scores'][q["id"]], state['per_question_rationales'][q["id"]] = ratings[q["id"]]
     return state
 
 def aggregate_scores_node(state: AssessmentState) -> AssessmentState:
@@ -209,10 +270,6 @@ def compile_report_node(state: AssessmentState) -> AssessmentState:
     return state
 
 # --- Vertex / RAG Scoring (Keeps error fallback, minimal error logging) ---
-SYSTEM_SCORING_INSTRUCTIONS = (
-    # ... (instructions remain the same) ...
-).strip()
-
 def vertex_rate_answers(model_name: str, project: str, location: str,
                         question: str, answers: List[str], policy_documents: str) -> List[AnswerRating]:
     """
@@ -220,12 +277,7 @@ def vertex_rate_answers(model_name: str, project: str, location: str,
     Returns default rating on error, logs minimal error info.
     """
     try:
-        creds = service_account.Credentials.from_service_account_file("service.json")
-        vertexai_init(project=project, location=location, credentials=creds)
-        model = GenerativeModel(
-            model_name,
-            system_instruction=Part.from_text(SYSTEM_SCORING_INSTRUCTIONS)
-        )
+        model = generative_model(model_name, SYSTEM_SCORING_INSTRUCTIONS, project, location)
         user_prompt = {
             "policy_documents": policy_documents,
             "question": question,
@@ -251,7 +303,7 @@ def vertex_rate_answers(model_name: str, project: str, location: str,
                 rat = f"Malformed response item from AI: {item}"
             ratings.append(AnswerRating(question_id=f"{question}#{i}", maturity=m, rationale=rat))
         if not ratings:
-             return [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="Failed to parse valid rating.")]
+             return [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="Failed to parse valid rating.", failed=True)]
         return ratings
     except Exception as e:
         # Log minimal error info
@@ -259,28 +311,14 @@ def vertex_rate_answers(model_name: str, project: str, location: str,
         file_log(f"[bold red]{error_msg}[/bold red]")
         rprint_orig(f"ERROR: Vertex AI failed during scoring. See {LOG_FILE}.", file=sys.stderr)
         # Fallback on error
-        return [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="Failed due to AI model error.")]
+        return [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="Failed due to AI model error.", failed=True)]
 
 # --- Aggregation and recommendations (unchanged) ---
 def aggregate_scores(questions: List[Dict[str, Any]], control_matrix: Dict[str, Any],
                      per_question_scores: Dict[str, int]) -> Dict[str, float]:
-    totals = {fw: 0.0 for fw in FRAMEWORKS}
-    max_totals = {fw: 0.0 for fw in FRAMEWORKS}
-    for q in questions:
-        qid = q["id"]
-        maturity = per_question_scores.get(qid, 0) / 4.0
-        for fw in FRAMEWORKS:
-            w = q["weights"].get(fw, 0.0)
-            totals[fw] += maturity * w
-            max_totals[fw] += 1.0 * w
-    for key, ctl in control_matrix.items():
-        if bool(ctl.get("evidence")):
-            for fw in FRAMEWORKS:
-                w = float(ctl.get("weights", {}).get(fw, 0.0))
-                totals[fw] += 0.2 * w
-                max_totals[fw] += 0.2 * w
-    scores = {fw: (100.0 * (totals[fw] / max_totals[fw])) if max_totals[fw] > 0 else 0.0 for fw in FRAMEWORKS}
-    return scores
+    parts = [question_contribution(q, per_question_scores.get(q["id"], 0), FRAMEWORKS) for q in questions]
+    parts += [control_contribution(ctl, FRAMEWORKS) for ctl in control_matrix.values()]
+    return framework_scores(sum_contributions(parts, FRAMEWORKS))
 
 def recommend_next_steps(scores: Dict[str, float], controls: Dict[str, Any], per_q: Dict[str, int]) -> List[str]:
     recs: List[str] = []
@@ -358,7 +396,17 @@ workflow.add_edge("report", END)
 
 langgraph_app = workflow.compile()
 
+@app.on_event("startup")
+def warm_vertex_client():
+    # Credentials, vertexai.init and the scoring model are set up once per process.
+    try:
+        warm_vertex(SYSTEM_SCORING_INSTRUCTIONS)
+        file_log("[green]Vertex AI client ready.[/green]")
+    except Exception as e:
+        file_log(f"[yellow]Vertex AI warm-up skipped: {type(e).__name__}[/yellow]")
+
 @app.post("/assess", response_model=AssessmentResponse)
+@single_flight()
 async def run_assessment_endpoint(request: AssessmentRequest):
     """
     Receives assessment data, runs it through the LangGraph workflow,
@@ -374,14 +422,21 @@ async def run_assessment_endpoint(request: AssessmentRequest):
         }
 
         # Invoke the assessment workflow (score_answers_node logs progress)
-        final_state = langgraph_app.invoke(initial_state)
+        final_state = await asyncio.to_thread(langgraph_app.invoke, initial_state)
+
+        # Per-item contributions are kept so /assess/delta can update this assessment
+        assessment_id = save_assessment(build_record(
+            final_state['questions'], final_state['answers_map'], final_state['controls'],
+            final_state['policy_documents'], final_state['per_question_scores'],
+            final_state['per_question_rationales'], FRAMEWORKS))
 
         response_data = AssessmentResponse(
             scores={fw: round(score, 2) for fw, score in final_state['framework_scores'].items()},
             overall=round(final_state['overall_score'], 2),
             recommendations=final_state['recommendations'],
             detailed_analysis=final_state['detailed_analysis'],
-            full_report=final_state['report']
+            full_report=final_state['report'],
+            assessment_id=assessment_id,
         )
 
         # Log completion summary with scores to FILE
@@ -398,6 +453,31 @@ async def run_assessment_endpoint(request: AssessmentRequest):
         rprint_orig(f"FATAL ERROR [{request_id}]: Assessment failed. See {LOG_FILE}.", file=sys.stderr) # Minimal terminal error
         raise HTTPException(status_code=500, detail=f"An error occurred during assessment [{request_id}].")
 
+@app.post("/assess/delta", response_model=AssessmentResponse)
+@single_flight()
+async def run_delta_assessment_endpoint(request: AssessmentDeltaRequest):
+    """
+    Updates a previous assessment with changed answers and/or control evidence flags.
+    Only the changed answers are rescored; framework totals are re-summed from the stored contributions.
+    """
+    request_id = os.urandom(4).hex()
+    file_log(Panel.fit(f"[bold]Delta Assessment Request [{request_id}] for {request.assessment_id}: "
+                       f"{len(request.answers)} answers, {len(request.evidence)} controls[/bold]"))
+    try:
+        record = load_assessment(request.assessment_id)
+        record = await asyncio.to_thread(apply_delta, record, request, FRAMEWORKS, score_questions,
+                                         POLICY_DOCUMENTS)
+        response_data = delta_response(record, FRAMEWORKS, AssessmentResponse,
+                                       lambda state: compile_report_node(generate_analysis_node(state)))
+        file_log(Panel.fit(f"[bold cyan]Delta Assessment [{request_id}] Complete. Overall: {response_data.overall:.2f}[/bold cyan]"))
+        return response_data
+    except HTTPException:
+        raise
+    except Exception as e:
+        file_log(f"[bold red]Error during delta assessment [{request_id}]: {type(e).__name__} - {e}[/bold red]")
+        rprint_orig(f"FATAL ERROR [{request_id}]: Delta assessment failed. See {LOG_FILE}.", file=sys.stderr)
+        raise HTTPException(status_code=500, detail=f"An error occurred during delta assessment [{request_id}].")
+
 # --- Main Execution ---
 if __name__ == "__main__":
     rprint_orig(f"Server starting. Logging assessment progress to {LOG_FILE}...", file=sys.stderr)
@@ -10,16 +10,26 @@ Run as a web server:
 """
 
 from __future__ import annotations
+import asyncio
 import json
 import os
 import sys
 import uvicorn
 from dataclasses import dataclass, field
-from typing import Dict, List, Any, TypedDict
+from typing import Dict, List, Any, Optional, Set, TypedDict
 
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel, Field
 
+from agents.batch_scoring import (BATCH_SCORING_INSTRUCTIONS, SCORING_MODE, SYSTEM_SCORING_INSTRUCTIONS, Rating,
+                                  ScoringItem, score_each, score_in_batches)
+from agents.governance_delta import (AssessmentDeltaRequest, apply_delta, build_record, control_contribution,
+                                     delta_response, framework_scores, load_assessment, question_contribution,
+                                     save_assessment, sum_contributions)
+from agents.score_cache import cached_scores, policy_hash, score_key, store_scores
+from agents.singleflight import single_flight
+from agents.vertex_client import generative_model, vertex_settings, warm_vertex
+
 from rich import print as rprint
 from rich.panel import Panel
 from rich.console import Console
@@ -36,16 +46,15 @@ except ImportError:
 USE_VERTEX = os.getenv("GOOGLE_GENAI_USE_VERTEXAI", "True").lower() in ("1", "true", "yes")
 try:
     if USE_VERTEX:
-        from vertexai import init as vertexai_init
-        from vertexai.generative_models import GenerativeModel, GenerationConfig, Part
+        from vertexai.generative_models import GenerationConfig, Part
 except Exception:
     rprint("[red]Vertex AI SDK not found. Please install google-cloud-aiplatform.[/red]")
     sys.exit(1)
 
-
-from google.oauth2 import service_account
-
 FRAMEWORKS = ["EU", "NIST", "ISO"]
+SCORING_CONCURRENCY = int(os.getenv("SCORING_CONCURRENCY") or "8")
+# Answers are rated whole; part of the score cache key.
+ANSWER_MODE = "whole"
 
 # --- Regulation Mapping and Data Classes (unchanged) ---
 REGULATION_MAPPING = {
@@ -58,6 +67,7 @@ class AnswerRating:
     question_id: str
     maturity: int
     rationale: str
+    failed: bool = False  # fallback rating, not cached
 
 # --- Pydantic Models for API (unchanged) ---
 class QuestionModel(BaseModel):
@@ -71,6 +81,7 @@ class AssessmentRequest(BaseModel):
 
 class AssessmentResponse(BaseModel):
     scores: Dict[str, float]; overall: float; recommendations: List[str]; detailed_analysis: Dict[str, Dict[str, List[str]]]; full_report: Dict[str, Any]
+    assessment_id: Optional[str] = None  # for /assess/delta
 
 # --- LangGraph State (unchanged) ---
 class AssessmentState(TypedDict):
@@ -80,9 +91,8 @@ class AssessmentState(TypedDict):
 # LangGraph Nodes (WITH DEBUG PRINTS)
 # ------------------------------
 
-def load_policy_documents_node(state: AssessmentState) -> AssessmentState:
-    rprint(Panel.fit("--- Entering Node: [bold]load_policy_documents_node[/bold] ---", style="green"))
-    policy_docs = """
+# Delta assessments are rescored against this text and rejected once it changes.
+POLICY_DOCUMENTS = """
     **AI Governance Policy - Document #1**
     1.  **Scope and Purpose:** This policy applies to all AI systems developed and deployed by our organization.
     2.  **Accountability:** The AI Governance Officer (AIGO) is responsible for oversight.
@@ -90,26 +100,59 @@ def load_policy_documents_node(state: AssessmentState) -> AssessmentState:
     4.  **Human Oversight:** High-risk systems must include Human-in-the-Loop (HITL) mechanisms with clear escalation paths.
     5.  **Transparency:** Model cards and data sheets are mandatory for all production models.
     """
-    state['policy_documents'] = policy_docs
+
+def load_policy_documents_node(state: AssessmentState) -> AssessmentState:
+    rprint(Panel.fit("--- Entering Node: [bold]load_policy_documents_node[/bold] ---", style="green"))
+    state['policy_documents'] = POLICY_DOCUMENTS
     state['per_question_scores'] = {}
     state['per_question_rationales'] = {}
     rprint("[green]✓ Policy documents loaded and scores initialized.[/green]")
     return state
 
+def score_questions(questions: List[Dict[str, Any]], answers_map: Dict[str, str], policy_documents: str) -> Dict[str, Rating]:
+    model, project, location = vertex_settings()
+    failed: Set[str] = set()
+
+    def rate(qid: str, question: str, answer: str) -> Rating:
+        best = max(vertex_rate_answers(model, project, location, question, answer, policy_documents),
+                   key=lambda x: x.maturity)
+        if best.failed:
+            failed.add(qid)
+        return best.maturity, best.rationale
+
+    # Cached scores for unchanged (question, answer, policy, model, instructions)
+    instructions = BATCH_SCORING_INSTRUCTIONS if SCORING_MODE == "batch" else SYSTEM_SCORING_INSTRUCTIONS
+    policy_digest = policy_hash(policy_documents)
+    keys = {q["id"]: score_key(q["text"], answers_map.get(q["id"], ""), policy_digest, model, instructions,
+                               ANSWER_MODE)
+            for q in questions}
+    ratings = cached_scores(keys)
+    todo = [q for q in questions if q["id"] not in ratings]
+    rprint(f"[cyan]{len(ratings)} cached scores, {len(todo)} answers to score[/cyan]")
+
+    fresh: Dict[str, Rating] = {}
+    items = [ScoringItem(q["id"], q["text"], [answers_map.get(q["id"], "").strip()]) for q in todo]
+    if todo and SCORING_MODE == "batch":
+        def on_error(batch, e: Exception) -> None:
+            rprint(f"[yellow]Batch of {len(batch)} questions failed ({e}), scoring them one by one[/yellow]")
+
+        fresh = score_in_batches(items, policy_documents, model, project, location,
+                                 lambda item: rate(item.question_id, item.question, item.answers[0]),
+                                 SCORING_CONCURRENCY, on_error=on_error)
+    elif todo:
+        # Concurrent scoring, results collected in question order
+        fresh = score_each(items, lambda item: rate(item.question_id, item.question, item.answers[0]),
+                           SCORING_CONCURRENCY,
+                           lambda results: track(results, total=len(items), description="[cyan]Scoring answers...[/cyan]"))
+    store_scores({qid: r for qid, r in fresh.items() if qid not in failed}, keys)
+    ratings.update(fresh)
+    return ratings
+
 def score_answers_node(state: AssessmentState) -> AssessmentState:
     rprint(Panel.fit("--- Entering Node: [bold]score_answers_node[/bold] ---", style="green"))
-    project = os.getenv("GOOGLE_CLOUD_PROJECT", "bionic-mercury-455722-g1")
-    location = os.getenv("GOOGLE_CLOUD_LOCATION", "us-central1")
-    model = os.getenv("MODEL", "gemini-2.5-flash-lite")
-
-    for q in track(state['questions'], description="[cyan]Scoring answers...[/cyan]"):
-        qid = q["id"]
-        raw_answer = state['answers_map'].get(qid, "").strip()
-        
-        ratings = vertex_rate_answers(model, project, location, q["text"], raw_answer, state['policy_documents'])
-        best_rating = max(ratings, key=lambda x: x.maturity)
-        state['per_question_scores'][qid] = best_rating.maturity
-        state['per_question_rationales'][qid] = best_rating.rationale
+    ratings = score_questions(state['questions'], state['answers_map'], state['policy_documents'])
+    for q in state['questions']:
+        state['per_question_scores'][q["id"]], state['per_question_rationales'][q["id"]] = ratings[q["id"]]
     
     rprint("[bold yellow]>>> Result from scoring node:[/bold yellow]")
     rprint(state['per_question_scores'])
@@ -149,21 +192,11 @@ def compile_report_node(state: AssessmentState) -> AssessmentState:
 # ------------------------------
 # Vertex / RAG Scoring (WITH DEBUG PRINTS)
 # ------------------------------
-SYSTEM_SCORING_INSTRUCTIONS = (
-    """
-You are an AI governance auditor. Your task is to assess an organization's AI governance maturity based ONLY on the provided policy documents.
-Rate the answer on a scale of 0-4: 0=No evidence, 1=Emerging, 2=Defined, 3=Measured, 4=Optimized.
-Strictly return a JSON list of objects: [{"maturity": int, "rationale": str}]
-The rationale must be concise (<= 60 words) and reference the policy document.
-    """
-).strip()
 
 def vertex_rate_answers(model_name: str, project: str, location: str,
                         question: str, answer: str, policy_documents: str) -> List[AnswerRating]:
     try:
-        creds = service_account.Credentials.from_service_account_file("service.json")
-        vertexai_init(project=project, location=location, credentials=creds)
-        model = GenerativeModel(model_name, system_instruction=[SYSTEM_SCORING_INSTRUCTIONS])
+        model = generative_model(model_name, SYSTEM_SCORING_INSTRUCTIONS, project, location)
         
         user_prompt = {"policy_documents": policy_documents, "question": question, "answer": answer}
         
@@ -178,26 +211,19 @@ def vertex_rate_answers(model_name: str, project: str, location: str,
         data = json.loads(cleaned_text)
 
         ratings = [AnswerRating(question_id=f"{question}#0", maturity=int(item.get("maturity", 0)), rationale=str(item.get("rationale", ""))) for item in (data if isinstance(data, list) else [data])]
-        return ratings if ratings else [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="AI returned no parsable ratings.")]
+        return ratings if ratings else [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="AI returned no parsable ratings.", failed=True)]
 
     except Exception as e:
         rprint(Panel(f"An exception occurred: {e}", title=f"[bold red]CRITICAL ERROR in vertex_rate_answers for question '{question[:30]}...'[/bold red]", border_style="red"))
-        return [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="An exception occurred during AI model processing.")]
+        return [AnswerRating(question_id=f"{question}#0", maturity=0, rationale="An exception occurred during AI model processing.", failed=True)]
 
 # ------------------------------
 # Aggregation, Recommendations, Analysis (unchanged logic)
 # ------------------------------
 def aggregate_scores(questions: List[Dict[str, Any]], control_matrix: Dict[str, Any], per_question_scores: Dict[str, int]) -> Dict[str, float]:
-    totals = {fw: 0.0 for fw in FRAMEWORKS}; max_totals = {fw: 0.0 for fw in FRAMEWORKS}
-    for q in questions:
-        qid = q["id"]; maturity = per_question_scores.get(qid, 0) / 4.0
-        for fw in FRAMEWORKS:
-            w = q["weights"].get(fw, 0.0); totals[fw] += maturity * w; max_totals[fw] += 1.0 * w
-    for key, ctl in control_matrix.items():
-        if bool(ctl.get("evidence")): # Simplified from original, assumes evidence=True means implemented
-            for fw in FRAMEWORKS:
-                w = float(ctl.get("weights", {}).get(fw, 0.0)); totals[fw] += 0.2 * w; max_totals[fw] += 0.2 * w
-    return {fw: (100.0 * (totals[fw] / max_totals[fw])) if max_totals[fw] > 0 else 0.0 for fw in FRAMEWORKS}
+    parts = [question_contribution(q, per_question_scores.get(q["id"], 0), FRAMEWORKS) for q in questions]
+    parts += [control_contribution(ctl, FRAMEWORKS) for ctl in control_matrix.values()]  # evidence=True means implemented
+    return framework_scores(sum_contributions(parts, FRAMEWORKS))
 
 def recommend_next_steps(scores: Dict[str, float], controls: Dict[str, Any]) -> List[str]:
     recs = []
@@ -244,7 +270,16 @@ workflow.set_entry_point("load_and_init")
 workflow.add_edge("load_and_init", "score"); workflow.add_edge("score", "aggregate"); workflow.add_edge("aggregate", "analyze"); workflow.add_edge("analyze", "report"); workflow.add_edge("report", END)
 langgraph_app = workflow.compile()
 
+@app.on_event("startup")
+def warm_vertex_client():
+    try:
+        warm_vertex(SYSTEM_SCORING_INSTRUCTIONS)
+        rprint("[green]✓ Vertex AI client ready.[/green]")
+    except Exception as e:
+        rprint(f"[yellow]Vertex AI warm-up skipped: {e}[/yellow]")
+
 @app.post("/assess", response_model=AssessmentResponse)
+@single_flight()
 async def run_assessment_endpoint(request: AssessmentRequest):
     try:
         rprint(Panel.fit("[bold]Received new assessment request via API[/bold]", style="blue"))
@@ -256,14 +291,20 @@ async def run_assessment_endpoint(request: AssessmentRequest):
             "controls": {k: v.model_dump() for k, v in request.controls.items()},
         }
         
-        final_state = langgraph_app.invoke(initial_state)
+        final_state = await asyncio.to_thread(langgraph_app.invoke, initial_state)
+
+        assessment_id = save_assessment(build_record(
+            final_state['questions'], final_state['answers_map'], final_state['controls'],
+            final_state['policy_documents'], final_state['per_question_scores'],
+            final_state['per_question_rationales'], FRAMEWORKS))
 
         response_data = AssessmentResponse(
             scores={fw: round(score, 2) for fw, score in final_state['framework_scores'].items()},
             overall=round(final_state['overall_score'], 2),
             recommendations=final_state['recommendations'],
             detailed_analysis=final_state['detailed_analysis'],
-            full_report=final_state['report']
+            full_report=final_state['report'],
+            assessment_id=assessment_id
         )
         
         rprint(Panel(json.dumps(response_data.model_dump(), indent=2), title="[bold cyan]Final API Response[/bold cyan]", border_style="cyan"))
@@ -273,6 +314,26 @@ async def run_assessment_endpoint(request: AssessmentRequest):
         rprint(f"[bold red]An error occurred in the endpoint: {e}[/bold red]")
         raise HTTPException(status_code=500, detail=f"An internal error occurred: {e}")
 
+@app.post("/assess/delta", response_model=AssessmentResponse)
+@single_flight()
+async def run_delta_assessment_endpoint(request: AssessmentDeltaRequest):
+    try:
+        rprint(Panel(json.dumps(request.model_dump(), indent=2), title="[blue]Incoming Delta Request[/blue]", border_style="blue"))
+        record = load_assessment(request.assessment_id)
+        record = await asyncio.to_thread(apply_delta, record, request, FRAMEWORKS, score_questions,
+                                         POLICY_DOCUMENTS)
+
+        response_data = delta_response(record, FRAMEWORKS, AssessmentResponse,
+                                       lambda state: compile_report_node(generate_analysis_node(state)))
+
+        rprint(Panel(json.dumps(response_data.model_dump(), indent=2), title="[bold cyan]Delta API Response[/bold cyan]", border_style="cyan"))
+        return response_data
+    except HTTPException:
+        raise
+    except Exception as e:
+        rprint(f"[bold red]An error occurred in the delta endpoint: {e}[/bold red]")
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {e}")
+
 if __name__ == "__main__":
     rprint("[bold green]Starting AI Governance Assessor API (Debug Mode)...[/bold green]")
     uvicorn.run("governance_agent_v1_debug:app", host="0.0.0.0", port=8001, reload=True)
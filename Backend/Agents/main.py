@@ -1,18 +1,32 @@
 # main.py
 from __future__ import annotations
+import base64
+import binascii
+import hashlib
 import os
 from pathlib import Path
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple, Union
 
+import orjson
 import pandas as pd
-from fastapi import FastAPI, HTTPException, Body, APIRouter
+from fastapi import FastAPI, HTTPException, Body, APIRouter, Response
 from fastapi.middleware.cors import CORSMiddleware
-from dotenv import load_dotenv
 from starlette.requests import Request
-from pydantic import BaseModel
+from pydantic import BaseModel, ValidationError
+
+from dotenv import load_dotenv
 
 # --- Initialization from Orchestrator ---
+# .env has to be loaded before the agents modules read their settings at import time.
 load_dotenv()
+
+from agents.catalog import CatalogEntry, load_catalog, warm_catalogs
+from agents.llm import close_llm_client, open_llm_client
+from agents.excel_io import (AI_CONTROL_COLS, AI_CONTROL_TEXT_FIELDS, AI_RISK_TEXT_FIELDS, CYBER_RISK_TEXT_FIELDS,
+                             NIST_CONTROL_COLS, NIST_CONTROL_TEXT_FIELDS)
+from agents.relevance import RiskControlLinks, bm25_matrix, bm25_ranker, risk_control_links
+from agents.types import ControlOutItem, ControlsIn, ControlsResponse, RiskIn, RiskOutItem, RiskResponse
+
 app = FastAPI(title="AI Governance Agent API (Combined)", version="2.0.0")
 
 # --- CORS from Orchestrator ---
@@ -38,12 +52,15 @@ SHEET_STRIDE_RISKS        = "Sheet"
 SHEET_NIST_CONTROLS       = "Sheet"
 
 # ---------- Helpers (from File 1) ----------
-def _read_xlsx(path: Path, sheet: str) -> pd.DataFrame:
-    if not path.exists():
+def _catalog_entry(path: Path, sheet: str) -> CatalogEntry:
+    """Cached, normalized sheet (text cells, lowercase headers); re-parsed only when the file changes."""
+    try:
+        return load_catalog(path, sheet)
+    except FileNotFoundError:
         raise HTTPException(500, f"Excel not found: {path}")
-    df = pd.read_excel(path, sheet_name=sheet, dtype=str).fillna("")
-    df.columns = [c.strip().lower() for c in df.columns]
-    return df
+
+def _read_xlsx(path: Path, sheet: str) -> pd.DataFrame:
+    return _catalog_entry(path, sheet).frame
 
 def read_ai_risks() -> pd.DataFrame:
     return _read_xlsx(PREDEFINED_RISKS_XLSX, SHEET_PREDEFINED_RISKS)
@@ -78,118 +95,182 @@ def _sev_to_int(v: str) -> int:
     }
     return mapping.get(s, 3)
 
-def _score_row(text: str, hay: str) -> int:
-    """Very simple keyword score: count of overlapping meaningful tokens."""
-    if not text or not hay:
-        return 0
-    t = [w for w in text.lower().split() if len(w) > 3]
-    h = hay.lower()
-    return sum(1 for w in t if w in h)
-
-def _select_relevant_rows_ai(df: pd.DataFrame, summary: str, limit: Optional[int]) -> pd.DataFrame:
-    """Score AI risks by matching summary to name/mitigation."""
-    if not summary:
-        return df if not limit else df.head(limit)
-    scored = []
-    for i, r in df.iterrows():
-        name = str(r.get("risk name") or r.get("risk") or "")
-        mit  = str(r.get("mitigation") or "")
-        s = _score_row(summary, f"{name} {mit}")
-        scored.append((s, i))
-    # Keep rows with score>0; fallback to all if none matched
-    keep = [idx for s, idx in scored if s > 0]
-    out = df.loc[keep] if keep else df
-    if limit:
-        out = out.head(limit)
-    return out
-
-def _select_relevant_rows_cyber(df: pd.DataFrame, summary: str, limit: Optional[int]) -> pd.DataFrame:
-    """Score STRIDE risks by matching summary to description/category/mitigation."""
-    if not summary:
-        return df if not limit else df.head(limit)
-    scored = []
-    for i, r in df.iterrows():
-        desc = str(r.get("risk description") or "")
-        cat  = str(r.get("category") or "")
-        mit  = str(r.get("mitigation") or "")
-        s = _score_row(summary, f"{desc} {cat} {mit}")
-        scored.append((s, i))
-    keep = [idx for s, idx in scored if s > 0]
-    out = df.loc[keep] if keep else df
-    if limit:
-        out = out.head(limit)
-    return out
+# How many of the request's risk ids each control links to (most similar first)
+RELATED_RISKS_PER_CONTROL = int(os.getenv("RELATED_RISKS_PER_CONTROL") or "1")
+
+# Upper bound on items accepted by the :batch endpoints
+MAX_BATCH_ITEMS = int(os.getenv("AGENT_MAX_BATCH_ITEMS") or "500")
+
+def _apply_ranking(df: pd.DataFrame, ranked: Optional[List[Tuple[int, float]]],
+                   limit: Optional[int], min_score: Optional[float]) -> pd.DataFrame:
+    """
+    Rows for a BM25 ranking, highest score first (ranked=None means there was no summary).
+    Without min_score, a summary matching nothing falls back to sheet order.
+    """
+    if ranked:
+        return df.iloc[[row for row, _ in ranked]]
+    if ranked is not None and min_score is not None:
+        return df.iloc[[]]
+    return df if not limit else df.head(limit)
+
+def _select_relevant_rows(entry: CatalogEntry, fields: tuple, summary: str,
+                          limit: Optional[int], min_score: Optional[float] = None) -> pd.DataFrame:
+    """Rank rows against the summary with BM25 and keep the best `limit` (all matches if no limit)."""
+    ranked = bm25_ranker(entry, fields).top_k(summary, limit or None, min_score) if summary else None
+    return _apply_ranking(entry.frame, ranked, limit, min_score)
+
+def _select_relevant_rows_ai(entry: CatalogEntry, summary: str, limit: Optional[int],
+                             min_score: Optional[float] = None) -> pd.DataFrame:
+    """Rank AI risks by matching summary to name/mitigation."""
+    return _select_relevant_rows(entry, AI_RISK_TEXT_FIELDS, summary, limit, min_score)
+
+def _select_relevant_rows_cyber(entry: CatalogEntry, summary: str, limit: Optional[int],
+                                min_score: Optional[float] = None) -> pd.DataFrame:
+    """Rank STRIDE risks by matching summary to description/category/mitigation."""
+    return _select_relevant_rows(entry, CYBER_RISK_TEXT_FIELDS, summary, limit, min_score)
 
 # ---------- Models (from File 1) ----------
-class RiskIn(BaseModel):
-    session_id: str
-    project_id: Optional[str] = None
-    summary: Optional[str] = ""
-    limit: Optional[int] = None
-
-class ControlsIn(BaseModel):
-    session_id: str
-    project_id: Optional[str] = None
-    risk_assessment_id: str
-    risk_ids: Optional[List[str]] = None
-
-class RiskOutItem(BaseModel):
-    risk_id: str
-    risk_assessment_id: str
-    risk_name: str
-    risk_owner: str
-    severity: int
-    justification: str
-    mitigation: str
-    target_date: str
+class RiskBatchItem(BaseModel):
+    ok: bool
+    status: int = 200
+    error: Optional[str] = None
+    result: Optional[RiskResponse] = None
 
-class ControlOutItem(BaseModel):
-    control_id: str
+class RiskBatchResponse(BaseModel):
+    results: List[RiskBatchItem]
+
+class ControlsBatchItem(BaseModel):
+    ok: bool
+    status: int = 200
+    error: Optional[str] = None
+    result: Optional[ControlsResponse] = None
+
+class ControlsBatchResponse(BaseModel):
+    results: List[ControlsBatchItem]
+
+class CoveringControl(BaseModel):
     code: str
     section: str
     control: str
-    requirements: str
-    status: str
-    tickets: str
-    relatedRisks: List[str]
-
-class RiskResponse(BaseModel):
-    session_id: str
-    project_id: Optional[str] = None
-    risk_assessment_id: str
-    parsed_risks: List[RiskOutItem]
-
-class ControlsResponse(BaseModel):
-    session_id: str
-    project_id: Optional[str] = None
-    risk_assessment_id: str
-    parsed_controls: List[ControlOutItem]
+    score: float  # TF-IDF cosine similarity to the risk
 
-# --- APIRouter for Excel-based Endpoints (Orchestrator structure) ---
-excel_agent_router = APIRouter()
+class CoveredRisk(BaseModel):
+    risk_id: str
+    risk_name: str
+    severity: int
+    score: float
 
-# ---------- AI Risk (Logic from File 1) ----------
-@excel_agent_router.post("/ai/risk", response_model=RiskResponse, tags=["Excel Agent - AI"])
-def ai_risk(payload: RiskIn):
-    if not payload.session_id:
-        raise HTTPException(400, "session_id is required")
+class RiskCoverageResponse(BaseModel):
+    risk_id: str
+    catalog: str  # "ai" (predefined) or "cyber" (STRIDE/NIST)
+    controls: List[CoveringControl]
 
-    rid = _mk_assessment_id(payload.session_id)
-    df = read_ai_risks()
-    name_col = "risk name" if "risk name" in df.columns else ("risk" if "risk" in df.columns else None)
+class ControlCoverageResponse(BaseModel):
+    control_id: str
+    catalog: str
+    risks: List[CoveredRisk]
+
+# ---------- Pagination + projection ----------
+def _encode_cursor(offset: int, version: str, scope: str) -> str:
+    raw = orjson.dumps({"o": offset, "v": version, "s": scope})
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+def _decode_cursor(cursor: str, version: str, scope: str) -> int:
+    try:
+        data = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        offset = int(data["o"])
+        if offset < 0:
+            raise ValueError(offset)
+    except (binascii.Error, orjson.JSONDecodeError, KeyError, TypeError, ValueError):
+        raise HTTPException(400, "Invalid cursor")
+    if data.get("s") != scope:
+        raise HTTPException(400, "Cursor does not belong to this query")
+    if data.get("v") != version:
+        raise HTTPException(409, "Catalog changed since this cursor was issued; restart from the first page")
+    return offset
+
+def _page(payload, total: int, version: str, scope: str = "") -> Tuple[int, int, Optional[str]]:
+    """(start, stop, next_cursor) of the requested page over `total` items of one catalog version."""
+    if payload.page_size is not None and payload.page_size < 1:
+        raise HTTPException(400, "page_size must be positive")
+    start = min(_decode_cursor(payload.cursor, version, scope), total) if payload.cursor else 0
+    stop = total if payload.page_size is None else min(total, start + payload.page_size)
+    return start, stop, (_encode_cursor(stop, version, scope) if stop < total else None)
+
+def _query_scope(*parts: Any) -> str:
+    """Short fingerprint of the inputs that decide row order, so a cursor can't cross queries."""
+    return hashlib.sha1(orjson.dumps(parts)).hexdigest()[:12]
+
+def _projection(fields: Optional[List[str]], model: type, key: str) -> Optional[List[str]]:
+    """Requested item fields in model order (always including `key`); None means all of them."""
+    if fields is None:
+        return None
+    unknown = sorted(set(fields) - set(model.model_fields))
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}")
+    return [f for f in model.model_fields if f == key or f in fields]
+
+# ---------- Catalog access + response builders ----------
+def _ai_risk_catalog() -> Tuple[CatalogEntry, str]:
+    entry = _catalog_entry(PREDEFINED_RISKS_XLSX, SHEET_PREDEFINED_RISKS)
+    cols = entry.frame.columns
+    name_col = "risk name" if "risk name" in cols else ("risk" if "risk" in cols else None)
     if not name_col:
         raise HTTPException(500, "AI risks sheet is missing 'risk name' column")
+    return entry, name_col
 
-    df2 = _select_relevant_rows_ai(df, payload.summary or "", payload.limit)
+def _cyber_risk_catalog() -> CatalogEntry:
+    entry = _catalog_entry(STRIDE_RISKS_XLSX, SHEET_STRIDE_RISKS)
+    for c in ("risk id", "risk description", "severity"):
+        if c not in entry.frame.columns:
+            raise HTTPException(500, f"STRIDE sheet is missing '{c}' column")
+    return entry
+
+def _controls_catalog(path: Path, sheet: str, cols: tuple, label: str) -> CatalogEntry:
+    entry = _catalog_entry(path, sheet)
+    for c in cols:
+        if c not in entry.frame.columns:
+            raise HTTPException(500, f"{label} sheet is missing '{c}' column")
+    return entry
+
+def _ai_controls_catalog() -> Tuple[CatalogEntry, RiskControlLinks]:
+    entry = _controls_catalog(PREDEFINED_CONTROLS_XLSX, SHEET_PREDEFINED_CONTROLS, AI_CONTROL_COLS, "AI controls")
+    risks, _ = _ai_risk_catalog()
+    return entry, risk_control_links(risks, AI_RISK_TEXT_FIELDS, "risk id", entry, AI_CONTROL_TEXT_FIELDS, AI_CONTROL_COLS[0])
+
+def _nist_controls_catalog() -> Tuple[CatalogEntry, RiskControlLinks]:
+    entry = _controls_catalog(NIST_CONTROLS_XLSX, SHEET_NIST_CONTROLS, NIST_CONTROL_COLS, "NIST controls")
+    risks = _cyber_risk_catalog()
+    return entry, risk_control_links(risks, CYBER_RISK_TEXT_FIELDS, "risk id", entry, NIST_CONTROL_TEXT_FIELDS, NIST_CONTROL_COLS[0])
+
+def _coverage_catalogs(catalog: Optional[str]):
+    """(name, risk entry, risk name col, severity cols, control entry, control cols, links) per catalog pair."""
+    if catalog not in (None, "ai", "cyber"):
+        raise HTTPException(400, "catalog must be 'ai' or 'cyber'")
+    if catalog in (None, "ai"):
+        risks, name_col = _ai_risk_catalog()
+        controls, links = _ai_controls_catalog()
+        yield "ai", risks, name_col, ("base_severity", "severity"), controls, AI_CONTROL_COLS, links
+    if catalog in (None, "cyber"):
+        controls, links = _nist_controls_catalog()
+        yield "cyber", _cyber_risk_catalog(), "risk description", ("severity", "base_severity"), controls, NIST_CONTROL_COLS, links
+
+def _risk_response(payload: RiskIn, entry: CatalogEntry, rows: pd.DataFrame,
+                   name_col: str, sev_cols: tuple) -> Union[RiskResponse, Response]:
+    """One page of ranked rows as a RiskResponse (a projected JSON Response when `fields` is set)."""
+    fields = _projection(payload.fields, RiskOutItem, "risk_id")
+    scope = _query_scope(payload.summary or "", payload.limit, payload.min_score)
+    start, stop, next_cursor = _page(payload, len(rows), entry.version, scope)
 
+    rid = _mk_assessment_id(payload.session_id)
     out: List[RiskOutItem] = []
-    for _, r in df2.iterrows():
+    for _, r in rows.iloc[start:stop].iterrows():
         risk_id = (r.get("risk id") or "").strip()
         if not risk_id:
             continue
         name = (r.get(name_col) or "").strip()
-        sev   = _sev_to_int(r.get("base_severity") or r.get("severity") or "")
-        mit   = (r.get("mitigation") or "").strip()
+        sev  = _sev_to_int(next((r.get(c) for c in sev_cols if r.get(c)), ""))
+        mit  = (r.get("mitigation") or "").strip()
 
         out.append(RiskOutItem(
             risk_id=risk_id,
@@ -202,153 +283,256 @@ def ai_risk(payload: RiskIn):
             target_date=""
         ))
 
-    return RiskResponse(
+    resp = RiskResponse(
         session_id=payload.session_id,
         project_id=payload.project_id,
         risk_assessment_id=rid,
-        parsed_risks=out
+        parsed_risks=out,
+        next_cursor=next_cursor
     )
+    if fields is None:
+        return resp
+    include = {k: True for k in ("session_id", "project_id", "risk_assessment_id", "next_cursor")}
+    include["parsed_risks"] = {"__all__": set(fields)}
+    return Response(orjson.dumps(resp.model_dump(include=include)), media_type="application/json")
 
-# ---------- AI Controls (Logic from File 1 - Corrected) ----------
-@excel_agent_router.post("/ai/controls", response_model=ControlsResponse, tags=["Excel Agent - AI"])
-def ai_controls(payload: ControlsIn):
+def _check_controls_payload(payload: ControlsIn) -> None:
     if not payload.session_id:
         raise HTTPException(400, "session_id is required")
     if not payload.risk_assessment_id:
         raise HTTPException(400, "risk_assessment_id is required")
 
-    df = read_ai_controls()
-    for c in ("code", "section", "control", "requirements"):
-        if c not in df.columns:
-            raise HTTPException(500, f"AI controls sheet is missing '{c}' column")
-
-    # rotate through provided risk_ids (if any)
+# Static fields of every ControlOutItem, in model order after control_id
+CONTROL_STATIC_FIELDS = ("code", "section", "control", "requirements", "status", "tickets")
+
+ControlFragment = Tuple[int, bytes, bytes, Dict[str, bytes]]
+
+def _control_fragments(entry: CatalogEntry, cols: tuple) -> List[ControlFragment]:
+    """
+    Per catalog version, for every control row: (sheet position, control_id suffix, all static
+    fields, field -> b'"key":value'), already JSON-encoded. Requests only splice in the
+    assessment id and relatedRisks.
+    """
+    def build() -> List[ControlFragment]:
+        frame = entry.frame
+        code_col, section_col, name_col, reqs_col = cols
+        columns = [frame[c].tolist() for c in cols]
+        out: List[ControlFragment] = []
+        for pos, (j, code, section, name, reqs) in enumerate(zip(frame.index, *columns)):
+            code = (code or "").strip()
+            if not code:
+                continue
+            values = (code, (section or "").strip(), (name or "").strip(), (reqs or "").strip(),
+                      "Not Implemented", "None")
+            parts = {k: orjson.dumps(k) + b":" + orjson.dumps(v) for k, v in zip(CONTROL_STATIC_FIELDS, values)}
+            tail = b"," + b",".join(parts.values()) + b',"relatedRisks":'
+            out.append((pos, f'{j+1:03d}"'.encode(), tail, parts))
+        return out
+    return entry.memo(("control_fragments", cols), build)
+
+def _controls_json(payload: ControlsIn, entry: CatalogEntry, cols: tuple, links: RiskControlLinks) -> bytes:
+    """One page of ControlsResponse for the payload, serialized straight from the cached row fragments."""
+    fields = _projection(payload.fields, ControlOutItem, "control_id")
+    frags = _control_fragments(entry, cols)
+    start, stop, next_cursor = _page(payload, len(frags), entry.version)
+    raid = payload.risk_assessment_id
+
+    # link each control to the most similar of the provided risk_ids (precomputed per catalog version)
     rids = [r for r in (payload.risk_ids or []) if r]
-    idx = 0
-
-    out: List[ControlOutItem] = []
-    for j, r in df.iterrows():
-        code = (r.get("code") or "").strip()
-        if not code:
-            continue
-        section = (r.get("section") or "").strip()
-        name    = (r.get("control") or "").strip()
-        reqs    = (r.get("requirements") or "").strip()
-
-        # choose a related risk id, or fallback to assessment id
-        if rids:
-            related = [rids[idx % len(rids)]]
-            idx += 1
+    related_by_row = links.related_risks(rids, RELATED_RISKS_PER_CONTROL) if rids else {}
+
+    # related risk ids of linked controls; the assessment id for controls linked to none of them
+    fallback = orjson.dumps([raid])
+    encoded: Dict[Tuple[str, ...], bytes] = {}
+    head = b'{"control_id":' + orjson.dumps(f"CTRL-{raid}-")[:-1]
+    static = None if fields is None else [f for f in fields if f in CONTROL_STATIC_FIELDS]
+    items: List[bytes] = []
+    for pos, suffix, tail, parts in frags[start:stop]:
+        rel = b""
+        if fields is None or "relatedRisks" in fields:
+            related = related_by_row.get(pos)
+            if related:
+                key = tuple(related)
+                rel = encoded.get(key)
+                if rel is None:
+                    rel = encoded[key] = orjson.dumps(related)
+            else:
+                rel = fallback
+        if static is None:
+            items.append(head + suffix + tail + rel + b"}")
         else:
-            related = [payload.risk_assessment_id]
-
-        out.append(ControlOutItem(
-            control_id=f"CTRL-{payload.risk_assessment_id}-{j+1:03d}",
-            code=code,
-            section=section,
-            control=name,
-            requirements=reqs,
-            status="Not Implemented",
-            tickets="None",
-            relatedRisks=related
-        ))
+            pieces = [head + suffix] + [parts[f] for f in static]
+            if rel:
+                pieces.append(b'"relatedRisks":' + rel)
+            items.append(b",".join(pieces) + b"}")
+
+    return (b'{"session_id":' + orjson.dumps(payload.session_id)
+            + b',"project_id":' + orjson.dumps(payload.project_id)
+            + b',"risk_assessment_id":' + orjson.dumps(raid)
+            + b',"parsed_controls":[' + b",".join(items)
+            + b'],"next_cursor":' + orjson.dumps(next_cursor) + b"}")
+
+# ---------- Batch helpers ----------
+def _validate_batch(items: List[Dict[str, Any]], model: type) -> List[Tuple[Optional[BaseModel], Optional[str]]]:
+    """Validate each raw item on its own so one bad payload doesn't fail the batch."""
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(413, f"Batch too large: {len(items)} items (max {MAX_BATCH_ITEMS})")
+    parsed: List[Tuple[Optional[BaseModel], Optional[str]]] = []
+    for raw in items:
+        try:
+            parsed.append((model.model_validate(raw), None))
+        except ValidationError as e:
+            parsed.append((None, str(e)))
+    return parsed
+
+def _risk_batch(items: List[Dict[str, Any]], entry: CatalogEntry, fields: tuple,
+                name_col: str, sev_cols: tuple) -> Response:
+    parsed = _validate_batch(items, RiskIn)
+
+    # Score every summary in the batch with one sparse product against the catalog.
+    score_row: Dict[int, int] = {}
+    summaries: List[str] = []
+    for i, (payload, _) in enumerate(parsed):
+        if payload is not None and payload.summary:
+            score_row[i] = len(summaries)
+            summaries.append(payload.summary)
+    matrix = bm25_matrix(entry, fields)
+    scores = matrix.score_many(summaries) if summaries else None
+
+    results: List[bytes] = []
+    for i, (payload, err) in enumerate(parsed):
+        if err is not None:
+            results.append(orjson.dumps(RiskBatchItem(ok=False, status=422, error=err).model_dump()))
+            continue
+        try:
+            if not payload.session_id:
+                raise HTTPException(400, "session_id is required")
+            ranked = None
+            if i in score_row:
+                ranked = matrix.top_k_row(scores, score_row[i], payload.limit or None, payload.min_score)
+            rows = _apply_ranking(entry.frame, ranked, payload.limit, payload.min_score)
+            result = _risk_response(payload, entry, rows, name_col, sev_cols)
+            body = result.body if isinstance(result, Response) else orjson.dumps(result.model_dump())
+            results.append(b'{"ok":true,"status":200,"error":null,"result":' + body + b"}")
+        except HTTPException as e:
+            results.append(orjson.dumps(RiskBatchItem(ok=False, status=e.status_code, error=str(e.detail)).model_dump()))
+    return Response(b'{"results":[' + b",".join(results) + b"]}", media_type="application/json")
+
+def _controls_batch(items: List[Dict[str, Any]], entry: CatalogEntry, cols: tuple,
+                    links: RiskControlLinks) -> Response:
+    results: List[bytes] = []
+    for payload, err in _validate_batch(items, ControlsIn):
+        if err is not None:
+            results.append(orjson.dumps(ControlsBatchItem(ok=False, status=422, error=err).model_dump()))
+            continue
+        try:
+            _check_controls_payload(payload)
+            results.append(b'{"ok":true,"status":200,"error":null,"result":'
+                           + _controls_json(payload, entry, cols, links) + b"}")
+        except HTTPException as e:
+            results.append(orjson.dumps(ControlsBatchItem(ok=False, status=e.status_code, error=str(e.detail)).model_dump()))
+    return Response(b'{"results":[' + b",".join(results) + b"]}", media_type="application/json")
 
-    return ControlsResponse(
-        session_id=payload.session_id,
-        project_id=payload.project_id,
-        risk_assessment_id=payload.risk_assessment_id,
-        parsed_controls=out
-    )
+# --- APIRouter for Excel-based Endpoints (Orchestrator structure) ---
+excel_agent_router = APIRouter()
 
-# ---------- Cyber Risk (Logic from File 1) ----------
-@excel_agent_router.post("/cyber/risk", response_model=RiskResponse, tags=["Excel Agent - Cyber"])
-def cyber_risk(payload: RiskIn):
+# ---------- AI Risk (Logic from File 1) ----------
+@excel_agent_router.post("/ai/risk", response_model=RiskResponse, tags=["Excel Agent - AI"])
+def ai_risk(payload: RiskIn):
     if not payload.session_id:
         raise HTTPException(400, "session_id is required")
 
-    rid = _mk_assessment_id(payload.session_id)
-    df = read_cyber_risks()
-    for c in ("risk id", "risk description", "severity"):
-        if c not in df.columns:
-            raise HTTPException(500, f"STRIDE sheet is missing '{c}' column")
+    entry, name_col = _ai_risk_catalog()
+    df2 = _select_relevant_rows_ai(entry, payload.summary or "", payload.limit, payload.min_score)
+    return _risk_response(payload, entry, df2, name_col, ("base_severity", "severity"))
 
-    df2 = _select_relevant_rows_cyber(df, payload.summary or "", payload.limit)
+@excel_agent_router.post("/ai/risk:batch", response_model=RiskBatchResponse, tags=["Excel Agent - AI"])
+def ai_risk_batch(items: List[Dict[str, Any]] = Body(...)):
+    """Evaluate many RiskIn payloads against the cached AI catalog; results keep request order."""
+    entry, name_col = _ai_risk_catalog()
+    return _risk_batch(items, entry, AI_RISK_TEXT_FIELDS, name_col, ("base_severity", "severity"))
 
-    out: List[RiskOutItem] = []
-    for _, r in df2.iterrows():
-        risk_id = (r.get("risk id") or "").strip()
-        if not risk_id:
-            continue
-        name = (r.get("risk description") or "").strip()
-        sev  = _sev_to_int(r.get("severity") or r.get("base_severity") or "")
-        mit  = (r.get("mitigation") or "").strip()
-
-        out.append(RiskOutItem(
-            risk_id=risk_id,
-            risk_assessment_id=rid,
-            risk_name=name,
-            risk_owner="Owner",
-            severity=sev,
-            justification="",
-            mitigation=mit,
-            target_date=""
-        ))
+# ---------- AI Controls (Logic from File 1 - Corrected) ----------
+@excel_agent_router.post("/ai/controls", response_model=ControlsResponse, tags=["Excel Agent - AI"])
+def ai_controls(payload: ControlsIn):
+    _check_controls_payload(payload)
+    entry, links = _ai_controls_catalog()
+    return Response(_controls_json(payload, entry, AI_CONTROL_COLS, links), media_type="application/json")
 
-    return RiskResponse(
-        session_id=payload.session_id,
-        project_id=payload.project_id,
-        risk_assessment_id=rid,
-        parsed_risks=out
-    )
+@excel_agent_router.post("/ai/controls:batch", response_model=ControlsBatchResponse, tags=["Excel Agent - AI"])
+def ai_controls_batch(items: List[Dict[str, Any]] = Body(...)):
+    """Evaluate many ControlsIn payloads against the cached AI controls; results keep request order."""
+    entry, links = _ai_controls_catalog()
+    return _controls_batch(items, entry, AI_CONTROL_COLS, links)
 
-# ---------- Cyber Controls (Logic from File 1 - Corrected) ----------
-@excel_agent_router.post("/cyber/controls", response_model=ControlsResponse, tags=["Excel Agent - Cyber"])
-def cyber_controls(payload: ControlsIn):
+# ---------- Cyber Risk (Logic from File 1) ----------
+@excel_agent_router.post("/cyber/risk", response_model=RiskResponse, tags=["Excel Agent - Cyber"])
+def cyber_risk(payload: RiskIn):
     if not payload.session_id:
         raise HTTPException(400, "session_id is required")
-    if not payload.risk_assessment_id:
-        raise HTTPException(400, "risk_assessment_id is required")
 
-    df = read_nist_controls()
-    for c in ("control id", "family", "control name", "control description"):
-        if c not in df.columns:
-            raise HTTPException(500, f"NIST controls sheet is missing '{c}' column")
+    entry = _cyber_risk_catalog()
+    df2 = _select_relevant_rows_cyber(entry, payload.summary or "", payload.limit, payload.min_score)
+    return _risk_response(payload, entry, df2, "risk description", ("severity", "base_severity"))
 
-    rids = [r for r in (payload.risk_ids or []) if r]
-    idx = 0
+@excel_agent_router.post("/cyber/risk:batch", response_model=RiskBatchResponse, tags=["Excel Agent - Cyber"])
+def cyber_risk_batch(items: List[Dict[str, Any]] = Body(...)):
+    """Evaluate many RiskIn payloads against the cached STRIDE catalog; results keep request order."""
+    entry = _cyber_risk_catalog()
+    return _risk_batch(items, entry, CYBER_RISK_TEXT_FIELDS, "risk description", ("severity", "base_severity"))
 
-    out: List[ControlOutItem] = []
-    for j, r in df.iterrows():
-        cid   = (r.get("control id") or "").strip()
-        if not cid:
+# ---------- Cyber Controls (Logic from File 1 - Corrected) ----------
+@excel_agent_router.post("/cyber/controls", response_model=ControlsResponse, tags=["Excel Agent - Cyber"])
+def cyber_controls(payload: ControlsIn):
+    _check_controls_payload(payload)
+    entry, links = _nist_controls_catalog()
+    return Response(_controls_json(payload, entry, NIST_CONTROL_COLS, links), media_type="application/json")
+
+@excel_agent_router.post("/cyber/controls:batch", response_model=ControlsBatchResponse, tags=["Excel Agent - Cyber"])
+def cyber_controls_batch(items: List[Dict[str, Any]] = Body(...)):
+    """Evaluate many ControlsIn payloads against the cached NIST controls; results keep request order."""
+    entry, links = _nist_controls_catalog()
+    return _controls_batch(items, entry, NIST_CONTROL_COLS, links)
+
+# ---------- Catalog coverage (risk <-> control) ----------
+@excel_agent_router.get("/catalog/risks/{risk_id}/controls", response_model=RiskCoverageResponse, tags=["Excel Agent - Catalog"])
+def risk_coverage(risk_id: str, catalog: Optional[str] = None):
+    """Controls that mitigate a catalog risk (R-xxx or STR-xxx), most similar first."""
+    for name, _, _, _, controls, cols, links in _coverage_catalogs(catalog):
+        edges = links.controls_for_risk(risk_id)
+        if edges is None:
             continue
-        family = (r.get("family") or "").strip()
-        name   = (r.get("control name") or "").strip()
-        desc   = (r.get("control description") or "").strip()
-
-        if rids:
-            related = [rids[idx % len(rids)]]
-            idx += 1
-        else:
-            related = [payload.risk_assessment_id]
-
-        out.append(ControlOutItem(
-            control_id=f"CTRL-{payload.risk_assessment_id}-{j+1:03d}",
-            code=cid,
-            section=family,
-            control=name,
-            requirements=desc,
-            status="Not Implemented",
-            tickets="None",
-            relatedRisks=related
-        ))
-
-    return ControlsResponse(
-        session_id=payload.session_id,
-        project_id=payload.project_id,
-        risk_assessment_id=payload.risk_assessment_id,
-        parsed_controls=out
-    )
+        code_col, section_col, name_col, _ = cols
+        frame = controls.frame
+        return RiskCoverageResponse(
+            risk_id=risk_id,
+            catalog=name,
+            controls=[CoveringControl(code=frame.iat[j, frame.columns.get_loc(code_col)].strip(),
+                                      section=frame.iat[j, frame.columns.get_loc(section_col)].strip(),
+                                      control=frame.iat[j, frame.columns.get_loc(name_col)].strip(),
+                                      score=round(sc, 4))
+                      for j, sc in edges]
+        )
+    raise HTTPException(404, f"Unknown risk id: {risk_id}")
+
+@excel_agent_router.get("/catalog/controls/{control_id}/risks", response_model=ControlCoverageResponse, tags=["Excel Agent - Catalog"])
+def control_coverage(control_id: str, catalog: Optional[str] = None):
+    """Catalog risks a control (AI code or NIST control id) covers, most similar first."""
+    for name, risks, risk_name_col, sev_cols, _, _, links in _coverage_catalogs(catalog):
+        edges = links.risks_for_control(control_id)
+        if edges is None:
+            continue
+        rows = risks.frame.iloc[[i for i, _ in edges]]
+        return ControlCoverageResponse(
+            control_id=control_id,
+            catalog=name,
+            risks=[CoveredRisk(risk_id=(r.get("risk id") or "").strip(),
+                               risk_name=(r.get(risk_name_col) or "").strip(),
+                               severity=_sev_to_int(next((r.get(c) for c in sev_cols if r.get(c)), "")),
+                               score=round(sc, 4))
+                   for (_, r), (_, sc) in zip(rows.iterrows(), edges)]
+        )
+    raise HTTPException(404, f"Unknown control id: {control_id}")
 
 # -------- Middleware and Helpers from Orchestrator (File 2) --------
 
@@ -410,6 +594,32 @@ def _mount_governance():
 _mount_governance()
 
 
+# --- Catalog warm-up (Startup Event) ---
+@app.on_event("startup")
+def warm_catalog_cache():
+    # Sidecars make this cheap; without them it pays the openpyxl parse once per worker.
+    try:
+        warm_catalogs()
+        print("[OK] Catalog cache warmed")
+    except Exception as e:
+        print(f"[WARN] Catalog warm-up skipped: {e}")
+
+
+# --- Shared LLM client (Startup/Shutdown Events) ---
+@app.on_event("startup")
+async def open_shared_llm_client():
+    # One pooled keep-alive client per worker, shared by the LLM-driven agents.
+    try:
+        open_llm_client()
+        print("[OK] Shared LLM client ready")
+    except Exception as e:
+        print(f"[WARN] Shared LLM client not created: {e}")
+
+@app.on_event("shutdown")
+async def close_shared_llm_client():
+    await close_llm_client()
+
+
 # --- Optional RAG Service (Startup Event) ---
 @app.on_event("startup")
 async def startup_event():
@@ -0,0 +1,15 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agents.llm_cache import LLMCache  # noqa: E402
+
+
+@pytest.fixture
+def cache(tmp_path):
+    """An empty LLM cache in a temporary SQLite file."""
+    return LLMCache(tmp_path / "llm_cache.sqlite3", ttl=3600, max_entries=100)
@@ -0,0 +1,145 @@
+# tests/test_assessment_stream.py
+import asyncio
+
+import orjson
+import pandas as pd
+import pytest
+
+from agents.assessment_stream import AssessmentStream, ndjson_events, replay
+from agents.control_fanout import merge_tables
+from agents.markdown_table import table_rows
+
+RISK_TABLE = """| Risk ID | Risk | Owner | Severity | Justification | Mitigation | Target Date |
+|---|---|---|---|---|---|---|
+| R1 | Bias | DS | 4 | Skewed data | Audits | 2025-01-31 |
+| R2 | Drift | ML Ops | 2 | No monitoring | Alerts | 2025-02-28 |
+| R3 | Leakage | Security | 3 | Logs | Redaction | 2025-03-31 |
+"""
+
+# control answer per risk; R2 shares C1 with R1 (a duplicate row), R3 has none
+ANSWERS = {
+    "R1": "| Risk ID | Code |\n|---|---|\n| R1 | C1 |\n| R1 | C2 |",
+    "R2": "| Risk ID | Code |\n|---|---|\n| R1 | C1 |\n| R2 | C3 |",
+    "R3": "| Risk ID | Code |\n|---|---|",
+}
+# later risks' mappings finish first
+DELAYS = {"R1": 0.06, "R2": 0.0, "R3": 0.03}
+
+CONTROLS = pd.DataFrame({"Code": ["C1", "C2", "C3"], "Control": ["Audit", "Review", "Monitor"]})
+
+
+def _risk(cells):
+    keys = ["risk_id", "risk_name", "risk_owner", "severity", "justification", "mitigation", "target_date"]
+    return dict(zip(keys, cells))
+
+
+def _parse_controls(text, risks):
+    rows = [{"control_id": "", "risk_id": cells[0], "code": cells[1]} for cells in table_rows(text)]
+    return rows, text
+
+
+def _stream(log, risks_from_text=None):
+    generating = [True]
+
+    async def generate_risks(on_delta):
+        for line in RISK_TABLE.splitlines(keepends=True):
+            if on_delta is not None:
+                on_delta(line)
+            await asyncio.sleep(0.01)
+        generating[0] = False
+        log.append("risks generated")
+        return RISK_TABLE
+
+    async def generate_controls(matrix, candidates):
+        rid = next(r for r in ANSWERS if f"| {r} |" in matrix)
+        log.append(f"map {rid}" + (" while generating" if generating[0] else ""))
+        await asyncio.sleep(DELAYS[rid])
+        return ANSWERS[rid]
+
+    return AssessmentStream("A1", CONTROLS, generate_risks, lambda rows: [_risk(r) for r in rows],
+                            lambda raw, risks: raw, risks_from_text, generate_controls, merge_tables,
+                            _parse_controls)
+
+
+async def _collect(events):
+    return [event async for event in events]
+
+
+def test_stream_emits_risks_then_controls_in_risk_order():
+    log = []
+    stream = _stream(log)
+    events = asyncio.run(_collect(stream.events()))
+
+    kinds = [e["event"] for e in events]
+    assert kinds[-1] == "done" and kinds.count("done") == 1
+    assert [e["data"]["risk_id"] for e in events if e["event"] == "risk"] == ["R1", "R2", "R3"]
+    controls = [e["data"] for e in events if e["event"] == "control"]
+    assert [(c["risk_id"], c["code"]) for c in controls] == [("R1", "C1"), ("R1", "C2"), ("R2", "C3")]
+    assert [c["control_id"] for c in controls] == ["CTRL-A1-001", "CTRL-A1-002", "CTRL-A1-003"]
+    # every control follows the risk it belongs to
+    for control in controls:
+        assert events.index(next(e for e in events if e["event"] == "risk"
+                                 and e["data"]["risk_id"] == control["risk_id"])) < \
+            events.index(next(e for e in events if e["data"] is control))
+
+
+def test_stream_maps_controls_while_the_risk_matrix_is_generated():
+    log = []
+    asyncio.run(_collect(_stream(log).events()))
+    assert log.index("map R1 while generating") < log.index("risks generated")
+
+
+def test_stream_done_summary_matches_the_events():
+    stream = _stream([])
+    events = asyncio.run(_collect(stream.events()))
+    done = events[-1]["data"]
+    assert done["risk_assessment_id"] == "A1"
+    assert done["risks"] == 3 and done["controls"] == 3
+    assert done["risk_matrix"] == RISK_TABLE
+    assert stream.control_raw == merge_tables([ANSWERS["R1"], ANSWERS["R2"], ANSWERS["R3"]])
+    assert done["control_matrix"] == stream.control_raw
+    assert [c["code"] for c in stream.controls] == ["C1", "C2", "C3"]
+
+
+def test_stream_from_json_output_parses_risks_once_generated():
+    log = []
+    stream = _stream(log, risks_from_text=lambda raw: [_risk(r) for r in table_rows(raw)])
+    events = asyncio.run(_collect(stream.events()))
+    assert [e["data"]["risk_id"] for e in events if e["event"] == "risk"] == ["R1", "R2", "R3"]
+    assert not any("while generating" in entry for entry in log)
+    assert events[-1]["data"]["controls"] == 3
+
+
+def test_replay_yields_the_events_of_a_finished_assessment():
+    stream = _stream([])
+    live = asyncio.run(_collect(stream.events()))
+    done = live[-1]["data"]
+    replayed = asyncio.run(_collect(replay("A1", stream.risks, stream.controls, done["risk_matrix"],
+                                           done["control_matrix"], done["prompt_fingerprint"])))
+    assert replayed == live
+
+
+def test_ndjson_events_turns_a_failure_into_a_final_error_event():
+    async def events():
+        yield {"event": "risk", "data": {"risk_id": "R1"}}
+        raise ValueError("boom")
+
+    completed = []
+    lines = asyncio.run(_collect(ndjson_events(events(), lambda: completed.append(True))))
+    assert [orjson.loads(line)["event"] for line in lines] == ["risk", "error"]
+    assert "boom" in orjson.loads(lines[-1])["data"]["detail"]
+    assert completed == []
+
+
+def test_stream_error_propagates_and_cancels_pending_mappings():
+    async def generate_controls(matrix, candidates):
+        raise RuntimeError("mapping failed")
+
+    async def generate_risks(on_delta):
+        on_delta(RISK_TABLE)
+        return RISK_TABLE
+
+    stream = AssessmentStream("A1", CONTROLS, generate_risks, lambda rows: [_risk(r) for r in rows],
+                              lambda raw, risks: raw, None, generate_controls, merge_tables, _parse_controls)
+    with pytest.raises(RuntimeError, match="mapping failed"):
+        asyncio.run(_collect(stream.events()))
@@ -0,0 +1,116 @@
+# tests/test_batch_scoring.py
+import threading
+import time
+
+from agents import batch_scoring
+from agents.batch_scoring import ScoringItem, batch_overhead, item_cost, plan_batches, score_each, score_in_batches
+
+
+def _items(n, answer="x" * 40):
+    return [ScoringItem(f"q{i}", f"Question {i}?", [answer]) for i in range(n)]
+
+
+def test_plan_batches_packs_in_order_within_budget():
+    items = _items(10)
+    cost = item_cost(items[0])
+    batches = plan_batches(items, budget=3 * cost)
+    assert [len(b) for b in batches] == [3, 3, 3, 1]
+    assert [i.question_id for b in batches for i in b] == [i.question_id for i in items]
+
+
+def test_plan_batches_subtracts_overhead():
+    items = _items(6)
+    cost = item_cost(items[0])
+    assert [len(b) for b in plan_batches(items, budget=4 * cost, overhead=2 * cost)] == [2, 2, 2]
+
+
+def test_plan_batches_overhead_filling_budget_gives_one_question_per_batch():
+    items = _items(3)
+    assert [len(b) for b in plan_batches(items, budget=100, overhead=100)] == [1, 1, 1]
+
+
+def test_oversized_question_gets_its_own_batch():
+    small = _items(4)
+    items = small[:2] + [ScoringItem("big", "Q?", ["y" * 4000])] + small[2:]
+    batches = plan_batches(items, budget=3 * item_cost(small[0]))
+    assert [[i.question_id for i in b] for b in batches] == [["q0", "q1"], ["big"], ["q2", "q3"]]
+
+
+def test_batch_overhead_counts_policy():
+    assert batch_overhead("p" * 400) == batch_overhead("") + 100
+
+
+def test_score_in_batches_falls_back_to_single_scoring(monkeypatch):
+    items = _items(4)
+    calls, failed = [], []
+
+    def rate_batch(model, project, location, batch, policy):
+        calls.append([i.question_id for i in batch])
+        if "q0" in calls[-1]:
+            raise ValueError("unparsable")
+        return {"q2": (3, "batched")}  # q3 left out of the response
+
+    monkeypatch.setattr(batch_scoring, "rate_batch", rate_batch)
+    ratings = score_in_batches(items, "", "m", "p", "l", lambda item: (1, "single"), concurrency=2,
+                               on_error=lambda batch, e: failed.append(len(batch)),
+                               budget=batch_overhead("") + 2 * item_cost(items[0]))
+    assert calls == [["q0", "q1"], ["q2", "q3"]]
+    assert failed == [2]
+    assert ratings == {"q0": (1, "single"), "q1": (1, "single"), "q2": (3, "batched"), "q3": (1, "single")}
+
+
+def test_score_in_batches_with_policy_over_budget_scores_each_question_alone(monkeypatch):
+    items = _items(3)
+    calls = []
+    monkeypatch.setattr(batch_scoring, "rate_batch", lambda m, p, l, batch, policy: (
+        calls.append(len(batch)) or {i.question_id: (2, "ok") for i in batch}))
+    ratings = score_in_batches(items, "policy " * 1000, "m", "p", "l", lambda item: (0, ""), concurrency=1,
+                               budget=200)
+    assert calls == [1, 1, 1]
+    assert set(ratings) == {"q0", "q1", "q2"}
+
+
+def test_score_each_returns_ratings_in_question_order_whatever_finishes_first():
+    items = _items(5)
+
+    def score_one(item):
+        time.sleep(0.01 * (5 - int(item.question_id[1:])))  # later questions finish first
+        return int(item.question_id[1:]), item.question_id
+
+    ratings = score_each(items, score_one, concurrency=5)
+    assert list(ratings) == ["q0", "q1", "q2", "q3", "q4"]
+    assert ratings["q3"] == (3, "q3")
+
+
+def test_score_each_keeps_at_most_concurrency_requests_in_flight():
+    lock = threading.Lock()
+    in_flight, peak = [0], [0]
+
+    def score_one(item):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return 1, ""
+
+    assert len(score_each(_items(12), score_one, concurrency=3)) == 12
+    assert peak[0] == 3
+
+
+def test_score_each_passes_ordered_results_through_progress():
+    seen = []
+
+    def progress(results):
+        for rating in results:
+            seen.append(rating)
+            yield rating
+
+    ratings = score_each(_items(3), lambda item: (0, item.question_id), concurrency=2, progress=progress)
+    assert seen == [(0, "q0"), (0, "q1"), (0, "q2")]
+    assert ratings == {"q0": (0, "q0"), "q1": (0, "q1"), "q2": (0, "q2")}
+
+
+def test_score_each_with_no_items():
+    assert score_each([], lambda item: (0, ""), concurrency=4) == {}
@@ -0,0 +1,35 @@
+# tests/test_control_fanout.py
+import asyncio
+
+import pandas as pd
+
+from agents.control_fanout import map_controls_per_risk, merge_tables
+
+CONTROLS = pd.DataFrame({"Code": ["C1", "C2"], "Control": ["Audit", "Review"]})
+
+
+def _risks(n):
+    return [{"risk_id": f"R{i}", "risk_name": f"Risk {i}", "risk_owner": "", "severity": "", "justification": "",
+             "mitigation": "", "target_date": ""} for i in range(n)]
+
+
+def test_merge_tables_keeps_one_header_and_drops_duplicate_rows():
+    merged = merge_tables(["intro\n| A | B |\n|---|---|\n| 1 | x |", "| A | B |\n|---|---|\n| 1 | x |\n| 2 | y |", ""])
+    assert merged == "| A | B |\n|---|---|\n| 1 | x |\n| 2 | y |"
+
+
+def test_map_controls_per_risk_merges_in_risk_order_within_the_concurrency_limit():
+    in_flight, peak = [0], [0]
+
+    async def generate(matrix, candidates):
+        rid = next(r for r in ("R0", "R1", "R2", "R3", "R4") if f"| {r} |" in matrix)
+        in_flight[0] += 1
+        peak[0] = max(peak[0], in_flight[0])
+        await asyncio.sleep(0.01 * (5 - int(rid[1:])))  # later risks answer first
+        in_flight[0] -= 1
+        return f"| Risk ID | Code |\n|---|---|\n| {rid} | C1 |"
+
+    text, candidates = asyncio.run(map_controls_per_risk(_risks(5), CONTROLS, generate, group_size=2, concurrency=2))
+    assert text.splitlines()[2:] == ["| R0 | C1 |", "| R2 | C1 |", "| R4 | C1 |"]
+    assert peak[0] == 2
+    assert candidates.ids == ["C1", "C2"]
@@ -0,0 +1,139 @@
+# tests/test_governance_delta.py
+from typing import Any, Dict, List, Optional
+
+import pytest
+from fastapi import HTTPException
+from pydantic import BaseModel
+
+from agents import governance_delta
+from agents.governance_delta import (AssessmentDeltaRequest, apply_delta, build_record, delta_response,
+                                     framework_scores, load_assessment, save_assessment)
+
+FRAMEWORKS = ["EU", "NIST", "ISO"]
+POLICY = "All AI systems need a risk assessment."
+
+QUESTIONS = [{"id": f"q{i}", "text": f"Question {i}?", "weights": {"EU": 0.3 * i, "NIST": 0.9, "ISO": 0.1 * (i % 3)}}
+             for i in range(6)]
+CONTROLS = {f"c{i}": {"desc": f"Control {i}", "weights": {"EU": 0.7, "NIST": 0.2 * i, "ISO": 0.9}, "evidence": i % 2 == 0}
+            for i in range(4)}
+ANSWERS = {q["id"]: f"answer {q['id']}" for q in QUESTIONS}
+
+
+def maturity(answer):
+    return sum(map(ord, answer)) % 5
+
+
+def rescore(questions, answers_map, policy_documents):
+    assert policy_documents == POLICY
+    rescored.extend(q["id"] for q in questions)
+    return {q["id"]: (maturity(answers_map[q["id"]]), f"rated {answers_map[q['id']]}") for q in questions}
+
+
+rescored = []
+
+
+def full_record(answers, controls):
+    """What a full assessment of ``answers`` and ``controls`` stores."""
+    scores = {qid: maturity(a) for qid, a in answers.items()}
+    return build_record(QUESTIONS, dict(answers), controls, POLICY, scores,
+                        {qid: f"rated {a}" for qid, a in answers.items()}, FRAMEWORKS)
+
+
+@pytest.fixture(autouse=True)
+def _setup(cache, monkeypatch):
+    monkeypatch.setattr(governance_delta, "assessment_store", cache)
+    rescored.clear()
+
+
+def test_delta_matches_full_assessment():
+    record = full_record(ANSWERS, CONTROLS)
+    delta = AssessmentDeltaRequest(assessment_id="GA-x", answers={"q2": "changed", "q3": ANSWERS["q3"]},
+                                   evidence={"c1": True, "c0": True})
+    updated = apply_delta(record, delta, FRAMEWORKS, rescore, POLICY)
+
+    controls = {k: dict(v) for k, v in CONTROLS.items()}
+    controls["c1"]["evidence"] = True
+    expected = full_record(dict(ANSWERS, q2="changed"), controls)
+    assert rescored == ["q2"]
+    assert updated == expected
+    assert framework_scores(updated["totals"]) == framework_scores(expected["totals"])
+
+
+def test_chained_deltas_do_not_drift():
+    record = full_record(ANSWERS, CONTROLS)
+    for i in range(50):
+        delta = AssessmentDeltaRequest(assessment_id="GA-x", answers={"q1": f"answer {i}", "q4": f"other {i}"},
+                                       evidence={"c3": i % 2 == 0})
+        record = apply_delta(record, delta, FRAMEWORKS, rescore, POLICY)
+    # The last delta (i = 49) turned c3's evidence back off, as in CONTROLS.
+    assert record["totals"] == full_record(dict(ANSWERS, q1="answer 49", q4="other 49"), CONTROLS)["totals"]
+
+
+def test_delta_leaves_the_stored_record_untouched():
+    record = full_record(ANSWERS, CONTROLS)
+    before = full_record(ANSWERS, CONTROLS)
+    apply_delta(record, AssessmentDeltaRequest(assessment_id="GA-x", answers={"q0": "new"}, evidence={"c0": False}),
+                FRAMEWORKS, rescore, POLICY)
+    assert record == before
+
+
+def test_unchanged_delta_rescores_nothing():
+    record = full_record(ANSWERS, CONTROLS)
+    delta = AssessmentDeltaRequest(assessment_id="GA-x", answers={"q0": ANSWERS["q0"]}, evidence={"c0": True})
+    assert apply_delta(record, delta, FRAMEWORKS, rescore, POLICY) == record
+    assert rescored == []
+
+
+def test_unknown_ids_are_rejected():
+    with pytest.raises(HTTPException) as e:
+        apply_delta(full_record(ANSWERS, CONTROLS), AssessmentDeltaRequest(assessment_id="GA-x", answers={"zz": "x"}),
+                    FRAMEWORKS, rescore, POLICY)
+    assert e.value.status_code == 422
+
+
+def test_changed_policy_is_rejected():
+    with pytest.raises(HTTPException) as e:
+        apply_delta(full_record(ANSWERS, CONTROLS), AssessmentDeltaRequest(assessment_id="GA-x", answers={"q0": "x"}),
+                    FRAMEWORKS, rescore, "A different policy.")
+    assert e.value.status_code == 409
+
+
+def test_record_keeps_policy_hash_not_text():
+    record = full_record(ANSWERS, CONTROLS)
+    assert "policy_documents" not in record
+    assert POLICY not in repr(record)
+
+
+def test_saved_assessment_round_trips():
+    record = full_record(ANSWERS, CONTROLS)
+    assert load_assessment(save_assessment(record)) == record
+    with pytest.raises(HTTPException) as e:
+        load_assessment("GA-unknown")
+    assert e.value.status_code == 404
+
+
+class Response(BaseModel):
+    scores: Dict[str, float]
+    overall: float
+    recommendations: List[str]
+    detailed_analysis: Dict[str, Any]
+    full_report: Dict[str, Any]
+    assessment_id: Optional[str] = None
+
+
+def _finish(state):
+    state["recommendations"] = [f"{fw} below 50" for fw, score in state["framework_scores"].items() if score < 50]
+    state["detailed_analysis"] = {}
+    state["report"] = {"scores": {fw: round(s, 2) for fw, s in state["framework_scores"].items()},
+                       "overall": round(state["overall_score"], 2)}
+    return state
+
+
+def test_delta_response_reports_stored_totals_and_saves_the_record():
+    record = full_record(ANSWERS, CONTROLS)
+    response = delta_response(record, FRAMEWORKS, Response, _finish)
+    scores = framework_scores(record["totals"])
+    assert response.scores == {fw: round(s, 2) for fw, s in scores.items()}
+    assert response.overall == round(sum(scores.values()) / 3, 2)
+    assert response.recommendations == [f"{fw} below 50" for fw, s in scores.items() if s < 50]
+    assert load_assessment(response.assessment_id) == record
@@ -0,0 +1,59 @@
+# tests/test_llm_cache.py
+import time
+
+from agents.llm_cache import LLMCache, make_key, normalize_text, template_hash
+
+
+def test_round_trip_per_namespace(cache):
+    cache.put("a", "k", {"rows": [1, 2]})
+    assert cache.get("a", "k") == {"rows": [1, 2]}
+    assert cache.get("b", "k") is None
+    assert cache.stats()["counters"]["a"] == {"writes": 1, "hits": 1}
+
+
+def test_entries_expire_after_ttl(tmp_path, monkeypatch):
+    cache = LLMCache(tmp_path / "c.sqlite3", ttl=10, max_entries=100)
+    now = time.time()
+    monkeypatch.setattr(time, "time", lambda: now)
+    cache.put("ns", "k", 1)
+    monkeypatch.setattr(time, "time", lambda: now + 11)
+    assert cache.get("ns", "k") is None
+    assert cache.stats()["counters"]["ns"]["expired"] == 1
+    assert cache.stats()["entries"] == {}
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, monkeypatch):
+    cache = LLMCache(tmp_path / "c.sqlite3", ttl=3600, max_entries=2)
+    clock = iter(range(1_000_000, 1_000_100))
+    monkeypatch.setattr(time, "time", lambda: float(next(clock)))
+    cache.put("ns", "a", 1)
+    cache.put("ns", "b", 2)
+    assert cache.get("ns", "a") == 1  # b is now the least recently used
+    cache.put("ns", "c", 3)
+    assert cache.get("ns", "b") is None
+    assert (cache.get("ns", "a"), cache.get("ns", "c")) == (1, 3)
+    assert cache.stats()["counters"]["ns"]["evictions"] == 1
+
+
+def test_zero_entries_disables_the_cache(tmp_path):
+    cache = LLMCache(tmp_path / "c.sqlite3", ttl=3600, max_entries=0)
+    cache.put("ns", "k", 1)
+    assert cache.get("ns", "k") is None
+    assert not (tmp_path / "c.sqlite3").exists()
+
+
+def test_keys_and_normalization():
+    assert normalize_text("  Hello\n  WORLD ") == "hello world"
+    assert make_key("a", 1) == make_key("a", 1) != make_key("a", "1")
+
+
+def test_template_hash_follows_prompt_text():
+    def prompt_a():
+        return "Rate the answer."
+
+    def prompt_b():
+        return "Rate the answer strictly."
+
+    prompt_b.__qualname__ = prompt_a.__qualname__  # only the prompt text differs
+    assert template_hash(prompt_a) == template_hash(prompt_a)
+    assert template_hash(prompt_a) != template_hash(prompt_b)
@@ -0,0 +1,54 @@
+# tests/test_markdown_table.py
+import pytest
+
+from agents.markdown_table import MarkdownTableParser, parse_control_table, split_cells, table_rows
+
+TABLE = """Here is the risk matrix:
+
+| Risk ID | Risk | Owner | Severity | Justification | Mitigation | Target Date |
+|:--------|------|-------|---------:|---------------|------------|-------------|
+| AIR-001 | Biased outputs | Data Science | 4 | Skewed training data | Bias audits | 2025-01-31 |
+| AIR-002 | Prompt injection \\| jailbreak | Security |  | Untrusted input | Input filtering | 2025-02-28 |
+AIR-003 | Model drift | ML Ops | 2 | No monitoring | Drift alerts | 2025-03-31
+"""
+
+ROWS = [
+    ["AIR-001", "Biased outputs", "Data Science", "4", "Skewed training data", "Bias audits", "2025-01-31"],
+    ["AIR-002", "Prompt injection | jailbreak", "Security", "", "Untrusted input", "Input filtering", "2025-02-28"],
+    ["AIR-003", "Model drift", "ML Ops", "2", "No monitoring", "Drift alerts", "2025-03-31"],
+]
+
+
+def test_split_cells_handles_borders_escapes_and_empty_cells():
+    assert split_cells("| a | b \\| c |  | d |") == ["a", "b | c", "", "d"]
+    assert split_cells("a | b") == ["a", "b"]
+
+
+def test_table_rows_skips_text_header_and_separator():
+    assert table_rows(TABLE) == ROWS
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64])
+def test_chunked_feed_matches_whole_text(size):
+    parser = MarkdownTableParser()
+    rows = []
+    for i in range(0, len(TABLE), size):
+        rows += parser.feed(TABLE[i:i + size])
+    assert rows + parser.close() == ROWS
+    assert parser.header == ["Risk ID", "Risk", "Owner", "Severity", "Justification", "Mitigation", "Target Date"]
+
+
+def test_rows_are_returned_as_soon_as_their_line_ends():
+    parser = MarkdownTableParser()
+    assert parser.feed("| A | B |\n|---|---|\n| 1 | 2") == []
+    assert parser.feed(" |") == []
+    assert parser.feed("\n| 3") == [["1", "2"]]
+    assert parser.close() == [["3"]]
+
+
+def test_control_table_numbers_controls_in_order():
+    table = ("| CODE | SECTION | CONTROL | REQUIREMENTS | STATUS | TICKETS | Related Risk |\n|---|---|---|---|---|---|---|\n"
+             "| A.1 | Gov | Policy | Write it | Open | | AIR-001 |\n| A.2 | Gov | Review | Yearly | Open | | AIR-002 |\n")
+    controls = parse_control_table(table, "RA-1")
+    assert [(c["control_id"], c["code"], c["related_risk"]) for c in controls] == [
+        ("CTRL-RA-1-001", "A.1", "AIR-001"), ("CTRL-RA-1-002", "A.2", "AIR-002")]
@@ -0,0 +1,74 @@
+# tests/test_pagination.py
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from main import RiskIn, RiskOutItem, _decode_cursor, _encode_cursor, _page, _projection, _query_scope
+
+
+def _payload(**kwargs):
+    return RiskIn(session_id="s", **kwargs)
+
+
+def test_cursor_round_trip():
+    assert _decode_cursor(_encode_cursor(40, "v1", "scope"), "v1", "scope") == 40
+
+
+@pytest.mark.parametrize("version, scope, status", [("v2", "scope", 409), ("v1", "other", 400)])
+def test_cursor_of_another_catalog_version_or_query_is_rejected(version, scope, status):
+    with pytest.raises(HTTPException) as e:
+        _decode_cursor(_encode_cursor(40, "v1", "scope"), version, scope)
+    assert e.value.status_code == status
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", _encode_cursor(-1, "v1", "scope")])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as e:
+        _decode_cursor(cursor, "v1", "scope")
+    assert e.value.status_code == 400
+
+
+def test_pages_cover_all_items_once():
+    scope = _query_scope("summary", None)
+    pages, cursor = [], None
+    while True:
+        start, stop, cursor = _page(_payload(page_size=4, cursor=cursor), 10, "v1", scope)
+        pages.append((start, stop))
+        if cursor is None:
+            break
+    assert pages == [(0, 4), (4, 8), (8, 10)]
+
+
+def test_unpaged_request_returns_everything():
+    assert _page(_payload(), 10, "v1") == (0, 10, None)
+
+
+def test_page_size_must_be_positive():
+    with pytest.raises(HTTPException):
+        _page(_payload(page_size=0), 10, "v1")
+
+
+def test_projection_keeps_model_order_and_key():
+    assert _projection(["severity", "risk_name"], RiskOutItem, "risk_id") == ["risk_id", "risk_name", "severity"]
+    assert _projection(None, RiskOutItem, "risk_id") is None
+    with pytest.raises(HTTPException) as e:
+        _projection(["nope"], RiskOutItem, "risk_id")
+    assert e.value.status_code == 400
+
+
+def test_paged_and_projected_risks_match_the_full_response():
+    client = TestClient(main.app)
+    body = {"session_id": "s", "summary": "biased model decisions about loan applicants"}
+    full = client.post("/agent/ai/risk", json=body).json()["parsed_risks"]
+    assert len(full) > 3
+
+    paged, cursor = [], None
+    while True:
+        page = client.post("/agent/ai/risk", json=dict(body, page_size=3, cursor=cursor,
+                                                   fields=["risk_name", "severity"])).json()
+        paged += page["parsed_risks"]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert paged == [{k: r[k] for k in ("risk_id", "risk_name", "severity")} for r in full]
@@ -0,0 +1,57 @@
+# tests/test_prefilter.py
+import logging
+
+from agents import prefilter
+from agents.catalog import load_catalog
+from agents.excel_io import NIST_CONTROLS_XLSX, PREDEFINED_RISKS_XLSX
+from agents.prefilter import audit_recall, merge_prefiltered, prefilter_controls, prefilter_risks
+
+
+def _library():
+    return load_catalog(PREDEFINED_RISKS_XLSX, 0, normalized=False).frame
+
+
+def test_risk_named_in_the_summary_is_a_candidate():
+    library = _library()
+    for row in (0, 7, 30):
+        candidates = prefilter_risks(f"We are worried about {library['RISK NAME'].iloc[row]}", 5)
+        assert library["RISK ID"].iloc[row] in candidates.ids
+        assert len(candidates.ids) <= 5 and candidates.total == len(library)
+
+
+def test_top_k_zero_sends_the_whole_library():
+    assert len(prefilter_risks("anything", 0).ids) == len(_library())
+
+
+def test_linked_controls_of_the_risks_come_first():
+    catalog = load_catalog(NIST_CONTROLS_XLSX, 0)
+    risk_ids = _library()["RISK ID"].iloc[:3].tolist()
+    candidates = prefilter_controls(catalog.frame, "", risk_ids, k=5, catalog=catalog)
+    assert len(candidates.ids) == 5
+    assert candidates.linked  # the links of the three risks
+    assert set(candidates.linked[:5]) == set(candidates.ids)
+
+
+def test_coverage_reports_picks_outside_the_candidates_and_cut_links(caplog):
+    catalog = load_catalog(NIST_CONTROLS_XLSX, 0)
+    candidates = prefilter_controls(catalog.frame, "", _library()["RISK ID"].iloc[:5].tolist(), k=3, catalog=catalog)
+    off_list = next(c for c in catalog.frame["control id"] if c not in candidates.ids)
+    with caplog.at_level(logging.INFO, logger="uvicorn"):
+        assert candidates.log_coverage(candidates.ids[:2] + [off_list]) == [off_list]
+    assert f"1/3 picked IDs were not candidates ({off_list})" in caplog.text
+    assert "linked IDs cut at top-k" in caplog.text
+
+
+def test_merged_candidates_keep_their_links():
+    catalog = load_catalog(NIST_CONTROLS_XLSX, 0)
+    ids = _library()["RISK ID"].tolist()
+    parts = [prefilter_controls(catalog.frame, "", [rid], k=2, catalog=catalog) for rid in ids[:3]]
+    merged = merge_prefiltered(parts)
+    assert set(merged.ids) == set().union(*(p.ids for p in parts))
+    assert set(merged.linked) == set().union(*(p.linked for p in parts))
+
+
+def test_full_catalog_recall_check_is_opt_in():
+    assert prefilter.PREFILTER_RECALL_SAMPLE == 0
+    candidates = prefilter_risks("model stealing", 5)
+    assert audit_recall(candidates, lambda: None) is None
@@ -0,0 +1,44 @@
+# tests/test_prompt_cache.py
+import asyncio
+
+from agents.catalog import load_catalog
+from agents.excel_io import PREDEFINED_RISKS_XLSX
+from agents.prompt_cache import frame_markdown, prompt_fingerprint, system_messages, track_prompts
+
+
+def _fingerprint(*prompts):
+    async def run():
+        tracked = track_prompts()
+        for instructions, catalog in prompts:
+            system_messages(instructions, catalog)
+        return prompt_fingerprint(tracked)
+    return asyncio.run(run())
+
+
+def test_instructions_come_first_as_their_own_message():
+    assert system_messages("Rate it.", "| A |") == [{"role": "system", "content": "Rate it."},
+                                                     {"role": "system", "content": "| A |"}]
+
+
+def test_fingerprint_covers_the_catalog_message():
+    base = _fingerprint(("Rate it.", "| R-001 |"))
+    assert _fingerprint(("Rate it.", "| R-001 |")) == base
+    assert _fingerprint(("Rate it.", "| R-002 |")) != base
+    assert _fingerprint(("Rate it strictly.", "| R-001 |")) != base
+
+
+def test_fingerprint_combines_every_prefix_sent():
+    one = _fingerprint(("Risks.", "| R |"))
+    both = _fingerprint(("Risks.", "| R |"), ("Controls.", "| C |"))
+    assert both != one
+    assert _fingerprint(("Controls.", "| C |"), ("Risks.", "| R |")) == both
+    assert _fingerprint() is None
+
+
+def test_catalog_markdown_is_rendered_once_per_selection():
+    entry = load_catalog(PREDEFINED_RISKS_XLSX, 0, normalized=False)
+    rows = entry.frame.iloc[[0, 2]]
+    first = frame_markdown(rows, entry)
+    assert frame_markdown(entry.frame.iloc[[0, 2]], entry) is first
+    assert frame_markdown(entry.frame.iloc[[0, 3]], entry) != first
+    assert first == rows.to_markdown(index=False)
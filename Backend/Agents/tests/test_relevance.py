@@ -0,0 +1,44 @@
+# tests/test_relevance.py
+from agents.relevance import RiskControlLinks
+
+RISKS = {
+    "R1": "biased training data discriminates applicants",
+    "R2": "prompt injection through untrusted input",
+    "R3": "model drift degrades accuracy",
+}
+CONTROLS = {
+    "C1": "audit training data for bias against applicants",
+    "C2": "filter untrusted input against prompt injection",
+    "C3": "monitor model accuracy for drift",
+    "C4": "physical access badges for the office",
+    "C5": "review training data sources and bias",
+}
+
+
+def _links(k=2):
+    return RiskControlLinks(list(RISKS), list(RISKS.values()), list(CONTROLS), list(CONTROLS.values()), k)
+
+
+def test_controls_link_to_the_most_similar_given_risk():
+    related = _links().related_risks(["R1", "R2", "R3"])
+    assert related == {0: ["R1"], 1: ["R2"], 2: ["R3"], 4: ["R1"]}
+
+
+def test_unlinked_controls_and_unknown_ids_are_left_out():
+    links = _links()
+    assert 3 not in links.related_risks(["R1", "R2", "R3"])  # C4 shares no term with any risk
+    assert links.related_risks(["R2", "R-unknown", ""]) == {1: ["R2"]}
+    assert links.related_risks(["R-unknown"]) == {}
+
+
+def test_only_each_risks_top_k_controls_are_considered():
+    links = _links(k=1)
+    # C1 and C5 both share terms with R1; with k=1 only R1's best control is linked.
+    assert links.related_risks(["R1"]) == {int(links.risk_top[0][0]): ["R1"]}
+    assert len(_links(k=2).related_risks(["R1"])) == 2
+
+
+def test_per_control_limit_and_order():
+    related = _links(k=5).related_risks(["R3", "R1"], per_control=2)
+    assert related[0][0] == "R1"
+    assert all(len(rids) <= 2 for rids in related.values())
@@ -0,0 +1,46 @@
+# tests/test_score_cache.py
+import pytest
+
+from agents import score_cache
+from agents.score_cache import cached_scores, policy_hash, score_key, store_scores
+
+
+@pytest.fixture(autouse=True)
+def _cache(cache, monkeypatch):
+    monkeypatch.setattr(score_cache, "score_store", cache)
+
+
+def _key(**changes):
+    args = dict(question="Is there an AI policy?", answer="Yes.", policy_digest=policy_hash("policy"),
+                model="gemini", instructions="rate it", answer_mode="whole")
+    args.update(changes)
+    return score_key(**args)
+
+
+def test_key_ignores_whitespace_only():
+    assert _key(question="  Is there an\n AI policy? ", answer=" Yes. ") == _key()
+    assert _key(policy_digest=policy_hash("  policy\n")) == _key()
+
+
+@pytest.mark.parametrize("answer", ["YES.", "yes."])
+def test_key_keeps_case(answer):
+    assert _key(answer=answer) != _key()
+
+
+@pytest.mark.parametrize("change", [
+    {"question": "Is there a risk register?"},
+    {"answer": "No."},
+    {"policy_digest": policy_hash("another policy")},
+    {"model": "gemini-pro"},
+    {"instructions": "rate it in batches"},
+    {"answer_mode": "best_sentence"},
+])
+def test_key_changes_with_every_scoring_input(change):
+    assert _key(**change) != _key()
+
+
+def test_stored_scores_are_found_by_key():
+    keys = {"q1": _key(), "q2": _key(answer="No.")}
+    store_scores({"q1": (3, "documented")}, keys)
+    assert cached_scores(keys) == {"q1": (3, "documented")}
+    assert cached_scores({"q1": _key(answer_mode="best_sentence")}) == {}
@@ -0,0 +1,87 @@
+# tests/test_singleflight.py
+import asyncio
+
+import pytest
+from pydantic import BaseModel
+
+from agents.singleflight import SINGLE_FLIGHT_STATS, payload_key, single_flight
+
+
+class Payload(BaseModel):
+    session_id: str
+    tags: dict = {}
+
+
+def _counted():
+    calls = []
+
+    @single_flight()
+    async def run(payload: Payload):
+        calls.append(payload.session_id)
+        await asyncio.sleep(0.01)
+        return {"session": payload.session_id, "call": len(calls)}
+
+    return run, calls
+
+
+def test_payload_key_is_by_value_and_key_order_independent():
+    assert payload_key(Payload(session_id="s", tags={"a": 1, "b": 2})) == \
+        payload_key(Payload(session_id="s", tags={"b": 2, "a": 1}))
+    assert payload_key(Payload(session_id="s")) != payload_key(Payload(session_id="t"))
+
+
+def test_concurrent_identical_calls_share_one_computation():
+    run, calls = _counted()
+
+    async def main():
+        return await asyncio.gather(*(run(Payload(session_id="s")) for _ in range(5)), run(Payload(session_id="t")))
+
+    results = asyncio.run(main())
+    assert sorted(calls) == ["s", "t"]
+    assert all(r == results[0] for r in results[:5])
+    stats = SINGLE_FLIGHT_STATS[f"{run.__module__}.{run.__qualname__}"]
+    assert stats["coalesced"] >= 4
+
+
+def test_key_is_released_after_the_call():
+    run, calls = _counted()
+
+    async def main():
+        await run(Payload(session_id="s"))
+        await run(Payload(session_id="s"))
+
+    asyncio.run(main())
+    assert calls == ["s", "s"]
+
+
+def test_errors_reach_every_waiter_and_release_the_key():
+    attempts = []
+
+    @single_flight()
+    async def fail(payload: Payload):
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("boom")
+
+    async def main():
+        return await asyncio.gather(*(fail(Payload(session_id="s")) for _ in range(3)), return_exceptions=True)
+
+    assert [type(r) for r in asyncio.run(main())] == [ValueError] * 3
+    assert len(attempts) == 1
+    with pytest.raises(ValueError):
+        asyncio.run(fail(Payload(session_id="s")))
+    assert len(attempts) == 2
+
+
+def test_cancelled_caller_does_not_cancel_the_others():
+    run, calls = _counted()
+
+    async def main():
+        first = asyncio.ensure_future(run(Payload(session_id="s")))
+        second = asyncio.ensure_future(run(Payload(session_id="s")))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == {"session": "s", "call": 1}
+    assert calls == ["s"]
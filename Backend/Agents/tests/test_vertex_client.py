@@ -0,0 +1,55 @@
+# tests/test_vertex_client.py
+import sys
+import types
+
+import pytest
+
+from agents import vertex_client
+from agents.vertex_client import generative_model
+
+
+@pytest.fixture
+def sdk(monkeypatch):
+    """A fake Vertex SDK recording inits and model constructions."""
+    calls = {"init": [], "models": [], "credentials": 0}
+
+    def from_service_account_file(path):
+        calls["credentials"] += 1
+        return "credentials"
+
+    class GenerativeModel:
+        def __init__(self, name, system_instruction):
+            calls["models"].append((name, system_instruction))
+
+    vertexai = types.ModuleType("vertexai")
+    vertexai.init = lambda **kwargs: calls["init"].append((kwargs["project"], kwargs["location"]))
+    generative_models = types.ModuleType("vertexai.generative_models")
+    generative_models.GenerativeModel = GenerativeModel
+    generative_models.Part = types.SimpleNamespace(from_text=lambda text: text)
+    service_account = types.ModuleType("google.oauth2.service_account")
+    service_account.Credentials = types.SimpleNamespace(from_service_account_file=from_service_account_file)
+    oauth2 = types.ModuleType("google.oauth2")
+    oauth2.service_account = service_account
+    for name, module in {"vertexai": vertexai, "vertexai.generative_models": generative_models,
+                         "google.oauth2": oauth2, "google.oauth2.service_account": service_account}.items():
+        monkeypatch.setitem(sys.modules, name, module)
+    monkeypatch.setattr(vertex_client, "_models", {})
+    monkeypatch.setattr(vertex_client, "_initialized", None)
+    monkeypatch.setattr(vertex_client, "_credentials", None)
+    return calls
+
+
+def test_models_are_cached_per_instruction(sdk):
+    single = generative_model("gemini", "Rate the answer.", "p", "l")
+    assert generative_model("gemini", "Rate the answer.", "p", "l") is single
+    batch = generative_model("gemini", "Rate several answers.", "p", "l")
+    assert batch is not single
+    assert sdk["models"] == [("gemini", "Rate the answer."), ("gemini", "Rate several answers.")]
+
+
+def test_init_and_credentials_run_once_per_project(sdk):
+    generative_model("gemini", "a", "p", "l")
+    generative_model("gemini-pro", "a", "p", "l")
+    generative_model("gemini", "a", "other", "l")
+    assert sdk["init"] == [("p", "l"), ("other", "l")]
+    assert sdk["credentials"] == 1